@@ -1,17 +1,18 @@
 #!/usr/local/bin/python
-# Project: ALICE mobile computing application server
+# Project: Turbolift: An application server for voice powered computing
 # Component: Stub module
 # Description:
 # The stub_module provides a starting point for writing and experimenting with new
-# ALICE module development.  It connects to port 8559 (diagnostic_port), and
-# you can easily add your own events within the event_loop() function.
+# Turbolift module development.  It connects to port 8559 (diagnostic_port), or to
+# diagnostic_port.sock if the EDS listens on Unix domain sockets, and you can
+# easily add your own events within the event_loop() function.
 # This code is intended to act as a starting point only.  It is _not_
 # required for the operation of the ALICE application, and is for
 # entertainment & experimentation purposes only!
 
-# Current Version: 1.00b
-# Author: (C) Copyright 2001-2002 Rupert Scammell <rupe@arrow.yak.net>
-# Date: 2002-02-5
+# Current Version: 2.0
+# Author: (C) Copyright 2001-2005 Rupert Scammell <rupe@sbcglobal.net>
+# Date: 2005-03-18
 # License: GNU General Public License
 
 """
@@ -30,10 +31,65 @@ along with this program; if not, write to the Free Software
 Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
 
-import sys, os, socket, string, time
+import sys, os, socket, string, time, ConfigParser
 
 # --- Define some useful functions ---
 
+# Set configurations via ConfigParser for the module.
+# Options list is a list of options to return.  Each item in the list is a tuple in the form:
+# (section, option, coerce_flag), where section represents the config file section, option is
+# the option in the section to return, and coerce_flag is one of i,f,b,s where:
+# i = integer
+# b = boolean
+# f = float
+# s = string
+# An optional fourth item in the tuple gives a default value, used when the option
+# isn't present in the config file.  Options without a default must be present.
+# The function returns a hash table that has as its top level keys section names, which have nested
+# hash tables as their values.  These nested hash tables have section option names as keys, and the
+# respective section option values as values.
+def set_configs(config_file, options):
+
+    # Intialize a hash table that'll contain extracted options.
+    config_core = {}
+    
+    # Initialize ConfigParser object that will be used to get
+    # basic config. data for this module.
+    module_config = ConfigParser.ConfigParser()
+
+    # Read config for this module.
+    module_config.read(config_file)
+
+    for i in range(len(options)):
+        c_section = options[i][0]
+        c_option = options[i][1]
+        c_coerce = options[i][2]
+        # Check if the section name already exists.  If not, create it
+        # at the top level of the hash table.
+        if (config_core.has_key(c_section) == 0):
+            config_core[c_section] = {}
+        if (config_core.has_key(c_section) == 1):
+            # Check if the option name already exists.  If it does,
+            # print a warning message, but change the value anyway.
+            if (config_core[c_section].has_key(c_option) == 1):
+                log_message = "set_configs: Warning.  Duplicate " + c_section + ":" + c_option + " found.  Using new value."
+                debug(log_message)
+            # Fall back on the default value if one was given, and the option is missing.
+            if (len(options[i]) > 3 and module_config.has_option(c_section, c_option) == 0):
+                config_core[c_section][c_option] = options[i][3]
+                continue
+            # Extract data from config into hash table, doing appropriate coercions based on c_coerce flag.
+            if (c_coerce == 'i'):
+                config_core[c_section][c_option] = module_config.getint(c_section, c_option)
+            if (c_coerce == 's'):
+                config_core[c_section][c_option] = module_config.get(c_section, c_option)
+            if (c_coerce == 'b'):
+                config_core[c_section][c_option] = module_config.getboolean(c_section, c_option)
+            if (c_coerce == 'f'):
+                config_core[c_section][c_option] = module_config.getfloat(c_section, c_option)
+    # Return a hash table containing the information.
+    return config_core
+
 # debug output function.  Print msg to console, and to a log file.
 # This is a simplified version of the debug() used within other ALICE modules.
 def debug(msg):
@@ -43,10 +99,23 @@ def debug(msg):
     log_fd.flush()
 
 # Initialize a network connection, and return a socket object when connected.
+# If the EDS also listens on Unix domain sockets (unix_socket_dir in the [eds]
+# section of the config file), and the diagnostic_port socket is there, that's
+# used instead of eds_host and eds_port.
 def network_init():
     connect_success = 0
     debug('network_init: Attempting to establish connection.')
+    unix_path = os.path.join(config_data['eds']['unix_socket_dir'], 'diagnostic_port.sock')
     while (connect_success == 0):
+        if (config_data['eds']['unix_socket_dir'] != '' and os.path.exists(unix_path)):
+            try:
+                s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                s.connect(unix_path)
+                debug('network_init: Connection established via ' + unix_path)
+                return s
+            except socket.error:
+                s.close()
+                debug('network_init: Unix domain connect unsuccessful.  Trying TCP.')
         try:
             s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -165,6 +234,12 @@ log_fd = open('Logs/stub_module.log','a')
 eds_host = '127.0.0.1'
 eds_port = 8559
 
+# Options read from the config file (for network_init() ).  The stub only needs
+# to know where the EDS's Unix domain sockets are, if it has any.
+config_fn = 'Config/alice.config'
+config_options = [('eds', 'unix_socket_dir', 's', '')]
+config_data = set_configs(config_fn, config_options)
+
 # Make a socket object.
 s = network_init()
 
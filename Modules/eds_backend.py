@@ -0,0 +1,218 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: Event backends for the event distribution server
+# Description:
+# This utility file wraps the operating system's socket readiness calls
+# (epoll, poll and select) behind one small interface, so the EDS main loop
+# doesn't need to know which one it's running on.  Every backend keeps its
+# registrations between calls, and reports events as a list of (fd, eventmask)
+# tuples, in the same form select.poll() does.  The epoll backend only costs
+# as much as the number of ready file descriptors; poll and select are kept as
+# fallbacks for operating systems that don't have it.
+# This file must be included in your Python module directory.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+"""
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+
+import errno, select, time
+
+# Event mask bits.  These are the select.POLL* values where the operating
+# system has them, and the usual Linux values where it doesn't (Windows has
+# no select.poll(), and no POLL* constants either).
+READ = getattr(select, 'POLLIN', 1)
+WRITE = getattr(select, 'POLLOUT', 4)
+ERROR = getattr(select, 'POLLERR', 8)
+HANGUP = getattr(select, 'POLLHUP', 16)
+INVALID = getattr(select, 'POLLNVAL', 32)
+
+# Return 1 if the exception raised by a poll call was an interrupted system
+# call (a signal arrived while waiting), 0 otherwise.  Both select.error and
+# IOError keep the errno in the first argument.
+def _interrupted(exc):
+    try:
+        return exc.args[0] == errno.EINTR
+    except (AttributeError, IndexError):
+        return 0
+
+# Linux epoll backend.  Registrations live in the kernel, so each poll() only
+# returns, and only costs, the file descriptors that are actually ready.
+class EpollBackend:
+    name = 'epoll'
+
+    # Map our event bits onto epoll's and back.  They're equal on Linux, but
+    # there's no promise of that.
+    _to_epoll = [(READ, getattr(select, 'EPOLLIN', 1)),
+                 (WRITE, getattr(select, 'EPOLLOUT', 4)),
+                 (ERROR, getattr(select, 'EPOLLERR', 8)),
+                 (HANGUP, getattr(select, 'EPOLLHUP', 16))]
+
+    def __init__(self):
+        self.epoll = select.epoll()
+
+    def _mask_in(self, mask):
+        emask = 0
+        for ours, theirs in self._to_epoll:
+            if (mask & ours):
+                emask = emask | theirs
+        return emask
+
+    def _mask_out(self, emask):
+        mask = 0
+        for ours, theirs in self._to_epoll:
+            if (emask & theirs):
+                mask = mask | ours
+        return mask
+
+    def register(self, fd, mask):
+        self.epoll.register(fd, self._mask_in(mask))
+
+    def modify(self, fd, mask):
+        self.epoll.modify(fd, self._mask_in(mask))
+
+    def unregister(self, fd):
+        try:
+            self.epoll.unregister(fd)
+        except (IOError, OSError, KeyError):
+            # Already closed fds drop out of the epoll set on their own.
+            pass
+
+    # timeout is in seconds (a float), or None to wait indefinitely.
+    def poll(self, timeout=None):
+        if (timeout == None):
+            timeout = -1
+        try:
+            events = self.epoll.poll(timeout)
+        except IOError, exc:
+            if (_interrupted(exc)):
+                return []
+            raise
+        return [(fd, self._mask_out(emask)) for fd, emask in events]
+
+    def close(self):
+        self.epoll.close()
+
+# select.poll() backend.  Registrations are kept by the poll object, but the
+# kernel still walks every registered fd on each call.
+class PollBackend:
+    name = 'poll'
+
+    def __init__(self):
+        self.poll_obj = select.poll()
+
+    def register(self, fd, mask):
+        self.poll_obj.register(fd, mask)
+
+    def modify(self, fd, mask):
+        # poll objects treat registering a known fd again as a modification.
+        self.poll_obj.register(fd, mask)
+
+    def unregister(self, fd):
+        try:
+            self.poll_obj.unregister(fd)
+        except KeyError:
+            pass
+
+    def poll(self, timeout=None):
+        if (timeout != None):
+            timeout = int(timeout * 1000)
+        try:
+            return self.poll_obj.poll(timeout)
+        except select.error, exc:
+            if (_interrupted(exc)):
+                return []
+            raise
+
+    def close(self):
+        pass
+
+# select.select() backend, for operating systems without poll (Windows).
+# Registrations are kept in hash tables, so adding and removing fds doesn't
+# depend on how many are registered.  Readable, writable and exceptional fds
+# are all reported; an exceptional condition shows up as ERROR.
+class SelectBackend:
+    name = 'select'
+
+    def __init__(self):
+        self.masks = {}
+        self.readers = {}
+        self.writers = {}
+
+    def register(self, fd, mask):
+        self.masks[fd] = mask
+        if (mask & READ):
+            self.readers[fd] = 1
+        elif (self.readers.has_key(fd)):
+            del self.readers[fd]
+        if (mask & WRITE):
+            self.writers[fd] = 1
+        elif (self.writers.has_key(fd)):
+            del self.writers[fd]
+
+    def modify(self, fd, mask):
+        self.register(fd, mask)
+
+    def unregister(self, fd):
+        for table in (self.masks, self.readers, self.writers):
+            if (table.has_key(fd)):
+                del table[fd]
+
+    def poll(self, timeout=None):
+        if (len(self.masks) == 0):
+            # select() on three empty lists is an error on Windows.
+            if (timeout != None):
+                time.sleep(timeout)
+            return []
+        try:
+            r, w, x = select.select(self.readers.keys(), self.writers.keys(), self.masks.keys(), timeout)
+        except select.error, exc:
+            if (_interrupted(exc)):
+                return []
+            raise
+
+        # Merge the three lists into one mask per fd.
+        ready = {}
+        for fds, bit in ((r, READ), (w, WRITE), (x, ERROR)):
+            for fd in fds:
+                ready[fd] = ready.get(fd, 0) | bit
+        return ready.items()
+
+    def close(self):
+        pass
+
+# Backends by name, in order of preference for 'auto'.
+_backends = [('epoll', 'epoll', EpollBackend),
+             ('poll', 'poll', PollBackend),
+             ('select', 'select', SelectBackend)]
+
+# open_backend()
+# Input: name, one of 'auto', 'epoll', 'poll' or 'select'.  'auto' picks the
+# best backend the operating system supports.
+# Output: a backend object, with register(), modify(), unregister(), poll()
+# and close() methods.  Raises ValueError for an unknown or unsupported name.
+def open_backend(name='auto'):
+    for b_name, select_attr, b_class in _backends:
+        if (name != 'auto' and name != b_name):
+            continue
+        if (hasattr(select, select_attr)):
+            return b_class()
+        if (name != 'auto'):
+            raise ValueError('event backend ' + name + ' not supported on this operating system')
+    raise ValueError('unknown event backend ' + name)
@@ -0,0 +1,103 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: EDS traffic capture files
+# Description:
+# This utility file writes and reads the capture files the EDS records its
+# traffic to (see capture_file in the [eds] section of Config/alice.config),
+# and that eds_replay.py plays back.  A capture file starts with a magic
+# line, followed by one record per message the EDS received, in the order it
+# received them.  Each record is a fixed size header, followed by the
+# sending service's name, the destination, and the data:
+#
+#   header     17 bytes: time received (a double), flags (1 byte, none are
+#              defined yet), source name length and destination length (2
+#              bytes each), and data length (4 bytes), in network order
+#   source     service the message came from (empty if it came from a
+#              connection on the registration port that hadn't registered)
+#   dest       service or topic the message was for
+#   data       the data, without its newline
+#
+# Records are only ever appended, so a capture can be copied while the EDS
+# is still writing it.  A record cut short at the end of the file (the EDS
+# was killed in the middle of writing it) is ignored by the reader.
+# This file must be included in your Python module directory.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+"""
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+
+import os, struct
+
+MAGIC = 'EDSCAP1\n'
+
+# The record header.
+header = struct.Struct('!dBHHI')
+
+# Appends records to a capture file.
+class CaptureWriter:
+    # Opens path for appending, and writes the magic line if the file is new.
+    # Raises IOError if it can't be opened.
+    def __init__(self, path):
+        self.fd = open(path, 'ab')
+        self.fd.seek(0, os.SEEK_END)
+        if (self.fd.tell() == 0):
+            self.fd.write(MAGIC)
+        self.dirty = 0
+
+    # Add a record.  data can be a string or a buffer.  Records are buffered
+    # until flush() is called.
+    def write(self, t, flags, source, dest, data):
+        self.fd.write(header.pack(t, flags, len(source), len(dest), len(data)))
+        self.fd.write(source)
+        self.fd.write(dest)
+        self.fd.write(data)
+        self.dirty = 1
+
+    # Write out any buffered records.
+    def flush(self):
+        if (self.dirty == 1):
+            self.fd.flush()
+            self.dirty = 0
+
+    def close(self):
+        self.fd.close()
+
+# read_capture()
+# Input: path, a capture file.
+# Output: a generator of (time, flags, source, dest, data) tuples, one per
+# record, in the order they were written.  Raises ValueError if the file isn't
+# a capture file, and IOError if it can't be read.
+def read_capture(path):
+    fd = open(path, 'rb')
+    try:
+        if (fd.read(len(MAGIC)) != MAGIC):
+            raise ValueError(path + ' is not an EDS capture file')
+        while 1:
+            head = fd.read(header.size)
+            if (len(head) < header.size):
+                return
+            t, flags, source_len, dest_len, data_len = header.unpack(head)
+            body = fd.read(source_len + dest_len + data_len)
+            if (len(body) < source_len + dest_len + data_len):
+                return
+            yield (t, flags, body[:source_len], body[source_len:source_len + dest_len],
+                   body[source_len + dest_len:])
+    finally:
+        fd.close()
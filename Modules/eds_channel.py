@@ -0,0 +1,292 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: Direct channels between EDS clients
+# Description:
+# This utility file does a module's side of the EDS's direct channels (see
+# open_channel() in select_ports.py), which let two modules on the same
+# machine send each other messages over a socket of their own, instead of
+# through the EDS.  The module reads everything through recv(), which hands
+# back whole lines, from the EDS and from its channels, in the order they
+# were sent, and sends messages for a service through send(), which uses the
+# channel to the service if there is one.  When send() says it couldn't, the
+# message goes to the EDS as usual.  The EDS's notices about channels are
+# dealt with here, and never reach the module.  Only text connections to the
+# EDS over Unix domain sockets can have channels; usable() says whether a
+# connection can.  Any thread can call send() and request(), while another
+# waits in recv().
+# This file must be included in your Python module directory.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+"""
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+
+import errno, os, select, socket, string, threading, time
+import eds_fdpass
+
+# usable()
+# Input: sock, a connected EDS socket.
+# Output: 1 if the connection can have direct channels, 0 if not.
+def usable(sock):
+    if (eds_fdpass.available() == 0 or sock.family != socket.AF_UNIX):
+        return 0
+    return 1
+
+# Close a channel socket.  It's shut down first, so the other end sees it close,
+# and so does a thread of this module that's waiting to read it.
+def _shut(sock):
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except socket.error:
+        pass
+    sock.close()
+
+# Direct channels over a connected EDS socket, which must be blocking.
+class EdsChannels:
+    def __init__(self, sock, recv_size=4096):
+        self.sock = sock
+        # Held while the channels and requests below are looked at or changed,
+        # and while anything for a service is sent through the EDS.
+        self.lock = threading.Lock()
+        self.recv_size = recv_size
+        self.rbuf = ''
+        # Channel ends received, by the number of the line they came with.
+        self.line_no = 0
+        self.fds = {}
+        # The channels, by the service at the other end.  Each is a hash table
+        # of its socket, its number from the EDS, its receive buffer, whether the
+        # other end's mark has arrived (so it can be read), and whether it can
+        # still be written to.
+        self.channels = {}
+        # Reasons the EDS gave for refusing channels, and when channels were
+        # last asked for, by service.
+        self.refused = {}
+        self.asked = {}
+
+    # Let other modules open channels to this one.
+    def accept(self):
+        self.sock.sendall('eds: channel_accept\n')
+
+    # Ask the EDS for a channel to service, unless there's one already, or one
+    # was asked for less than interval seconds ago.  Until it's open, send()
+    # sends through the EDS.  If the request can't be sent, the next send()
+    # finds out.
+    def request(self, service, interval=0):
+        self.lock.acquire()
+        try:
+            now = time.time()
+            if (self.channels.has_key(service) or now - self.asked.get(service, 0) < interval):
+                return
+            self.asked[service] = now
+            try:
+                self.sock.sendall('eds: channel ' + service + '\n')
+            except socket.error:
+                pass
+        finally:
+            self.lock.release()
+
+    # Send data (a line, newline included) to service, over its channel if there
+    # is one, and through the EDS if not, or if the channel has closed.  Sending
+    # through the EDS holds the lock, so the message can't end up behind the
+    # mark of a channel that's opening meanwhile.
+    # Returns 1 if the data was sent, and 0 if the connection to the EDS failed.
+    def send(self, service, data):
+        self.lock.acquire()
+        try:
+            channel = self.channels.get(service)
+            if (channel == None or channel['open'] == 0):
+                try:
+                    self.sock.sendall(service + ': ' + data)
+                except socket.error:
+                    return 0
+                return 1
+            sock = channel['sock']
+        finally:
+            self.lock.release()
+        try:
+            sock.sendall(data)
+        except socket.error:
+            self._close(service, sock)
+            return self.send(service, data)
+        return 1
+
+    # Wait for data from the EDS or a channel, and return it as a string of whole
+    # lines, newlines included.  Returns an empty string if the connection to the
+    # EDS has closed, and raises socket.error if it failed, as recv() does.
+    def recv(self):
+        while 1:
+            socks = [self.sock]
+            self.lock.acquire()
+            for channel in self.channels.values():
+                if (channel['marked'] == 1):
+                    socks.append(channel['sock'])
+            self.lock.release()
+            if (len(socks) > 1):
+                try:
+                    socks = select.select(socks, [], [])[0]
+                except (select.error, socket.error), exc:
+                    # Another thread closed one of the channels meanwhile.
+                    if (exc[0] != errno.EBADF):
+                        raise
+                    continue
+            lines = []
+            for sock in socks:
+                if (sock is self.sock):
+                    if (self._read_eds(lines) == 0):
+                        return ''
+                else:
+                    self._read_channel(sock, lines)
+            if (len(lines) > 0):
+                return string.join(lines, '')
+
+    # Close all the channels, when the connection to the EDS has gone.
+    def close(self):
+        self.lock.acquire()
+        try:
+            for channel in self.channels.values():
+                _shut(channel['sock'])
+            self.channels = {}
+            for fd in self.fds.values():
+                os.close(fd)
+            self.fds = {}
+        finally:
+            self.lock.release()
+
+    # Read from the EDS, and add the lines that aren't channel notices to lines.
+    # Returns 0 if the connection has closed, and 1 if not.
+    def _read_eds(self, lines):
+        data, fds = eds_fdpass.recv_fds(self.sock, self.recv_size)
+        if (data == ''):
+            for fd in fds:
+                os.close(fd)
+            return 0
+        self.rbuf = self.rbuf + data
+        # A channel end comes with the first part of its notice, and a read stops
+        # after it, so it belongs to the line the read ended in.
+        if (len(fds) > 0):
+            line_no = self.line_no + string.count(self.rbuf, '\n', 0, len(self.rbuf) - 1)
+            self.fds[line_no] = fds[0]
+            for fd in fds[1:]:
+                os.close(fd)
+        found = string.split(self.rbuf, '\n')
+        self.rbuf = found[-1]
+        self.lock.acquire()
+        try:
+            for line in found[:-1]:
+                fd = self.fds.get(self.line_no)
+                if (fd != None):
+                    del self.fds[self.line_no]
+                self.line_no = self.line_no + 1
+                if (line[:8] == 'channel ' and self._notice(string.split(line), fd) == 1):
+                    continue
+                if (fd != None):
+                    os.close(fd)
+                lines.append(line + '\n')
+        finally:
+            self.lock.release()
+        return 1
+
+    # Act on a channel notice from the EDS.  Called with the lock held.  Notices
+    # about a channel that has since been replaced are ignored.
+    # Returns 1 if the line was a notice, and 0 if not.
+    def _notice(self, words, fd):
+        if (len(words) != 4):
+            return 0
+        service = words[2]
+        channel = self.channels.get(service)
+        if (channel != None and channel['id'] != words[3]):
+            channel = None
+        if (words[1] == 'open'):
+            if (fd == None):
+                # The end didn't survive a restart of the EDS.
+                self.sock.sendall('eds: channel_close ' + service + ' ' + words[3] + '\n')
+                return 1
+            if (self.channels.has_key(service)):
+                # A channel to a connection of the service that's gone.
+                _shut(self.channels[service]['sock'])
+            sock = socket.fromfd(fd, socket.AF_UNIX, socket.SOCK_STREAM)
+            os.close(fd)
+            sock.setblocking(1)
+            self.channels[service] = {'sock': sock, 'id': words[3], 'rbuf': '', 'marked': 0, 'open': 1}
+            if (self.refused.has_key(service)):
+                del self.refused[service]
+            # Everything sent to the service through the EDS is ahead of the mark.
+            self.sock.sendall('eds: channel_mark ' + service + ' ' + words[3] + '\n')
+            return 1
+        if (words[1] == 'mark'):
+            if (channel != None):
+                channel['marked'] = 1
+            return 1
+        if (words[1] == 'closed'):
+            # A channel that's been marked is read until it's empty.  The other
+            # end never wrote to one that hasn't.
+            if (channel != None):
+                channel['open'] = 0
+                if (channel['marked'] == 0):
+                    _shut(channel['sock'])
+                    del self.channels[service]
+            return 1
+        if (words[1] == 'refused'):
+            self.refused[service] = words[3]
+            return 1
+        return 0
+
+    # Read from a channel, and add the lines in it to lines.  The channel is closed
+    # once the other end has closed it.
+    def _read_channel(self, sock, lines):
+        self.lock.acquire()
+        try:
+            for service in self.channels.keys():
+                channel = self.channels[service]
+                if (channel['sock'] is sock):
+                    break
+            else:
+                return
+        finally:
+            self.lock.release()
+        try:
+            data = sock.recv(self.recv_size)
+        except socket.error:
+            data = ''
+        if (data == ''):
+            self._close(service, sock)
+            return
+        found = string.split(channel['rbuf'] + data, '\n')
+        channel['rbuf'] = found[-1]
+        for line in found[:-1]:
+            lines.append(line + '\n')
+
+    # Close the channel to a service that failed on sock, and tell the EDS, so
+    # messages for it go through the EDS again.  Nothing happens if the channel
+    # has already been closed, or replaced by a new one.
+    def _close(self, service, sock):
+        self.lock.acquire()
+        try:
+            channel = self.channels.get(service)
+            if (channel == None or channel['sock'] is not sock):
+                return
+            del self.channels[service]
+            _shut(sock)
+            if (channel['open'] == 1):
+                try:
+                    self.sock.sendall('eds: channel_close ' + service + ' ' + channel['id'] + '\n')
+                except socket.error:
+                    pass
+        finally:
+            self.lock.release()
@@ -0,0 +1,154 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: File descriptor passing for the EDS
+# Description:
+# This utility file sends open file descriptors (sockets, mostly) from one
+# process to another over a Unix domain socket, as SCM_RIGHTS ancillary data
+# alongside a few bytes of ordinary data.  The receiving process gets its own
+# descriptor for the same open socket, so a connection accepted by one
+# process can be served by another, without the module at the other end
+# noticing.  Python 2 has no sendmsg() or recvmsg(), so they're called from
+# the C library through ctypes.  The ancillary data layout used is Linux's;
+# available() says whether passing works on this system.
+# This file must be included in your Python module directory.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+"""
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+
+import os, socket, sys
+
+try:
+    import ctypes
+except ImportError:
+    ctypes = None
+
+# Type of ancillary data that carries file descriptors.
+SCM_RIGHTS = 1
+
+# Largest number of file descriptors recv_fds() takes in one message.
+MAX_FDS = 16
+
+_libc = None
+if (ctypes != None and sys.platform[:5] == 'linux'):
+    try:
+        _libc = ctypes.CDLL(None, use_errno=True)
+        _libc.sendmsg.restype = ctypes.c_ssize_t
+        _libc.recvmsg.restype = ctypes.c_ssize_t
+    except (OSError, AttributeError):
+        _libc = None
+
+if (_libc != None):
+    class _iovec(ctypes.Structure):
+        _fields_ = [('iov_base', ctypes.c_void_p),
+                    ('iov_len', ctypes.c_size_t)]
+
+    class _msghdr(ctypes.Structure):
+        _fields_ = [('msg_name', ctypes.c_void_p),
+                    ('msg_namelen', ctypes.c_uint),
+                    ('msg_iov', ctypes.POINTER(_iovec)),
+                    ('msg_iovlen', ctypes.c_size_t),
+                    ('msg_control', ctypes.c_void_p),
+                    ('msg_controllen', ctypes.c_size_t),
+                    ('msg_flags', ctypes.c_int)]
+
+    class _cmsghdr(ctypes.Structure):
+        _fields_ = [('cmsg_len', ctypes.c_size_t),
+                    ('cmsg_level', ctypes.c_int),
+                    ('cmsg_type', ctypes.c_int)]
+
+    _align = ctypes.sizeof(ctypes.c_size_t)
+    _fd_size = ctypes.sizeof(ctypes.c_int)
+
+# Round a length up to the alignment of ancillary data (CMSG_ALIGN in C).
+def _cmsg_align(length):
+    return (length + _align - 1) & ~(_align - 1)
+
+# Space a control buffer needs for n file descriptors (CMSG_SPACE in C).
+def _cmsg_space(n):
+    return _cmsg_align(ctypes.sizeof(_cmsghdr)) + _cmsg_align(n * _fd_size)
+
+# Raise the socket.error for the last failed C library call.
+def _raise_errno():
+    err = ctypes.get_errno()
+    raise socket.error(err, os.strerror(err))
+
+# available()
+# Input: None.
+# Output: 1 if file descriptors can be passed on this system, 0 if not.
+def available():
+    if (_libc == None):
+        return 0
+    return 1
+
+# send_fds()
+# Send data, with file descriptors attached, on a connected Unix domain socket.
+# Input: sock, the socket.  data, a non-empty string.  fds, a list of file
+# descriptor numbers.  The sender's descriptors stay open; close them once
+# they've been sent, if they're no longer needed.
+# Output: the number of bytes of data sent.  Raises socket.error on failure.
+def send_fds(sock, data, fds):
+    data_buf = ctypes.create_string_buffer(data, len(data))
+    iov = _iovec(ctypes.cast(data_buf, ctypes.c_void_p), len(data))
+    control = ctypes.create_string_buffer(_cmsg_space(len(fds)))
+    header = _cmsghdr.from_buffer(control)
+    header.cmsg_len = _cmsg_align(ctypes.sizeof(_cmsghdr)) + len(fds) * _fd_size
+    header.cmsg_level = socket.SOL_SOCKET
+    header.cmsg_type = SCM_RIGHTS
+    fd_array = (ctypes.c_int * len(fds)).from_buffer(control, _cmsg_align(ctypes.sizeof(_cmsghdr)))
+    for i in range(len(fds)):
+        fd_array[i] = fds[i]
+    msg = _msghdr(None, 0, ctypes.pointer(iov), 1,
+                  ctypes.cast(control, ctypes.c_void_p), len(control), 0)
+    sent = _libc.sendmsg(sock.fileno(), ctypes.byref(msg), 0)
+    if (sent < 0):
+        _raise_errno()
+    return sent
+
+# recv_fds()
+# Receive data, and any file descriptors attached to it, from a Unix domain
+# socket.
+# Input: sock, the socket.  size, the most data to receive.
+# Output: a tuple of (data, list of file descriptor numbers).  The data is an
+# empty string if the other end has closed the socket.  The descriptors are
+# new ones, owned by the caller.  Raises socket.error on failure.
+def recv_fds(sock, size):
+    data_buf = ctypes.create_string_buffer(size)
+    iov = _iovec(ctypes.cast(data_buf, ctypes.c_void_p), size)
+    control = ctypes.create_string_buffer(_cmsg_space(MAX_FDS))
+    msg = _msghdr(None, 0, ctypes.pointer(iov), 1,
+                  ctypes.cast(control, ctypes.c_void_p), len(control), 0)
+    received = _libc.recvmsg(sock.fileno(), ctypes.byref(msg), 0)
+    if (received < 0):
+        _raise_errno()
+
+    fds = []
+    header_size = _cmsg_align(ctypes.sizeof(_cmsghdr))
+    offset = 0
+    while (offset + header_size <= msg.msg_controllen):
+        header = _cmsghdr.from_buffer(control, offset)
+        if (header.cmsg_len < header_size):
+            break
+        if (header.cmsg_level == socket.SOL_SOCKET and header.cmsg_type == SCM_RIGHTS):
+            count = (header.cmsg_len - header_size) / _fd_size
+            fd_array = (ctypes.c_int * count).from_buffer(control, offset + header_size)
+            fds.extend(list(fd_array))
+        offset = offset + _cmsg_align(header.cmsg_len)
+    return (data_buf.raw[:received], fds)
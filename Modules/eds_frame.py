@@ -0,0 +1,134 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: Framed wire protocol for the EDS
+# Description:
+# This utility file packs and unpacks the frames of the EDS's framed wire
+# protocol, which a module can switch its connection to instead of sending
+# newline terminated lines.  Each frame starts with a fixed size header giving
+# the lengths of the fields that follow, so the reader never scans the data,
+# and the payload can hold anything, newlines included.  A frame is:
+#
+#   header     8 bytes: payload length (4 bytes), name length, correlation
+#              ID length, flags and priority (1 byte each), in network order
+#   name       service or topic the frame is for (sent to the EDS), or the
+#              service it came from (received from the EDS)
+#   corr_id    correlation ID, for requests, replies and NACKs
+#   payload    the data
+#
+# A module switches to frames by sending the text line 'eds: framing'.  The
+# EDS answers with the text line 'framing on', and everything after that
+# line, both ways, is frames.  The EDS translates between frames and lines, so
+# framed and text modules can talk to each other.  A frame sent with a
+# priority above 0 jumps the queue of the module it's for, in the same way as
+# a '^' in front of the service name of a line.
+# This file must be included in your Python module directory.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+"""
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+
+import select, socket, string, struct
+
+# The frame header.
+header = struct.Struct('!IBBBB')
+
+# Frame flags.  A frame with none of these set is ordinary data.  The others
+# are the framed equivalents of the '?', '=' and '!' correlation marks of the
+# text protocol (see Docs/HACKING).
+REQUEST = 0x01
+REPLY = 0x02
+NACK = 0x04
+
+# Largest name or correlation ID a frame can carry.
+MAX_FIELD = 255
+
+# Line a text connection sends to switch to frames, and the EDS's answer.
+FRAMING_COMMAND = 'eds: framing\n'
+FRAMING_REPLY = 'framing on\n'
+
+# pack_frame()
+# Input: name, the service or topic name.  payload, the data (a string).
+# flags, priority and corr_id, as described above.
+# Output: the frame, as a string.  Raises ValueError if name or corr_id is too
+# long.
+def pack_frame(name, payload, flags=0, corr_id='', priority=0):
+    if (len(name) > MAX_FIELD or len(corr_id) > MAX_FIELD):
+        raise ValueError('frame name or correlation ID too long')
+    return header.pack(len(payload), len(name), len(corr_id), flags, priority) + name + corr_id + payload
+
+# frame_size()
+# Input: buf, a buffer holding at least a frame header at offset.
+# Output: a tuple of (total size of the frame, payload length, name length,
+# correlation ID length, flags, priority).
+def frame_size(buf, offset=0):
+    length, name_len, id_len, flags, priority = header.unpack_from(buf, offset)
+    return (header.size + name_len + id_len + length, length, name_len, id_len, flags, priority)
+
+# Splits the data read from a framed connection into frames.
+class FrameReader:
+    def __init__(self):
+        self.buf = ''
+
+    # Add data read from the socket.  Returns a list of the complete frames
+    # received, each a tuple of (name, payload, flags, corr_id, priority).
+    def feed(self, data):
+        self.buf = self.buf + data
+        frames = []
+        pos = 0
+        while (len(self.buf) - pos >= header.size):
+            size, length, name_len, id_len, flags, priority = frame_size(self.buf, pos)
+            if (len(self.buf) - pos < size):
+                break
+            start = pos + header.size
+            name = self.buf[start:start + name_len]
+            corr_id = self.buf[start + name_len:start + name_len + id_len]
+            payload = self.buf[start + name_len + id_len:pos + size]
+            frames.append((name, payload, flags, corr_id, priority))
+            pos = pos + size
+        self.buf = self.buf[pos:]
+        return frames
+
+# negotiate()
+# Switch a connected, blocking EDS socket to frames.
+# Input: sock, the socket.  timeout, seconds to wait for the EDS to answer.
+# Output: a tuple of (FrameReader, lines).  The FrameReader already holds any
+# frame data that arrived straight after the answer (feed it '' to get it).
+# lines is a list of the text lines that arrived before the answer.
+# Raises socket.error if the EDS doesn't answer in time, or closes the
+# connection.
+def negotiate(sock, timeout=5.0):
+    sock.sendall(FRAMING_COMMAND)
+    data = ''
+    while (string.find(data, FRAMING_REPLY) != 0 and string.find(data, '\n' + FRAMING_REPLY) < 0):
+        r, w, x = select.select([sock], [], [], timeout)
+        if (len(r) == 0):
+            raise socket.error('no answer to framing request')
+        chunk = sock.recv(4096)
+        if (chunk == ''):
+            raise socket.error('connection to EDS closed')
+        data = data + chunk
+    if (string.find(data, FRAMING_REPLY) == 0):
+        end = 0
+    else:
+        end = string.find(data, '\n' + FRAMING_REPLY) + 1
+    lines = string.split(data[:end], '\n')[:-1]
+    reader = FrameReader()
+    reader.buf = data[end + len(FRAMING_REPLY):]
+    return (reader, lines)
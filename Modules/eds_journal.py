@@ -0,0 +1,207 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: EDS message journal
+# Description:
+# This utility file keeps the write-ahead journal the EDS writes durable
+# messages to (see journal_file in the [eds] section of Config/alice.config),
+# so they survive the EDS stopping or crashing before they've been delivered.
+# A journal starts with a magic line, followed by records, each a fixed size
+# header and a body:
+#
+#   header     22 bytes: a CRC32 of the rest of the record, the record kind
+#              (1 byte), the entry number (8 bytes), the priority (1 byte),
+#              source name length and destination length (2 bytes each), and
+#              data length (4 bytes), in network order
+#   source     service the message came from
+#   dest       service the message is for
+#   data       the data, newline included
+#
+# A MESSAGE record adds an entry, and an ACK record (which has no body) says
+# the entry with its number has been delivered, and is finished with.  Records
+# are appended to a buffer, and written out and synced to disk together by
+# commit(), so many messages share the cost of one fsync() (group commit).
+# When a journal is opened, the entries without an ACK are read back, to be
+# delivered again.  A record cut short, or damaged, at the end of the file (the
+# system went down in the middle of writing it) ends the journal, and is cut
+# off.  compact() rewrites the journal with only the unfinished entries, so it
+# doesn't grow without limit.
+# This file must be included in your Python module directory.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+"""
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+
+import os, struct, zlib
+
+MAGIC = 'EDSJNL1\n'
+
+# Record kinds.
+MESSAGE = 1
+ACK = 2
+
+# The record header, and the part of it the CRC covers.
+header = struct.Struct('!IBQBHHI')
+_fields = struct.Struct('!BQBHHI')
+
+# Make a record.
+def _record(kind, entry, priority, source, dest, data):
+    body = _fields.pack(kind, entry, priority, len(source), len(dest), len(data)) + source + dest + data
+    return struct.pack('!I', zlib.crc32(body) & 0xffffffff) + body
+
+# A journal of durable messages.
+class Journal:
+    # Opens the journal at path, creating it if it's new, and reads back the
+    # entries that were never acknowledged.  Raises IOError if it can't be
+    # opened, and ValueError if the file isn't a journal.
+    def __init__(self, path):
+        self.path = path
+        self.live = {}
+        self.live_bytes = 0
+        self.pending = []
+        self.next_entry = 1
+        if (os.path.exists(path)):
+            self.size = self._recover()
+        else:
+            self.size = 0
+        self.fd = open(path, 'ab')
+        if (self.size == 0):
+            self.fd.write(MAGIC)
+            self.fd.flush()
+            os.fsync(self.fd.fileno())
+            self.size = len(MAGIC)
+
+    # Read the records in the file, keeping the unacknowledged entries in live,
+    # and cut off anything after the last good record.
+    # Output: the length of the good part of the file.
+    def _recover(self):
+        fd = open(self.path, 'rb')
+        try:
+            data = fd.read()
+        finally:
+            fd.close()
+        if (len(data) == 0):
+            return 0
+        if (data[:len(MAGIC)] != MAGIC):
+            raise ValueError(self.path + ' is not an EDS journal')
+        offset = len(MAGIC)
+        while (offset + header.size <= len(data)):
+            crc, kind, entry, priority, source_len, dest_len, data_len = header.unpack_from(data, offset)
+            end = offset + header.size + source_len + dest_len + data_len
+            if (end > len(data) or zlib.crc32(data[offset + 4:end]) & 0xffffffff != crc):
+                break
+            if (kind == MESSAGE):
+                self.live[entry] = data[offset:end]
+                self.live_bytes = self.live_bytes + end - offset
+            elif (kind == ACK and self.live.has_key(entry)):
+                self.live_bytes = self.live_bytes - len(self.live[entry])
+                del self.live[entry]
+            self.next_entry = max(self.next_entry, entry + 1)
+            offset = end
+        if (offset < len(data)):
+            fd = open(self.path, 'r+b')
+            fd.truncate(offset)
+            fd.close()
+        return offset
+
+    # Add a message, to be written out by the next commit().
+    # Output: its entry number.
+    def append(self, source, dest, data, priority=0):
+        entry = self.next_entry
+        self.next_entry = entry + 1
+        record = _record(MESSAGE, entry, priority, source, dest, data)
+        self.live[entry] = record
+        self.live_bytes = self.live_bytes + len(record)
+        self.pending.append(record)
+        return entry
+
+    # Mark an entry finished with.  The ACK is written out by the next commit().
+    def ack(self, entry):
+        if (self.live.has_key(entry)):
+            self.live_bytes = self.live_bytes - len(self.live[entry])
+            del self.live[entry]
+            self.pending.append(_record(ACK, entry, 0, '', '', ''))
+
+    # 1 if there are records waiting for commit(), 0 if not.
+    def dirty(self):
+        return len(self.pending) > 0
+
+    # Write out the waiting records, and wait until they're on disk.
+    def commit(self):
+        if (len(self.pending) == 0):
+            return
+        data = ''.join(self.pending)
+        self.pending = []
+        self.fd.write(data)
+        self.fd.flush()
+        os.fsync(self.fd.fileno())
+        self.size = self.size + len(data)
+
+    # Look up an unacknowledged entry.
+    # Output: a tuple of (source, dest, data, priority).  Raises KeyError if the
+    # entry isn't in the journal, or has been acknowledged.
+    def message(self, entry):
+        record = self.live[entry]
+        crc, kind, entry, priority, source_len, dest_len, data_len = header.unpack_from(record)
+        start = header.size
+        return (record[start:start + source_len],
+                record[start + source_len:start + source_len + dest_len],
+                record[start + source_len + dest_len:], priority)
+
+    # The unacknowledged entries, oldest first.
+    # Output: a list of (entry, source, dest, data, priority) tuples.
+    def entries(self):
+        out = []
+        entries = self.live.keys()
+        entries.sort()
+        for entry in entries:
+            out.append((entry,) + self.message(entry))
+        return out
+
+    # Rewrite the journal with only the unacknowledged entries, once everything
+    # waiting has been committed.  The new journal is written beside the old one,
+    # synced, and renamed over it, so one or the other is always complete.
+    def compact(self):
+        self.commit()
+        entries = self.live.keys()
+        entries.sort()
+        temp_path = self.path + '.new'
+        fd = open(temp_path, 'wb')
+        fd.write(MAGIC)
+        for entry in entries:
+            fd.write(self.live[entry])
+        fd.flush()
+        os.fsync(fd.fileno())
+        fd.close()
+        os.rename(temp_path, self.path)
+        try:
+            dir_fd = os.open(os.path.dirname(os.path.abspath(self.path)), os.O_RDONLY)
+            try:
+                os.fsync(dir_fd)
+            finally:
+                os.close(dir_fd)
+        except OSError:
+            pass
+        self.fd.close()
+        self.fd = open(self.path, 'ab')
+        self.size = len(MAGIC) + self.live_bytes
+
+    def close(self):
+        self.commit()
+        self.fd.close()
@@ -0,0 +1,154 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: Request/response helper for EDS clients
+# Description:
+# This utility file lets a module make a request of another module through
+# the EDS, and wait for the reply, using the EDS's correlation IDs (see
+# correlate() in select_ports.py).  A request that can't be delivered is
+# answered straight away by a NACK from the EDS, so call() fails fast when
+# the other module isn't there, and times out when it is there, but doesn't
+# answer.  Anything else that arrives while call() is waiting is kept, and
+# handed back by next_line(), so a module's own event loop doesn't lose it.
+# This file must be included in your Python module directory.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+"""
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+
+import select, socket, string, time
+
+# Raised by call() when the request failed.
+class RpcError(Exception):
+    pass
+
+# The EDS couldn't deliver the request.  reason is one of unknown_service,
+# not_connected, queue_full or not_registered.
+class RpcNack(RpcError):
+    def __init__(self, corr_id, reason, service):
+        RpcError.__init__(self, 'request ' + corr_id + ' to ' + service + ' failed: ' + reason)
+        self.corr_id = corr_id
+        self.reason = reason
+        self.service = service
+
+# No reply arrived in time.
+class RpcTimeout(RpcError):
+    pass
+
+# parse_request()
+# Input: line, a line of data received from the EDS.
+# Output: a tuple of (correlation ID, service to reply to, request data) if the
+# line is a correlated request, or None if it's an ordinary message.
+def parse_request(line):
+    if (line[:1] != '?'):
+        return None
+    fields = string.split(string.strip(line[1:]), None, 2)
+    if (len(fields) < 2):
+        return None
+    while (len(fields) < 3):
+        fields.append('')
+    return (fields[0], fields[1], fields[2])
+
+# make_reply()
+# Input: reply_to and corr_id, as returned by parse_request().  data, the reply.
+# Output: the line to send to the EDS.
+def make_reply(reply_to, corr_id, data):
+    return reply_to + ': =' + corr_id + ' ' + data + '\n'
+
+# Makes requests over a connected EDS socket.  The socket is used as it is,
+# blocking or not; reads go through select() with the time remaining.
+class EdsRpc:
+    def __init__(self, sock, recv_size=4096):
+        self.sock = sock
+        self.recv_size = recv_size
+        self.next_id = 0
+        self.rbuf = ''
+        self.lines = []
+
+    # Send a request to service, and wait up to timeout seconds for the reply.
+    # Returns the reply data, without its newline.  Raises RpcNack if the EDS
+    # couldn't deliver the request, RpcTimeout if no reply arrived in time, and
+    # socket.error if the connection to the EDS failed.
+    def call(self, service, data, timeout=5.0):
+        self.next_id = self.next_id + 1
+        corr_id = str(self.next_id)
+        self.sock.sendall(service + ': ?' + corr_id + ' ' + data + '\n')
+
+        deadline = time.time() + timeout
+        while 1:
+            # Look for our reply, or a NACK, among the lines received so far.
+            # Replies to earlier calls that timed out don't match the ID.
+            for i in range(len(self.lines)):
+                line = self.lines[i]
+                if (line[:1] != '=' and line[:1] != '!'):
+                    continue
+                fields = string.split(line[1:], None, 1)
+                if (len(fields) == 0 or fields[0] != corr_id):
+                    continue
+                del self.lines[i]
+                if (len(fields) == 1):
+                    fields.append('')
+                if (line[:1] == '='):
+                    return fields[1]
+                nack = string.split(fields[1])
+                while (len(nack) < 2):
+                    nack.append('')
+                raise RpcNack(corr_id, nack[0], nack[1])
+
+            remaining = deadline - time.time()
+            if (remaining <= 0):
+                raise RpcTimeout('request ' + corr_id + ' to ' + service + ' timed out')
+            self._fill(remaining)
+
+    # Return the next line received that wasn't a reply to a call(), without its
+    # newline, or None if there's none waiting.  Waits up to timeout seconds for
+    # one to arrive (0 doesn't wait, None waits indefinitely).
+    def next_line(self, timeout=0):
+        deadline = None
+        if (timeout != None):
+            deadline = time.time() + timeout
+        while 1:
+            for i in range(len(self.lines)):
+                if (self.lines[i][:1] != '=' and self.lines[i][:1] != '!'):
+                    line = self.lines[i]
+                    del self.lines[i]
+                    return line
+            # Replies nobody is waiting for any more are dropped.
+            self.lines = []
+            remaining = None
+            if (deadline != None):
+                remaining = deadline - time.time()
+                if (remaining <= 0):
+                    return None
+            self._fill(remaining)
+
+    # Read whatever the EDS has sent, waiting up to timeout seconds, and split it
+    # into lines.
+    def _fill(self, timeout):
+        r, w, x = select.select([self.sock], [], [], timeout)
+        if (len(r) == 0):
+            return
+        data = self.sock.recv(self.recv_size)
+        if (data == ''):
+            raise socket.error('connection to EDS closed')
+        self.rbuf = self.rbuf + data
+        lines = string.split(self.rbuf, '\n')
+        self.rbuf = lines[-1]
+        for line in lines[:-1]:
+            self.lines.append(string.strip(line))
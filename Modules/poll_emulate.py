@@ -7,6 +7,7 @@
 # This file must be included in your Python module directory if you're using
 # ALICE with an OS that does not implement the .poll() call.  Windows is one
 # of these.
+# The EDS itself now uses the SelectBackend class in eds_backend.py instead.
 #
 # Current Version: 2.0
 # Author: (C) Copyright Rupert Scammell <rupe@sbcglobal.net> 2001-2005
@@ -51,9 +52,9 @@ def register(input_event, output_event, ex_event, object):
 # Outputs: a list, containing the three sublists that were given as input,
 # with the object removed from them.
 def unregister(input_event, output_event, ex_event, object):
-    input_event.remove(object)
-    #output_event.remove(object)
-    ex_event.remove(object)
+    for event_list in (input_event, output_event, ex_event):
+        if (object in event_list):
+            event_list.remove(object)
     return [input_event, output_event, ex_event]
 
 # poll_emulate.convert_select_elist()
@@ -82,7 +83,7 @@ def convert_select_elist(elist):
     # order of the event lists we receive in elist.
     emap = [select.POLLIN, select.POLLOUT, select.POLLERR]
     
-    for i in range(2):
+    for i in range(3):
         subs_len = len(elist[i])
         for j in range(subs_len):
             converted_event_list.append((elist[i][j].fileno(), emap[i]))
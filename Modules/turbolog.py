@@ -0,0 +1,233 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: Logging for the EDS and modules
+# Description:
+# This utility file provides the logger behind every module's debug()
+# function.  Messages have a level (debug, info, warning, error or critical),
+# and are only formatted if that level is enabled, so debug messages cost
+# almost nothing when debugging is off.  Formatted messages are handed to a
+# background thread, which timestamps them, and writes them to the console
+# and log file in batches, instead of the caller writing and flushing the
+# file once for every message.  The most recent messages are also kept in
+# memory, at a level of their own, so they can be dumped when something goes
+# wrong, even if they weren't being logged.
+# This file must be included in your Python module directory.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+"""
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+
+import sys, time, atexit, collections, threading
+
+# Log levels.  OFF is higher than any message, so nothing gets through.
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+CRITICAL = 50
+OFF = 100
+
+level_names = {DEBUG: 'DEBUG', INFO: 'INFO', WARNING: 'WARNING', ERROR: 'ERROR', CRITICAL: 'CRITICAL'}
+
+# level_value()
+# Input: name, a level name from a config file ('debug', 'warning', 'off'...).
+# Output: the level number.  Raises ValueError for an unknown name.
+def level_value(name):
+    levels = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR,
+              'critical': CRITICAL, 'off': OFF}
+    try:
+        return levels[name.lower()]
+    except KeyError:
+        raise ValueError('unknown log level ' + name)
+
+class Logger:
+    # name is the module name printed with each message.  Until configure() is
+    # called, messages are only kept in the ring buffer.
+    def __init__(self, name, ring_size=1000):
+        self.name = name
+        self.level = OFF
+        self.ring_level = DEBUG
+        self.threshold = DEBUG
+        self.console = 0
+        self.log_fd = None
+        self.flush_interval = 0.5
+        self.ring = collections.deque(maxlen=ring_size)
+        self.pending = collections.deque()
+        self.wakeup = threading.Event()
+        self.writer = None
+        self.lock = threading.Lock()
+
+    # Set where messages go, and which get through.
+    # console: 1 to print messages.  log_file: filename to append messages to,
+    # or None.  level: lowest level printed or written.  ring_level: lowest
+    # level kept in the ring buffer.  ring_size: number of messages the ring
+    # buffer holds.  flush_interval: seconds between writes to the log file;
+    # warnings and above are written straight away.
+    # Returns 1, or 0 if the log file couldn't be opened (messages then only
+    # go to the console).
+    def configure(self, console=0, log_file=None, level=DEBUG, ring_level=WARNING,
+                  ring_size=1000, flush_interval=0.5):
+        success = 1
+        self.console = console
+        if (log_file != None):
+            try:
+                self.log_fd = open(log_file, 'a')
+            except IOError:
+                self.log_fd = None
+                success = 0
+        if (self.console == 0 and self.log_fd == None):
+            level = OFF
+        self.level = level
+        self.ring_level = ring_level
+        self.threshold = min(level, ring_level)
+        if (ring_size != self.ring.maxlen):
+            self.ring = collections.deque(self.ring, ring_size)
+        self.flush_interval = flush_interval
+
+        if (self.level < OFF and self.writer == None):
+            self.writer = threading.Thread(target=self._write_loop)
+            self.writer.setDaemon(1)
+            self.writer.start()
+            atexit.register(self.close)
+        return success
+
+    # Return 1 if messages at level would be formatted, 0 if they'd be thrown
+    # away.  Use it to skip building expensive arguments.
+    def enabled(self, level):
+        return level >= self.threshold
+
+    # Log a message.  If args are given, the message is formatted with the %
+    # operator, but only if level is enabled.  Arguments are formatted
+    # straight away, so later changes to them don't show up in the log.
+    def log(self, level, msg, args=()):
+        if (level < self.threshold):
+            return
+        if (len(args) > 0):
+            msg = msg % args
+        record = (time.time(), level, msg)
+        if (level >= self.ring_level):
+            self.ring.append(record)
+        if (level >= self.level):
+            self.pending.append(record)
+            if (level >= WARNING):
+                self.wakeup.set()
+
+    def debug(self, msg, *args):
+        self.log(DEBUG, msg, args)
+
+    def info(self, msg, *args):
+        self.log(INFO, msg, args)
+
+    def warning(self, msg, *args):
+        self.log(WARNING, msg, args)
+
+    def error(self, msg, *args):
+        self.log(ERROR, msg, args)
+
+    def critical(self, msg, *args):
+        self.log(CRITICAL, msg, args)
+
+    # Return the messages in the ring buffer, oldest first, as formatted
+    # lines.  count limits it to the most recent count messages.
+    def dump(self, count=None):
+        records = list(self.ring)
+        if (count != None):
+            records = records[-count:]
+        return [self._format(record) for record in records]
+
+    # Write the ring buffer to the console and log file, between marker lines.
+    def dump_to_log(self):
+        lines = self.dump()
+        self.pending.append((time.time(), CRITICAL, 'Dump of ' + str(len(lines)) + ' recent messages follows.'))
+        for line in lines:
+            self.pending.append((None, None, line))
+        self.pending.append((time.time(), CRITICAL, 'End of dump.'))
+        self.wakeup.set()
+
+    # Carry on logging in a child process made with os.fork(), which only has
+    # the thread that called fork().  Messages the parent hadn't written yet
+    # are left to the parent.  name replaces the module name, so the parent's
+    # and the child's messages can be told apart.
+    def forked(self, name=None):
+        if (name != None):
+            self.name = name
+        self.pending.clear()
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        if (self.writer != None):
+            self.writer = threading.Thread(target=self._write_loop)
+            self.writer.setDaemon(1)
+            self.writer.start()
+
+    # Write out anything still waiting, and stop the writer thread.
+    def close(self):
+        if (self.writer == None):
+            return
+        writer = self.writer
+        self.writer = None
+        self.wakeup.set()
+        writer.join(5)
+        self._write_pending()
+
+    def _format(self, record):
+        t, level, msg = record
+        if (t == None):
+            return msg
+        return '[' + time.ctime(t) + '] ' + self.name + ': ' + level_names.get(level, '') + ': ' + msg
+
+    def _write_loop(self):
+        while (self.writer != None):
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            self._write_pending()
+
+    def _write_pending(self):
+        # The lock keeps close() and the writer thread from interleaving lines.
+        self.lock.acquire()
+        try:
+            lines = []
+            while (len(self.pending) > 0):
+                lines.append(self._format(self.pending.popleft()) + '\n')
+            if (len(lines) == 0):
+                return
+            out = ''.join(lines)
+            if (self.console == 1):
+                sys.stdout.write(out)
+                sys.stdout.flush()
+            if (self.log_fd != None):
+                try:
+                    self.log_fd.write(out)
+                    self.log_fd.flush()
+                except IOError:
+                    pass
+        finally:
+            self.lock.release()
+
+# dump_on_signal()
+# Input: logger, a Logger.  signum, the signal to dump its ring buffer on
+# (SIGUSR1 by default).
+# Output: None.  Does nothing on operating systems without the signal.
+def dump_on_signal(logger, signum=None):
+    import signal
+    if (signum == None):
+        signum = getattr(signal, 'SIGUSR1', None)
+    if (signum == None):
+        return
+    signal.signal(signum, lambda signum, frame: logger.dump_to_log())
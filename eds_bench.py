@@ -0,0 +1,392 @@
+#!/usr/local/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: EDS benchmark
+# Description:
+# This is not a module.  eds_bench measures how fast the EDS routes
+# messages, so it can be sized for a machine, and so changes to it can be
+# checked for slowdowns.  For each combination of traffic shape, number of
+# modules and message size it's given, it writes a config file, starts
+# select_ports.py with it, and connects synthetic producer and consumer
+# modules, which (like Docs/stub_module.py) are separate processes speaking
+# the usual 'service_name: data' protocol.  Producers send timestamped
+# messages for a while, and consumers time their arrival.  The results
+# (messages per second, median, 99th percentile and largest time from send
+# to arrival, and the processor time the EDS used) are written out as JSON.
+#
+# Traffic shapes are:
+#	pairs	 n producers, each sending to a consumer of its own
+#	fan_in	 n producers, all sending to one consumer
+#	fan_out	 one producer, sending to a topic with n subscribed consumers
+#
+# Usage: eds_bench.py [options]
+#	-s shapes	traffic shapes, separated by commas (pairs,fan_in,fan_out)
+#	-n counts	numbers of modules, separated by commas (1,4,16)
+#	-m sizes	message sizes in bytes, separated by commas (64,1024)
+#	-d seconds	how long producers send for (5)
+#	-r rate		messages per second per producer, or 0 for flat out (0)
+#	-b batch	messages per send() (10)
+#	-p port		first port to use (19500)
+#	-e file		EDS to run (select_ports.py next to this file)
+#	-O opt=value	set an [eds] config option for the EDS (can be repeated)
+#	-j		make every message durable, journalling it to disk
+#	-o file		file to write the results to (standard output)
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+"""
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import sys, os, socket, string, time, signal, getopt, tempfile, shutil, subprocess, array, json
+
+usage = 'Usage: eds_bench.py [-s shapes] [-n counts] [-m sizes] [-d seconds] [-r rate] [-b batch] [-p port] [-e eds_file] [-O option=value] [-j] [-o results_file]'
+
+# Topic the fan_out producer sends to.
+fan_out_topic = 'bench/fan_out'
+
+# Seconds a consumer waits for data before giving up.
+idle_timeout = 30
+
+# Print a progress message.  Standard output may be the results.
+def progress(msg):
+    sys.stderr.write('eds_bench: ' + msg + '\n')
+
+# Connect to the EDS, retrying for a few seconds while it starts up.
+# Input: port, the port to connect to.
+# Output: a connected socket.  Raises socket.error if the EDS never answers.
+def connect(port):
+    give_up = time.time() + 10
+    while 1:
+        try:
+            sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            sock.connect(('127.0.0.1', port))
+            return sock
+        except socket.error:
+            sock.close()
+            if (time.time() > give_up):
+                raise
+            time.sleep(0.1)
+
+# --- Synthetic modules ---
+
+# A producer module.  Sends messages of size bytes (the data, not counting the
+# service name) to dest for duration seconds, batch messages per send(), at
+# rate messages per second (0 for as fast as the EDS will take them), then an
+# 'end' message.  Each message holds a sequence number, and the time it was
+# sent.  Prints a JSON summary when it's done.
+def run_producer(port, dest, size, duration, rate, batch):
+    sock = connect(port)
+    padding = 'x' * size
+    prefix = dest + ': '
+    sent = 0
+    start = time.time()
+    next_send = start
+    while (time.time() < start + duration):
+        if (rate > 0):
+            delay = next_send - time.time()
+            if (delay > 0):
+                time.sleep(delay)
+            next_send = next_send + float(batch) / rate
+        now = '%.6f ' % time.time()
+        out = []
+        for i in range(batch):
+            head = str(sent) + ' ' + now
+            out.append(prefix + head + padding[:max(size - len(head), 0)] + '\n')
+            sent = sent + 1
+        sock.sendall(string.join(out, ''))
+    end = time.time()
+    sock.sendall(prefix + 'end\n')
+    print json.dumps({'sent': sent, 'start': start, 'end': end})
+    sys.stdout.flush()
+    sock.close()
+
+# A consumer module.  Subscribes to topic, if there is one, and reads messages
+# until it's had expected_ends 'end' messages, writing the time each one took
+# to arrive to lat_file (as an array of doubles).  Prints a JSON summary when
+# it's done.
+def run_consumer(port, topic, expected_ends, lat_file):
+    sock = connect(port)
+    if (topic != ''):
+        sock.sendall('eds: subscribe ' + topic + '\n')
+    print 'ready'
+    sys.stdout.flush()
+    sock.settimeout(idle_timeout)
+
+    latencies = array.array('d')
+    buf = ''
+    ends = 0
+    nbytes = 0
+    first = None
+    last = None
+    while (ends < expected_ends):
+        try:
+            data = sock.recv(262144)
+        except socket.timeout:
+            break
+        if (data == ''):
+            break
+        now = time.time()
+        if (first == None):
+            first = now
+        last = now
+        nbytes = nbytes + len(data)
+        lines = string.split(buf + data, '\n')
+        buf = lines.pop()
+        for line in lines:
+            if (line == 'end'):
+                ends = ends + 1
+                continue
+            sep = string.find(line, ' ')
+            latencies.append(now - float(line[sep + 1:string.find(line, ' ', sep + 1)]))
+
+    fd = open(lat_file, 'wb')
+    latencies.tofile(fd)
+    fd.close()
+    print json.dumps({'received': len(latencies), 'bytes': nbytes, 'first': first,
+                      'last': last, 'complete': ends == expected_ends})
+    sys.stdout.flush()
+
+# --- Benchmark harness ---
+
+# Write a config file for a benchmark run.
+# Input: path, the file to write.  names, the module names, in port order.
+# base_port, the first module's port.  eds_options, a list of (option, value)
+# tuples for the [eds] section.  durable, a list of the services and topics whose
+# messages are all durable.
+# Output: None.
+def write_config(path, names, base_port, eds_options, durable):
+    lines = ['[module_reg]']
+    for i in range(len(names)):
+        lines.append(names[i] + ' = ' + str(base_port + i))
+    lines = lines + ['', '[eds]', 'debug_flag = 0', 'log_messages = 0',
+                     'log_file = Logs/eds.log', 'register_port = 0', 'metrics_port = 0',
+                     'unix_socket_dir =']
+    for option, value in eds_options:
+        lines.append(option + ' = ' + value)
+    if (len(durable) > 0):
+        lines = lines + ['journal_file = journal', '', '[durable]']
+        for name in durable:
+            lines.append(name + ' = *')
+    lines = lines + ['', '[logging]', 'log_level = warning', '']
+    fd = open(path, 'w')
+    fd.write(string.join(lines, '\n'))
+    fd.close()
+
+# Start a synthetic module, as another copy of this program.
+# Input: args, the module's arguments (a list of strings).
+# Output: the subprocess.Popen object.
+def start_module(args):
+    return subprocess.Popen([sys.executable, os.path.abspath(sys.argv[0])] + args,
+                            stdout=subprocess.PIPE)
+
+# Work out a percentile of a sorted list.
+def percentile(values, q):
+    if (len(values) == 0):
+        return None
+    return values[int(q * (len(values) - 1))]
+
+# Run one benchmark.
+# Input: shape, count and size, as described at the top of this file.  settings,
+# a hash table of the other options.
+# Output: a hash table of results.
+def run_benchmark(shape, count, size, settings):
+    # Work out who sends to whom.  Each producer is (name, destination), and each
+    # consumer is (name, topic to subscribe to, number of producers sending to it).
+    if (shape == 'pairs'):
+        producers = map(lambda i: ('bench_producer_' + str(i), 'bench_consumer_' + str(i)), range(count))
+        consumers = map(lambda i: ('bench_consumer_' + str(i), '', 1), range(count))
+    elif (shape == 'fan_in'):
+        producers = map(lambda i: ('bench_producer_' + str(i), 'bench_consumer_0'), range(count))
+        consumers = [('bench_consumer_0', '', count)]
+    else:
+        producers = [('bench_producer_0', fan_out_topic)]
+        consumers = map(lambda i: ('bench_consumer_' + str(i), fan_out_topic, 1), range(count))
+    names = map(lambda p: p[0], producers) + map(lambda c: c[0], consumers)
+    port = settings['port']
+
+    work_dir = tempfile.mkdtemp(prefix='eds_bench.')
+    os.mkdir(os.path.join(work_dir, 'Config'))
+    os.mkdir(os.path.join(work_dir, 'Logs'))
+    durable = []
+    if (settings['durable'] == 1):
+        for name, dest in producers:
+            if (dest not in durable):
+                durable.append(dest)
+    write_config(os.path.join(work_dir, 'Config', 'alice.config'), names, port, settings['eds_options'], durable)
+
+    env = os.environ.copy()
+    env['PYTHONPATH'] = os.path.join(os.path.dirname(os.path.abspath(settings['eds'])), 'Modules')
+    devnull = open(os.devnull, 'w')
+    eds = subprocess.Popen([sys.executable, os.path.abspath(settings['eds'])], cwd=work_dir,
+                           env=env, stdout=devnull, stderr=subprocess.STDOUT)
+    try:
+        # Wait until the EDS is listening on the last port.
+        connect(port + len(names) - 1).close()
+
+        consumer_procs = []
+        for i in range(len(consumers)):
+            name, topic, ends = consumers[i]
+            proc = start_module(['consumer', str(port + len(producers) + i), topic, str(ends),
+                                 os.path.join(work_dir, 'lat_' + str(i))])
+            proc.stdout.readline()
+            consumer_procs.append(proc)
+        # Let the subscriptions through before anything's published.
+        time.sleep(0.2)
+
+        producer_procs = []
+        for i in range(len(producers)):
+            name, dest = producers[i]
+            producer_procs.append(start_module(['producer', str(port + i), dest, str(size),
+                                                str(settings['duration']), str(settings['rate']),
+                                                str(settings['batch'])]))
+
+        producer_results = map(lambda proc: json.loads(proc.stdout.readline()), producer_procs)
+        consumer_results = map(lambda proc: json.loads(proc.stdout.readline()), consumer_procs)
+        for proc in producer_procs + consumer_procs:
+            proc.wait()
+
+        latencies = array.array('d')
+        for i in range(len(consumers)):
+            fd = open(os.path.join(work_dir, 'lat_' + str(i)), 'rb')
+            latencies.fromstring(fd.read())
+            fd.close()
+    finally:
+        # The EDS's processor time comes from its resource usage when it exits.
+        try:
+            os.kill(eds.pid, signal.SIGTERM)
+        except OSError:
+            pass
+        pid, status, usage = os.wait4(eds.pid, 0)
+        devnull.close()
+        shutil.rmtree(work_dir, True)
+
+    sent = 0
+    for result in producer_results:
+        sent = sent + result['sent']
+    received = len(latencies)
+    start = min(map(lambda r: r['start'], producer_results))
+    last_times = filter(lambda t: t != None, map(lambda r: r['last'], consumer_results))
+    elapsed = None
+    if (len(last_times) > 0):
+        elapsed = max(last_times) - start
+    nbytes = 0
+    for result in consumer_results:
+        nbytes = nbytes + result['bytes']
+    latencies = latencies.tolist()
+    latencies.sort()
+    cpu = usage.ru_utime + usage.ru_stime
+
+    results = {'shape': shape, 'modules': count, 'connections': len(names),
+               'message_size': size, 'duration': settings['duration'],
+               'rate': settings['rate'], 'batch': settings['batch'],
+               'sent': sent, 'received': received,
+               'complete': len(filter(lambda r: r['complete'] == 0, consumer_results)) == 0,
+               'elapsed': elapsed, 'msgs_per_sec': None, 'mbytes_per_sec': None,
+               'latency_p50': percentile(latencies, 0.5),
+               'latency_p99': percentile(latencies, 0.99),
+               'latency_max': percentile(latencies, 1.0),
+               'eds_cpu_seconds': cpu, 'eds_cpu_usec_per_msg': None}
+    if (elapsed != None and elapsed > 0):
+        results['msgs_per_sec'] = received / elapsed
+        results['mbytes_per_sec'] = nbytes / elapsed / 1048576
+    if (received > 0):
+        results['eds_cpu_usec_per_msg'] = cpu * 1000000 / received
+    return results
+
+
+# -- MAIN PROGRAM --
+
+# Synthetic modules are started as 'eds_bench.py producer ...' and
+# 'eds_bench.py consumer ...'.
+if (len(sys.argv) > 1 and sys.argv[1] == 'producer'):
+    run_producer(int(sys.argv[2]), sys.argv[3], int(sys.argv[4]), float(sys.argv[5]),
+                 float(sys.argv[6]), int(sys.argv[7]))
+    sys.exit(0)
+if (len(sys.argv) > 1 and sys.argv[1] == 'consumer'):
+    run_consumer(int(sys.argv[2]), sys.argv[3], int(sys.argv[4]), sys.argv[5])
+    sys.exit(0)
+
+try:
+    opts, args = getopt.getopt(sys.argv[1:], 's:n:m:d:r:b:p:e:O:jo:')
+except getopt.GetoptError:
+    print usage
+    sys.exit(1)
+if (len(args) != 0):
+    print usage
+    sys.exit(1)
+
+shapes = ['pairs', 'fan_in', 'fan_out']
+counts = [1, 4, 16]
+sizes = [64, 1024]
+settings = {'duration': 5.0, 'rate': 0.0, 'batch': 10, 'port': 19500,
+            'eds': os.path.join(os.path.dirname(os.path.abspath(sys.argv[0])), 'select_ports.py'),
+            'eds_options': [], 'durable': 0}
+results_file = None
+try:
+    for opt, value in opts:
+        if (opt == '-s'):
+            shapes = string.split(value, ',')
+        elif (opt == '-n'):
+            counts = map(int, string.split(value, ','))
+        elif (opt == '-m'):
+            sizes = map(int, string.split(value, ','))
+        elif (opt == '-d'):
+            settings['duration'] = float(value)
+        elif (opt == '-r'):
+            settings['rate'] = float(value)
+        elif (opt == '-b'):
+            settings['batch'] = int(value)
+        elif (opt == '-p'):
+            settings['port'] = int(value)
+        elif (opt == '-e'):
+            settings['eds'] = value
+        elif (opt == '-O'):
+            option, option_value = string.split(value, '=', 1)
+            settings['eds_options'].append((string.strip(option), string.strip(option_value)))
+        elif (opt == '-j'):
+            settings['durable'] = 1
+        elif (opt == '-o'):
+            results_file = value
+except ValueError:
+    print usage
+    sys.exit(1)
+for shape in shapes:
+    if (shape not in ('pairs', 'fan_in', 'fan_out')):
+        print 'eds_bench: Unknown traffic shape ' + shape
+        sys.exit(1)
+
+runs = []
+for shape in shapes:
+    for count in counts:
+        for size in sizes:
+            progress('Running ' + shape + ' with ' + str(count) + ' modules, ' + str(size) + ' byte messages.')
+            result = run_benchmark(shape, count, size, settings)
+            if (result['msgs_per_sec'] != None):
+                progress('%.0f messages/second, p50 %.6f, p99 %.6f seconds.' % (result['msgs_per_sec'], result['latency_p50'], result['latency_p99']))
+            runs.append(result)
+
+report = {'eds': os.path.abspath(settings['eds']), 'python': sys.version.split()[0],
+          'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+          'eds_options': dict(settings['eds_options']), 'durable': settings['durable'],
+          'runs': runs}
+out = json.dumps(report, indent=2, sort_keys=True)
+if (results_file == None):
+    print out
+else:
+    fd = open(results_file, 'w')
+    fd.write(out + '\n')
+    fd.close()
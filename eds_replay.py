@@ -0,0 +1,246 @@
+#!/usr/local/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: EDS traffic replay tool
+# Description:
+# This is not a module.  eds_replay plays a capture file recorded by the
+# EDS (see capture_file in the [eds] section of Config/alice.config) back
+# into an EDS, usually a test one, so a real load can be used to benchmark
+# changes to the EDS, or to reproduce a problem.  Each message is sent from
+# a connection for the module that originally sent it, in the order it was
+# recorded, either with the original timing (optionally sped up), or as
+# fast as the EDS will take it.  A connection is also made for every module
+# in the [module_reg] section of the config file, so messages for modules
+# that never sent anything have somewhere to go.  Everything the EDS sends
+# back is read and thrown away.
+#
+# Usage: eds_replay.py [-c config_file] [-H eds_host] [-s speed | -f] capture_file
+#	-c	config file to find module ports in (Config/alice.config)
+#	-H	host the EDS is running on (127.0.0.1)
+#	-s	replay speed: 2 plays back twice as fast as recorded (1)
+#	-f	send everything as fast as possible, ignoring the recorded timing
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+"""
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import sys, os, socket, select, string, time, errno, getopt, ConfigParser
+
+sys.path.append(os.path.join(os.path.dirname(sys.argv[0]), 'Modules'))
+import eds_capture, eds_frame
+
+usage = 'Usage: eds_replay.py [-c config_file] [-H eds_host] [-s speed | -f] capture_file'
+
+# Largest amount of data waiting to be sent before the replay stops to let the
+# EDS catch up.
+max_pending = 1048576
+
+# Open a connection to the EDS for a module.  Modules listed in [module_reg]
+# connect to their own port.  Others connect to the registration port, and
+# register, unless name is empty.
+# Input: name, the module name.  framed, 1 to switch the connection to frames.
+# Output: a connection record: a hash table holding the socket, a list of the
+# data waiting to be sent on it, and the number of bytes in the list.
+def open_connection(name, framed):
+    if (module_ports.has_key(name)):
+        port = module_ports[name]
+    else:
+        port = register_port
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.connect((eds_host, port))
+    if (port == register_port and name != ''):
+        sock.sendall('eds: register ' + name + '\n')
+    if (framed == 1):
+        eds_frame.negotiate(sock)
+    sock.setblocking(0)
+    conn = {'sock': sock, 'out': [], 'out_bytes': 0}
+    conn_list.append(conn)
+    return conn
+
+# Find the connection to send a module's message from, opening it if need be.
+# Data with a newline in it can only be sent as a frame, so each module can have
+# a text connection and a framed one.
+# Input: name, the module name.  framed, 1 for the framed connection.
+# Output: a connection record.
+def get_connection(name, framed):
+    key = (name, framed)
+    if (conn_table.has_key(key) == 0):
+        conn_table[key] = open_connection(name, framed)
+    return conn_table[key]
+
+# Send whatever the connections have waiting, and read and throw away whatever
+# the EDS has sent, waiting up to timeout seconds for something to happen.
+# Input: timeout, in seconds.
+# Output: None.
+def pump(timeout):
+    global bytes_in, last_read
+    want_write = []
+    for conn in conn_list:
+        if (conn['out_bytes'] > 0):
+            want_write.append(conn['sock'])
+    socks = map(lambda conn: conn['sock'], conn_list)
+    r, w, x = select.select(socks, want_write, [], timeout)
+    for conn in conn_list:
+        if (conn['sock'] in r):
+            try:
+                data = conn['sock'].recv(65536)
+            except socket.error:
+                data = None
+            if (data == ''):
+                print 'eds_replay: The EDS closed a connection.  Stopping.'
+                sys.exit(1)
+            if (data != None):
+                bytes_in = bytes_in + len(data)
+                last_read = time.time()
+        if (conn['sock'] in w):
+            out = string.join(conn['out'], '')
+            try:
+                sent = conn['sock'].send(out)
+                conn['out'] = [out[sent:]]
+                conn['out_bytes'] = len(out) - sent
+            except socket.error, exc:
+                if (exc.args[0] not in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)):
+                    raise
+
+# Add data to the data waiting to be sent on a connection.
+def send_later(conn, data):
+    conn['out'].append(data)
+    conn['out_bytes'] = conn['out_bytes'] + len(data)
+
+# Total number of bytes waiting to be sent.
+def pending():
+    total = 0
+    for conn in conn_list:
+        total = total + conn['out_bytes']
+    return total
+
+
+# -- MAIN PROGRAM --
+
+try:
+    opts, args = getopt.getopt(sys.argv[1:], 'c:H:s:f')
+except getopt.GetoptError:
+    print usage
+    sys.exit(1)
+if (len(args) != 1):
+    print usage
+    sys.exit(1)
+
+config_file = 'Config/alice.config'
+eds_host = '127.0.0.1'
+speed = 1.0
+for opt, value in opts:
+    if (opt == '-c'):
+        config_file = value
+    elif (opt == '-H'):
+        eds_host = value
+    elif (opt == '-s'):
+        speed = float(value)
+    elif (opt == '-f'):
+        speed = 0
+
+# Find the module ports, and the registration port.
+config = ConfigParser.ConfigParser()
+if (len(config.read(config_file)) == 0):
+    print 'eds_replay: Unable to read ' + config_file
+    sys.exit(1)
+module_ports = {}
+for name, port in config.items('module_reg'):
+    module_ports[name] = int(port)
+register_port = 0
+if (config.has_option('eds', 'register_port')):
+    register_port = config.getint('eds', 'register_port')
+
+# Connections, keyed by (module name, framed), and the same connections as a list.
+conn_table = {}
+conn_list = []
+bytes_in = 0
+last_read = 0
+
+try:
+    for name in module_ports.keys():
+        get_connection(name, 0)
+except socket.error, exc:
+    print 'eds_replay: Unable to connect to the EDS (' + str(exc) + ').'
+    sys.exit(1)
+
+# Give the EDS time to accept the connections before any messages arrive.
+time.sleep(0.2)
+
+count = 0
+bytes_out = 0
+first_time = None
+try:
+    for t, flags, source, dest, data in eds_capture.read_capture(args[0]):
+        if (first_time == None):
+            first_time = t
+            start_time = time.time()
+
+        # Wait until the message is due, keeping the connections moving
+        # meanwhile.
+        if (speed > 0):
+            due = start_time + (t - first_time) / speed
+            while (time.time() < due):
+                pump(due - time.time())
+
+        # Framing is up to us, not to the capture.
+        if (dest == 'eds' and string.strip(data) == 'framing'):
+            continue
+
+        if (string.find(data, '\n') >= 0):
+            conn = get_connection(source, 1)
+            send_later(conn, eds_frame.pack_frame(dest, data))
+        else:
+            conn = get_connection(source, 0)
+            send_later(conn, dest + ': ' + data + '\n')
+            # An unregistered connection that registers is that module's
+            # connection from now on.
+            args_list = string.split(data)
+            if (source == '' and dest == 'eds' and len(args_list) > 1 and args_list[0] == 'register'):
+                del conn_table[('', 0)]
+                conn_table[(args_list[1], 0)] = conn
+        count = count + 1
+        bytes_out = bytes_out + len(data)
+
+        # In real time, each message goes out straight away.  Flat out, they go
+        # out in batches.
+        if (speed > 0 or count % 64 == 0):
+            pump(0)
+            while (pending() > max_pending):
+                pump(1.0)
+except (IOError, ValueError), exc:
+    print 'eds_replay: ' + str(exc)
+    sys.exit(1)
+except socket.error, exc:
+    print 'eds_replay: Lost connection to the EDS (' + str(exc) + ').'
+    sys.exit(1)
+
+if (first_time == None):
+    print 'eds_replay: ' + args[0] + ' holds no messages.'
+    sys.exit(0)
+
+# Send whatever's left, and wait until nothing's arrived from the EDS for half a
+# second.  The replay took until the last data was sent, or received.
+while (pending() > 0):
+    pump(1.0)
+sent_time = time.time()
+while (time.time() - last_read < 0.5):
+    pump(0.5)
+elapsed = max(sent_time, last_read) - start_time
+
+print 'eds_replay: ' + str(count) + ' messages (' + str(bytes_out) + ' bytes) replayed in ' + ('%.3f' % elapsed) + ' seconds, ' + ('%.0f' % (count / max(elapsed, 0.001))) + ' messages/second.  ' + str(bytes_in) + ' bytes received.'
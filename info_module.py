@@ -28,7 +28,7 @@ along with this program; if not, write to the Free Software
 Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
 
-import sys, os, socket, string, time, re, ConfigParser, fileinput, urllib
+import sys, os, socket, string, time, re, ConfigParser, fileinput, urllib, turbolog
 import formatter,StringIO,htmllib
 
 # Set configurations via ConfigParser for the module.
@@ -39,6 +39,8 @@ import formatter,StringIO,htmllib
 # b = boolean
 # f = float
 # s = string
+# An optional fourth item in the tuple gives a default value, used when the option
+# isn't present in the config file.  Options without a default must be present.
 # The function returns a hash table that has as its top level keys section names, which have nested
 # hash tables as their values.  These nested hash tables have section option names as keys, and the
 # respective section option values as values.
@@ -68,6 +70,10 @@ def set_configs(config_file, options):
             if (config_core[c_section].has_key(c_option) == 1):
                 log_message = "set_configs: Warning.  Duplicate " + c_section + ":" + c_option + " found.  Using new value."
                 debug(log_message)
+            # Fall back on the default value if one was given, and the option is missing.
+            if (len(options[i]) > 3 and module_config.has_option(c_section, c_option) == 0):
+                config_core[c_section][c_option] = options[i][3]
+                continue
             # Extract data from config into hash table, doing appropriate coercions based on c_coerce flag.
             if (c_coerce == 'i'):
                 config_core[c_section][c_option] = module_config.getint(c_section, c_option)
@@ -81,25 +87,43 @@ def set_configs(config_file, options):
     return config_core
 
 
-# debug output function.
-def debug(msg):
-    msg = '[' + str(time.ctime(time.time())) + '] ' + 'info_module' + ': ' + msg + '\n'
-    if (config_data['info_module']['debug_flag'] == 1):
-        print string.strip(msg)
-    if (config_data['info_module']['log_messages'] == 1):
-        log_fd.write(msg)
-        log_fd.flush()
+# Log output functions.  Messages go through the shared logger in
+# Modules/turbolog.py, which only formats them if their level is enabled, and
+# writes them to the console and log file from a background thread.  Extra
+# arguments are formatted into msg with the % operator, so pass them rather
+# than building the string first: debug('fd %d ready', fd).
+def debug(msg, *args):
+    logger.log(turbolog.DEBUG, msg, args)
+
+def warning(msg, *args):
+    logger.log(turbolog.WARNING, msg, args)
+
+def critical(msg, *args):
+    logger.log(turbolog.CRITICAL, msg, args)
 
 # Client-side network initialization.  Attempts to connect to
 # host config_data['info_module']['eds_host'],
 # port config_data['info_module']['eds_port].
+# If the EDS also listens on Unix domain sockets (unix_socket_dir in the [eds]
+# section of the config file), and this module's socket is there, that's used
+# instead, since it's cheaper than TCP when the EDS is on the same machine.
 # If connect is successful, returns a socket object.
 # If unsuccessful, waits five seconds before retrying.
 
 def network_init():
     connect_success = 0
     debug('network_init: Attempting to establish connection.')
+    unix_path = os.path.join(config_data['eds']['unix_socket_dir'], 'info_module.sock')
     while (connect_success == 0):
+        if (config_data['eds']['unix_socket_dir'] != '' and os.path.exists(unix_path)):
+            try:
+                s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                s.connect(unix_path)
+                debug('network_init: Connection established via ' + unix_path)
+                return s
+            except socket.error:
+                s.close()
+                debug('network_init: Unix domain connect unsuccessful.  Trying TCP.')
         try:
             s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -159,7 +183,7 @@ def send_to_socket(data):
 	    debug('send_to_socket: data sent to server.')
 	    send_success = 1
 	except socket.error:
-	    debug('send_to_socket: WARNING: Couldn\'t send command to server.  Reinitializing network link.')
+	    warning('send_to_socket: Couldn\'t send command to server.  Reinitializing network link.')
 	    s.close()
 	    s = network_init()
 
@@ -203,7 +227,7 @@ def process_cmd(data):
             log_text = 'process_cmd: channel data source is ' + channel_data_source
             debug(log_text)
         except:
-            debug('process_cmd: WARNING: unable to extract data source for channel.')
+            warning('process_cmd: unable to extract data source for channel.')
             send_to_socket('speechio_module: speech_out: I\'m sorry.  I was unable to find a data source for this channel.\n')
             return
 
@@ -296,7 +320,7 @@ def event_handler():
                 
             # Call process_cmd on each item in data_list until the list is empty.
             while data_sublist != []:
-                debug(str(data_sublist))
+                debug('%s', data_sublist)
                 process_cmd(data_sublist.pop(0))
             
         except socket.error:
@@ -342,7 +366,12 @@ config_options = [('info_module', 'debug_flag', 'b'), \
                   ('info_module', 'log_messages', 'b'), \
                   ('info_module', 'log_file', 's'), \
                   ('info_module', 'eds_port', 'i'), \
-                  ('info_module', 'eds_host', 's')]
+                  ('info_module', 'eds_host', 's'), \
+                  ('eds', 'unix_socket_dir', 's', ''), \
+                  ('logging', 'log_level', 's', 'debug'), \
+                  ('logging', 'ring_level', 's', 'warning'), \
+                  ('logging', 'ring_size', 'i', 1000), \
+                  ('logging', 'flush_interval', 'f', 0.5)]
 
 # Config file to use:
 config_fn = 'Config/alice.config'
@@ -350,18 +379,29 @@ log_message = 'init: Using config file ' + config_fn
 print log_message
 
 # Get configuration information
+# Logger behind debug(), warning() and critical().  Messages logged before it's
+# configured, below, are only kept in memory.
+logger = turbolog.Logger('info_module')
+
 config_data = set_configs(config_fn, config_options)
 
-# Open a log file, if this feature has been enabled.
+# Start logging, to the console and log file as configured.  Until now, messages
+# have only been kept in memory.  Sending the process a SIGUSR1 writes out the
+# most recent messages, whatever their level.
 print 'init: Opening log file.'
+log_file = None
 if (config_data['info_module']['log_messages'] == 1):
-    try:
-        log_fd = open(config_data['info_module']['log_file'], 'a')
-    except IOError:
-        log_message = 'init: WARNING: Unable to open log file at ' + config_data['info_module']['log_file']
-        print log_message
-        print 'init: WARNING: Logging will occur to console only.'
-        config_data['info_module']['log_messages']  = 0
+    log_file = config_data['info_module']['log_file']
+log_sec = config_data['logging']
+if (logger.configure(config_data['info_module']['debug_flag'], log_file,
+                     turbolog.level_value(log_sec['log_level']),
+                     turbolog.level_value(log_sec['ring_level']),
+                     log_sec['ring_size'], log_sec['flush_interval']) == 0):
+    log_message = 'init: WARNING: Unable to open log file at ' + log_file
+    print log_message
+    print 'init: WARNING: Logging will occur to console only.'
+    config_data['info_module']['log_messages']  = 0
+turbolog.dump_on_signal(logger)
 
 # debug() log function usable below this point.
 
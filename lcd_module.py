@@ -27,7 +27,7 @@ along with this program; if not, write to the Free Software
 Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
 
-import sys, socket, string, time, re, ConfigParser, pyCFontz
+import sys, os, socket, string, time, re, ConfigParser, pyCFontz, turbolog, eds_channel
 
 # Set configurations via ConfigParser for the module.
 # Options list is a list of options to return.  Each item in the list is a tuple in the form:
@@ -37,6 +37,8 @@ import sys, socket, string, time, re, ConfigParser, pyCFontz
 # b = boolean
 # f = float
 # s = string
+# An optional fourth item in the tuple gives a default value, used when the option
+# isn't present in the config file.  Options without a default must be present.
 # The function returns a hash table that has as its top level keys section names, which have nested
 # hash tables as their values.  These nested hash tables have section option names as keys, and the
 # respective section option values as values.
@@ -67,6 +69,10 @@ def set_configs(config_file, options):
             if (config_core[c_section].has_key(c_option) == 1):
                 log_message = "set_configs: Warning.  Duplicate " + c_section + ":" + c_option + " found.  Using new value."
                 debug(log_message)
+            # Fall back on the default value if one was given, and the option is missing.
+            if (len(options[i]) > 3 and module_config.has_option(c_section, c_option) == 0):
+                config_core[c_section][c_option] = options[i][3]
+                continue
             # Extract data from config into hash table, doing appropriate coercions based on c_coerce flag.
             if (c_coerce == 'i'):
                 config_core[c_section][c_option] = module_config.getint(c_section, c_option)
@@ -79,37 +85,82 @@ def set_configs(config_file, options):
     # Return a hash table containing the information.
     return config_core
 
-# debug output function.
-def debug(msg):
-    msg = '[' + str(time.ctime(time.time())) + '] ' + 'lcd_module' + ': ' + msg + '\n'
-    if (config_data['lcd_module']['debug_flag'] == 1):
-        print string.strip(msg)
-    if (config_data['lcd_module']['log_messages'] == 1):
-        log_fd.write(msg)
-        log_fd.flush()
+# Log output functions.  Messages go through the shared logger in
+# Modules/turbolog.py, which only formats them if their level is enabled, and
+# writes them to the console and log file from a background thread.  Extra
+# arguments are formatted into msg with the % operator, so pass them rather
+# than building the string first: debug('fd %d ready', fd).
+def debug(msg, *args):
+    logger.log(turbolog.DEBUG, msg, args)
+
+def warning(msg, *args):
+    logger.log(turbolog.WARNING, msg, args)
+
+def critical(msg, *args):
+    logger.log(turbolog.CRITICAL, msg, args)
         
 # Client-side network initialization.  Attempts to connect to
 # host config_data['lcd_module']['eds_host'],
 # port config_data['lcd_module']['eds_port].
+# If the EDS also listens on Unix domain sockets (unix_socket_dir in the [eds]
+# section of the config file), and this module's socket is there, that's used
+# instead, since it's cheaper than TCP when the EDS is on the same machine.
 # If connect is successful, returns a socket object.
 # If unsuccessful, waits five seconds before retrying.
 
 def network_init():
     connect_success = 0
     debug('network_init: Attempting to establish connection.')
+    unix_path = os.path.join(config_data['eds']['unix_socket_dir'], 'lcd_module.sock')
     while (connect_success == 0):
+        if (config_data['eds']['unix_socket_dir'] != '' and os.path.exists(unix_path)):
+            try:
+                s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                s.connect(unix_path)
+                debug('network_init: Connection established via ' + unix_path)
+                start_channels(s)
+                return s
+            except socket.error:
+                s.close()
+                debug('network_init: Unix domain connect unsuccessful.  Trying TCP.')
         try:
             s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             s.connect((config_data['lcd_module']['eds_host'],config_data['lcd_module']['eds_port']))
             connect_success = 1
             debug('network_init: Connection established.')
+            start_channels(s)
             return s
         except socket.error:
             debug('network_init: Connect unsuccessful.  Waiting 5 seconds before retry.')
             time.sleep(5)
             connect_success = 0
 
+# Over a Unix domain connection, other modules (the MP3 module, mostly) can send
+# to this one over direct channels instead of through the EDS (see
+# Modules/eds_channel.py), if accept_channels is set in the [lcd_module] section.
+# channels is None when they can't.
+# Input: s, the newly connected EDS socket.
+# Output: None.
+
+def start_channels(s):
+    global channels
+    if (channels != None):
+        channels.close()
+        channels = None
+    if (config_data['lcd_module']['accept_channels'] == 1 and eds_channel.usable(s) == 1):
+        channels = eds_channel.EdsChannels(s)
+        channels.accept()
+
+# Wait for data from the EDS, or from a direct channel.
+# Input: None.
+# Output: the data, or an empty string if the connection to the EDS has closed.
+
+def receive():
+    if (channels != None):
+        return channels.recv()
+    return s.recv(1024)
+
 # Establish a connection with the LCD hardware.
 # Input to the function consists of two device names,
 # a primary (device), and a secondary (second_device),
@@ -158,7 +209,7 @@ def send_to_socket(data):
 	    debug('send_to_socket: data sent to server.')
 	    send_success = 1
 	except socket.error:
-	    debug('send_to_socket: WARNING: Couldn\'t send command to server.  Reinitializing network link.')
+	    warning('send_to_socket: Couldn\'t send command to server.  Reinitializing network link.')
 	    do_network_reinit()
 
 def show_clock(dline=0):
@@ -381,7 +432,7 @@ def process_cmd(data):
                 debug('process_cmd: displaying clock.')
                 if (clock_parse.search(data).group(2) != None):
                     dline = int(clock_parse.search(data).group(2))
-                    debug(str(dline))
+                    debug('%s', dline)
                 else:
                     dline = 0                                  
                 clock_can_display = 1                                      
@@ -389,7 +440,7 @@ def process_cmd(data):
                     import thread
                     thread.start_new_thread(show_clock, (dline,))
                 except ImportError:
-                    debug('WARNING: Unable to create thread for clock.')
+                    warning('Unable to create thread for clock.')
 
             # Stop displaying any previously started digital clock.
             if (data == 'stop_display_clock'):
@@ -423,7 +474,7 @@ def event_loop():
                                                       
     while 1:
         try:
-            in_data = s.recv(1024)
+            in_data = receive()
             
             # Sometimes, multiple items of data will arrive together, CR separated.
             # In this case, we execute a string.split() on the returned data, and append
@@ -464,7 +515,7 @@ def event_loop():
                 
             # Call process_cmd on each item in data_list until the list is empty.
             while data_list != []:
-                debug(str(data_list))
+                debug('%s', data_list)
                 process_cmd(data_list.pop(0))
             
         except socket.error:
@@ -484,27 +535,44 @@ config_options = [('lcd_module', 'debug_flag', 'b'), \
                   ('lcd_module', 'log_messages', 'b'), \
                   ('lcd_module', 'eds_port', 'i'), \
                   ('lcd_module', 'eds_host', 's'), \
+                  ('eds', 'unix_socket_dir', 's', ''), \
+                  ('lcd_module', 'accept_channels', 'b', 0), \
                   ('lcd_module', 'log_file', 's'), \
                   ('lcd_module', 'lcd_device', 's'), \
-                  ('lcd_module', 'second_lcd_device', 's')]
+                  ('lcd_module', 'second_lcd_device', 's'), \
+                  ('logging', 'log_level', 's', 'debug'), \
+                  ('logging', 'ring_level', 's', 'warning'), \
+                  ('logging', 'ring_size', 'i', 1000), \
+                  ('logging', 'flush_interval', 'f', 0.5)]
 
 # Get configuration information
 config_fn = config_fn = 'Config/alice.config'
 log_message = 'init: Using config file ' + config_fn
 print log_message
 
+# Logger behind debug(), warning() and critical().  Messages logged before it's
+# configured, below, are only kept in memory.
+logger = turbolog.Logger('lcd_module')
+
 config_data = set_configs(config_fn, config_options)
 
-# Open a log file, if this feature has been enabled.
+# Start logging, to the console and log file as configured.  Until now, messages
+# have only been kept in memory.  Sending the process a SIGUSR1 writes out the
+# most recent messages, whatever their level.
 print 'init: Opening log file.'
+log_file = None
 if (config_data['lcd_module']['log_messages'] == 1):
-    try:
-        log_fd = open(config_data['lcd_module']['log_file'], 'a')
-    except IOError:
-        log_message = 'init: WARNING: Unable to open log file at ' + config_data['lcd_module']['log_file']
-        print log_message
-        print 'init: WARNING: Logging will occur to console only.'
-        config_data['lcd_module']['log_messages']  = 0
+    log_file = config_data['lcd_module']['log_file']
+log_sec = config_data['logging']
+if (logger.configure(config_data['lcd_module']['debug_flag'], log_file,
+                     turbolog.level_value(log_sec['log_level']),
+                     turbolog.level_value(log_sec['ring_level']),
+                     log_sec['ring_size'], log_sec['flush_interval']) == 0):
+    log_message = 'init: WARNING: Unable to open log file at ' + log_file
+    print log_message
+    print 'init: WARNING: Logging will occur to console only.'
+    config_data['lcd_module']['log_messages']  = 0
+turbolog.dump_on_signal(logger)
 
 # Initialize the LCD device, and return a global LCD object.
 lcd = lcd_init(config_data['lcd_module']['lcd_device'], config_data['lcd_module']['second_lcd_device'])
@@ -514,6 +582,7 @@ data_list = []
                                                              
 # Initialize the network connection, and return a global socket object.
 debug('init: Connecting to event distribution server.')
+channels = None
 s = network_init()
 
 # Set the clock display flag to 1, initially.
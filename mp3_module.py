@@ -27,7 +27,7 @@ along with this program; if not, write to the Free Software
 Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
 
-import sys, os, socket, string, time, re, ConfigParser, whrandom, fileinput, mp3infor, thread
+import sys, os, socket, string, time, re, ConfigParser, whrandom, fileinput, mp3infor, thread, turbolog, eds_channel
 
 # Set configurations via ConfigParser for the module.
 # Options list is a list of options to return.  Each item in the list is a tuple in the form:
@@ -37,6 +37,8 @@ import sys, os, socket, string, time, re, ConfigParser, whrandom, fileinput, mp3
 # b = boolean
 # f = float
 # s = string
+# An optional fourth item in the tuple gives a default value, used when the option
+# isn't present in the config file.  Options without a default must be present.
 # The function returns a hash table that has as its top level keys section names, which have nested
 # hash tables as their values.  These nested hash tables have section option names as keys, and the
 # respective section option values as values.
@@ -66,6 +68,10 @@ def set_configs(config_file, options):
             if (config_core[c_section].has_key(c_option) == 1):
                 log_message = "set_configs: Warning.  Duplicate " + c_section + ":" + c_option + " found.  Using new value."
                 debug(log_message)
+            # Fall back on the default value if one was given, and the option is missing.
+            if (len(options[i]) > 3 and module_config.has_option(c_section, c_option) == 0):
+                config_core[c_section][c_option] = options[i][3]
+                continue
             # Extract data from config into hash table, doing appropriate coercions based on c_coerce flag.
             if (c_coerce == 'i'):
                 config_core[c_section][c_option] = module_config.getint(c_section, c_option)
@@ -79,37 +85,81 @@ def set_configs(config_file, options):
     return config_core
 
 
-# debug output function.
-def debug(msg):
-    msg = '[' + str(time.ctime(time.time())) + '] ' + 'mp3_module' + ': ' + msg + '\n'
-    if (config_data['mp3_module']['debug_flag'] == 1):
-        print string.strip(msg)
-    if (config_data['mp3_module']['log_messages'] == 1):
-        log_fd.write(msg)
-        log_fd.flush()
+# Log output functions.  Messages go through the shared logger in
+# Modules/turbolog.py, which only formats them if their level is enabled, and
+# writes them to the console and log file from a background thread.  Extra
+# arguments are formatted into msg with the % operator, so pass them rather
+# than building the string first: debug('fd %d ready', fd).
+def debug(msg, *args):
+    logger.log(turbolog.DEBUG, msg, args)
+
+def warning(msg, *args):
+    logger.log(turbolog.WARNING, msg, args)
+
+def critical(msg, *args):
+    logger.log(turbolog.CRITICAL, msg, args)
 
 # Client-side network initialization.  Attempts to connect to
 # host config_data['mp3_module']['eds_host'],
 # port config_data['mp3_module']['eds_port].
+# If the EDS also listens on Unix domain sockets (unix_socket_dir in the [eds]
+# section of the config file), and this module's socket is there, that's used
+# instead, since it's cheaper than TCP when the EDS is on the same machine.
 # If connect is successful, returns a socket object.
 # If unsuccessful, waits five seconds before retrying.
 
 def network_init():
     connect_success = 0
     debug('network_init: Attempting to establish connection.')
+    unix_path = os.path.join(config_data['eds']['unix_socket_dir'], 'mp3_module.sock')
     while (connect_success == 0):
+        if (config_data['eds']['unix_socket_dir'] != '' and os.path.exists(unix_path)):
+            try:
+                s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                s.connect(unix_path)
+                debug('network_init: Connection established via ' + unix_path)
+                start_channel(s)
+                return s
+            except socket.error:
+                s.close()
+                debug('network_init: Unix domain connect unsuccessful.  Trying TCP.')
         try:
             s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             s.connect((config_data['mp3_module']['eds_host'],config_data['mp3_module']['eds_port']))
             connect_success = 1
             debug('network_init: Connection established.')
+            start_channel(s)
             return s
         except socket.error:
             debug('network_init: Connect unsuccessful.  Waiting 5 seconds before retry.')
             time.sleep(5)
             connect_success = 0
 
+# Over a Unix domain connection, LCD output goes straight to the LCD module over a
+# direct channel instead of through the EDS (see Modules/eds_channel.py), if
+# lcd_channel is set in the [mp3_module] section.  channels is None when it can't.
+# Input: s, the newly connected EDS socket.
+# Output: None.
+
+def start_channel(s):
+    global channels
+    if (channels != None):
+        channels.close()
+        channels = None
+    if (config_data['mp3_module']['lcd_channel'] == 1 and eds_channel.usable(s) == 1):
+        channels = eds_channel.EdsChannels(s)
+        channels.request(config_data['mp3_module']['lcdout_mod'])
+
+# Wait for data from the EDS, or from a direct channel.
+# Input: None.
+# Output: the data, or an empty string if the connection to the EDS has closed.
+
+def receive():
+    if (channels != None):
+        return channels.recv()
+    return s.recv(1024)
+
 # Load the initial playlist into a list in memory.
  
 def load_playlist(pfile):
@@ -126,7 +176,7 @@ def load_playlist(pfile):
         log_message = 'load_playlist: ' + pll + ' songs loaded to playlist.'
         debug(log_message)
     except IOError:
-        debug('load_playlist: WARNING: I/O Error when attempting to load playlist.  No songs loaded.')
+        warning('load_playlist: I/O Error when attempting to load playlist.  No songs loaded.')
         
     return a
 
@@ -268,10 +318,18 @@ def volume(vol):
 
 def lcdcom(lcd_command):
     global s
-    lcd_command = config_data['mp3_module']['lcdout_mod'] + ': ' + string.strip(lcd_command) + '\n'
+    lcd_module = config_data['mp3_module']['lcdout_mod']
+    lcd_command = string.strip(lcd_command) + '\n'
     log_message = 'lcdcom: data to be sent: ' + string.strip(lcd_command)
     debug(log_message)
-    send_to_socket(lcd_command)
+    if (channels != None):
+        # This runs in the player thread as well as the main one, so the
+        # channel, or the EDS while there isn't one, is left to channels.send().
+        # Ask for a channel now and then, while there isn't one.
+        channels.request(lcd_module, channel_retry)
+        if (channels.send(lcd_module, lcd_command) == 1):
+            return
+    send_to_socket(lcd_module + ': ' + lcd_command)
             
 # Startup initialization of the LCD screen.
 # - Clear screen, return cursor to 0 0
@@ -532,7 +590,7 @@ def send_to_socket(data):
 	    debug('send_to_socket: data sent to server.')
 	    send_success = 1
 	except socket.error:
-	    debug('send_to_socket: WARNING: Couldn\'t send command to server.  Reinitializing network link.')
+	    warning('send_to_socket: Couldn\'t send command to server.  Reinitializing network link.')
 	    s.close()
 	    s = network_init()
 	    draw_init()
@@ -664,7 +722,7 @@ def event_handler():
     
     while 1:
 
-            q = s.recv(1024)
+            q = receive()
             c = string.strip(q)
             
             debug ('event_loop: got incoming data.')
@@ -946,7 +1004,7 @@ def event_handler():
                                 send_to_socket(say_text)
                             
                             except:
-                                debug('process_cmd: WARNING: Error loading or locating requested playlist.')
+                                warning('process_cmd: Error loading or locating requested playlist.')
                                 send_to_socket('speechio_module: speech_out: An error occured when trying \
                                 to load the playlist you requested.\n')
                             
@@ -962,12 +1020,18 @@ config_options = [('mp3_module', 'debug_flag', 'b'), \
                   ('mp3_module', 'log_file', 's'), \
                   ('mp3_module', 'eds_port', 'i'), \
                   ('mp3_module', 'eds_host', 's'), \
+                  ('eds', 'unix_socket_dir', 's', ''), \
                   ('mp3_module', 'speech_feedback', 'i'), \
                   ('mp3_module', 'lcdout_mod', 's'), \
+                  ('mp3_module', 'lcd_channel', 'b', 0), \
                   ('mp3_module', 'init_volume', 'i'),\
                   ('mp3_module', 'mp3_playlist', 's'), \
                   ('mp3_module', 'mp3_player_app', 's'), \
-                  ('mp3_module', 'mixer_app', 's')]
+                  ('mp3_module', 'mixer_app', 's'), \
+                  ('logging', 'log_level', 's', 'debug'), \
+                  ('logging', 'ring_level', 's', 'warning'), \
+                  ('logging', 'ring_size', 'i', 1000), \
+                  ('logging', 'flush_interval', 'f', 0.5)]
 
 # Config file to use:
 config_fn = 'Config/alice.config'
@@ -975,24 +1039,39 @@ log_message = 'init: Using config file ' + config_fn
 print log_message
 
 # Get configuration information
+# Logger behind debug(), warning() and critical().  Messages logged before it's
+# configured, below, are only kept in memory.
+logger = turbolog.Logger('mp3_module')
+
 config_data = set_configs(config_fn, config_options)
 
 
-# Open a log file, if this feature has been enabled.
+# Start logging, to the console and log file as configured.  Until now, messages
+# have only been kept in memory.  Sending the process a SIGUSR1 writes out the
+# most recent messages, whatever their level.
 print 'init: Opening log file.'
+log_file = None
 if (config_data['mp3_module']['log_messages'] == 1):
-    try:
-        log_fd = open(config_data['mp3_module']['log_file'], 'a')
-    except IOError:
-        log_message = 'init: WARNING: Unable to open log file at ' + config_data['mp3_module']['log_file']
-        print log_message
-        print 'init: WARNING: Logging will occur to console only.'
-        config_data['mp3_module']['log_messages']  = 0
+    log_file = config_data['mp3_module']['log_file']
+log_sec = config_data['logging']
+if (logger.configure(config_data['mp3_module']['debug_flag'], log_file,
+                     turbolog.level_value(log_sec['log_level']),
+                     turbolog.level_value(log_sec['ring_level']),
+                     log_sec['ring_size'], log_sec['flush_interval']) == 0):
+    log_message = 'init: WARNING: Unable to open log file at ' + log_file
+    print log_message
+    print 'init: WARNING: Logging will occur to console only.'
+    config_data['mp3_module']['log_messages']  = 0
+turbolog.dump_on_signal(logger)
 
 # debug() log function usable below this point.
 
 # Start networking and return a socket object.
 debug('init: Connecting to event distribution server.')
+# Seconds to wait between requests for a direct channel to the LCD module (see
+# start_channel()), while there isn't one.
+channel_retry = 10.0
+channels = None
 s = network_init()
 
 # Load playlist
@@ -30,7 +30,7 @@ Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
 
 
-import sys, socket, select, string, time, re, ConfigParser
+import sys, os, socket, select, string, time, errno, bisect, heapq, signal, asyncore, collections, zlib, pickle, ConfigParser
 
 # Set configurations via ConfigParser for the module.
 # Options list is a list of options to return.  Each item in the list is a tuple in the form:
@@ -40,6 +40,8 @@ import sys, socket, select, string, time, re, ConfigParser
 # b = boolean
 # f = float
 # s = string
+# An optional fourth item in the tuple gives a default value, used when the option
+# isn't present in the config file.  Options without a default must be present.
 # The function returns a hash table that has as its top level keys section names, which have nested
 # hash tables as their values.  These nested hash tables have section option names as keys, and the
 # respective section option values as values.
@@ -69,6 +71,10 @@ def set_configs(module_config, options):
                 # config file option loader, there's probably not much chance that the info we need
                 # to use this function is available.
                 print log_message
+            # Fall back on the default value if one was given, and the option is missing.
+            if (len(options[i]) > 3 and module_config.has_option(c_section, c_option) == 0):
+                config_core[c_section][c_option] = options[i][3]
+                continue
             # Extract data from config into hash table, doing appropriate coercions based on c_coerce flag.
             if (c_coerce == 'i'):
                 config_core[c_section][c_option] = module_config.getint(c_section, c_option)
@@ -103,103 +109,3453 @@ def grab_section_optlist(module_config, section):
     avail_opts = module_config.options(section)
     return avail_opts
     
-# Log output function.
-# Take a log message, prepend a timestamp and generating module name, and
-# write to console, log file, or both, depending on configuration file
-# options.
-# Input: log message text
+# Log output functions.  Messages go through the shared logger in
+# Modules/turbolog.py, which only formats them if their level is enabled, and
+# writes them to the console and log file from a background thread.  Extra
+# arguments are formatted into msg with the % operator, so pass them rather
+# than building the string first: debug('fd %d ready', fd).
+# Input: log message text, and any arguments for it.
 # Output: None.
 
-def debug(msg):
-    msg = '[' + str(time.ctime(time.time())) + '] ' + 'eds' + ': ' + msg + '\n'
-    if (config_data['eds']['debug_flag'] == 1):
-        print string.strip(msg)
-    if (config_data['eds']['log_messages'] == 1):
-        log_fd.write(msg)
-        log_fd.flush()
+def debug(msg, *args):
+    logger.log(turbolog.DEBUG, msg, args)
+
+def info(msg, *args):
+    logger.log(turbolog.INFO, msg, args)
+
+def warning(msg, *args):
+    logger.log(turbolog.WARNING, msg, args)
+
+def critical(msg, *args):
+    logger.log(turbolog.CRITICAL, msg, args)
 
 # Route incoming data, based on the service definition provided by the client.
-# Incoming data takes the form of a string: 'service_name: data for service' (no quotes)
+# Incoming data takes the form of a string: 'service_name: data for service' (no quotes),
+# which read_messages() has already split into the service name and the data.
+# The name can be a registered service, a topic that modules have subscribed to (see
+# subscribe(), below), or both.  The data goes to the service, and to every
+# subscriber of the topic.  Messages for the EDS itself (service name 'eds') are
+# handled by eds_command().
 # Input data to function:
-# indata = incoming data (see above for format)
-# returns: Nothing.  This function sends the input data to the appropriate output socket.
-
-def route_data(indata):
-    data_sep = re.compile("([^ ]*): (.*)")
-    if (data_sep.search(indata) != None):
-        # If the input data matches the general format described in the comment
-        # above this function, break it out into a service name, which'll determine
-        # how it's routed, and extract the actual data to be routed.
-        # Oh, and strip any \r\n stuff that's arrived in transit.
+# src_conn = connection record of the module that sent the data
+# s_name = service name the data is for
+# s_data = the data for the service, newline included.  This is usually a memoryview
+# into the sending connection's receive buffer, which gets queued as-is.
+# returns: Nothing.  This function queues the input data on the appropriate output sockets.
+
+def route_data(src_conn, s_name, s_data):
+    src_conn['msgs_in'] = src_conn['msgs_in'] + 1
+    src_conn['bytes_in'] = src_conn['bytes_in'] + len(s_data)
+    if (capture != None):
+        capture.write(pass_time, 0, src_conn['service'], s_name, s_data[:-1])
+
+    # A '^' in front of the service name sends the message in the priority lane of
+    # the destination's queue, as do the commands listed for the service in the
+    # [priority] section.  See queue_data(), below.
+    priority = 0
+    if (s_name[:1] == '^'):
+        s_name = s_name[1:]
+        priority = 1
+    elif (priority_rules.has_key(s_name)):
+        priority = command_priority(s_name, s_data)
+
+    # A connection that has already been removed (see remove_connection()) has
+    # nothing left for a command to act on, and registering a service would take
+    # it away from a live connection.
+    if (s_name == eds_service):
+        if (conn_table.get(src_conn['fd']) is src_conn):
+            eds_command(src_conn, string.strip(str(s_data.tobytes())))
+        return
+
+    # Requests carrying a correlation ID get their reply address filled in, and are
+    # answered with a NACK if they can't be delivered.  See correlate(), below.
+    corr_id = None
+    if (s_data[0] == '?'):
+        corr_id, s_data = correlate(src_conn, s_data)
+        if (corr_id != None and s_data == None):
+            send_nack(src_conn, corr_id, 'not_registered', s_name)
+            return
+
+    # Durable messages are written to the journal, and wait until it's on disk
+    # before they're routed (see commit_journal(), below).
+    durable = 0
+    if (journal != None and durable_rules.has_key(s_name)):
+        durable = command_durable(s_name, s_data)
+    if (durable == 1 or src_conn['parked'] > 0):
+        park_message(src_conn, s_name, s_data, corr_id, priority, durable)
+        return
+
+    dispatch_message(src_conn, s_name, s_data, corr_id, priority)
+
+# Deliver a message to the service it's for, and to the subscribers of its name.
+# In sharded mode (see shard_of(), below), a message read from a module for a
+# service that belongs to another worker is passed to that worker instead, and
+# copies go to any other workers with subscribers of their own.  A message that
+# came over a shard link is only delivered here: to the service, if this worker
+# owns it, and to this worker's subscribers.  Likewise, a message for a service
+# with no connections here that's up on another node (see peer_up(), below) is
+# passed to that node, and so are copies for the nodes with subscribers, but a
+# message that came from another node is only delivered to this node's modules.
+# Input: src_conn, the connection record the message came from (a shard link for
+# messages from other workers, or a peer link for messages from other nodes).  s_name, the service or topic name.  s_data, the
+# data, newline included.  corr_id, the correlation ID of a request, or None.
+# priority, 1 for a priority message.  entry, the message's journal entry if it's
+# durable, or None.
+# Output: None.
+
+def dispatch_message(src_conn, s_name, s_data, corr_id, priority, entry=None):
+    # Every subscriber gets the same data object queued, so a message to a topic
+    # with any number of subscribers is held in memory once.
+    subscribers = topic_subscribers(s_name)
+    owner = shard_id
+    if (shard_count > 1):
+        owner = shard_of(s_name)
+
+    # Look up the connected sockets for the service in service_table.  Each
+    # service has an entry, created when its listener was started, or when a
+    # module first registered it through the registration port, holding the file
+    # descriptors of its connections, oldest (lowest generation) first.
+    # Messages for a service that isn't connected yet are held until it is (see
+    # hold_message(), below).  So are messages for a name nobody has registered
+    # yet, as long as modules can still register it through the registration port.
+    # Requests aren't held, though: their senders get a NACK straight away instead.
+    if (owner != shard_id):
+        # Messages from other workers are only here for this worker's subscribers.
+        if (src_conn['type'] != 4):
+            send_shard(shard_links[owner], src_conn, s_name, s_data, corr_id, priority)
+        dest_fd = None
+
+    elif (peer_services.has_key(s_name) and src_conn['type'] != 8 and len(service_table.get(s_name, ())) == 0):
+        link = peer_services[s_name]
+        send_shard(link, src_conn, s_name, s_data, corr_id, priority, entry)
+        dest_fd = link['fd']
+
+    elif (service_table.has_key(s_name) == 0):
+        if (len(subscribers) == 0):
+            if (corr_id != None):
+                send_nack(src_conn, corr_id, 'unknown_service', s_name)
+            elif (config_data['eds']['register_port'] != 0 and '/' not in s_name):
+                hold_message(s_name, s_data, src_conn, priority, entry)
+            else:
+                log_message = 'dispatch_message: No service or subscribed topic by name of ' + s_name + '!'
+                warning(log_message)
+        dest_fd = None
+
+    elif (len(service_table[s_name]) == 0):
+        if (corr_id != None):
+            send_nack(src_conn, corr_id, 'not_connected', s_name)
+        else:
+            hold_message(s_name, s_data, src_conn, priority, entry)
+        dest_fd = None
+
+    else:
+        # Pick one of the service's connections, according to its dispatch policy.
+        dest_fd = pick_instance(s_name)
+        if (deliver_data(conn_table[dest_fd], s_data, src_conn, priority, entry) == 0 and corr_id != None):
+            send_nack(src_conn, corr_id, 'queue_full', s_name)
+
+    for sub_fd in subscribers:
+        # A service subscribed to a topic of its own name only gets one copy.
+        if (sub_fd == dest_fd):
+            continue
+        sub_conn = conn_table[sub_fd]
+        if (sub_conn['type'] == 8):
+            if (src_conn['type'] != 8):
+                send_shard(sub_conn, src_conn, s_name, s_data, None, priority, entry)
+        elif (sub_conn['type'] != 4):
+            deliver_data(sub_conn, s_data, src_conn, priority, entry)
+        # Subscribers on other workers get their copy from the worker that read the
+        # message, unless it's already gone to their worker for the service.
+        elif (src_conn['type'] != 4 and sub_conn['shard'] != owner):
+            send_shard(sub_conn, src_conn, s_name, s_data, None, priority)
+
+# Priority rules.  The [priority] section of the config file holds
+# service_name = command command ... lines, listing the commands that jump the
+# queue for the service, such as stop_play for mp3_module.  A message's command
+# is the first word of its data, after the correlation ID of a request.
+# Input: s_name, a service name with rules.  s_data, the data sent to it.
+# Output: 1 if the data is a priority command, 0 if not.
+
+def command_priority(s_name, s_data):
+    if (priority_rules[s_name].has_key(message_command(s_data))):
+        return 1
+    return 0
+
+# Durable rules.  The [durable] section of the config file lists the commands for
+# each service that are journalled (see park_message(), below) in the same way, or
+# '*' for all of them.
+# Input: s_name, a service name with rules.  s_data, the data sent to it.
+# Output: 1 if the data is a durable command, 0 if not.
+
+def command_durable(s_name, s_data):
+    rules = durable_rules[s_name]
+    if (rules.has_key('*') or rules.has_key(message_command(s_data))):
+        return 1
+    return 0
+
+# Find the command in a message: the first word of its data, after the
+# correlation ID of a request.
+# Input: s_data, the data.
+# Output: the command, or an empty string if the data is blank.
+
+def message_command(s_data):
+    if (type(s_data) == memoryview):
+        s_data = s_data.tobytes()
+    words = string.split(s_data, None, 2)
+    if (len(words) > 1 and words[0][:1] == '?'):
+        del words[0]
+    if (len(words) == 0):
+        return ''
+    return words[0]
+
+# Request/response correlation.  A module that wants a reply to a message puts a
+# correlation ID of its choosing, marked with a '?', at the start of the data:
+#   info_module: ?17 get_channel salon
+# The EDS inserts the sender's service name after the ID, so the destination
+# receives '?17 mp3_module get_channel salon', and knows where to reply to.  The
+# reply goes back as an ordinary message, with the ID marked with a '=':
+#   mp3_module: =17 data for the reply
+# If the request can't be delivered, the EDS sends a NACK back to the sender
+# straight away, with the ID marked with a '!', and the reason and service name:
+#   !17 not_connected info_module
+# Reasons are unknown_service, not_connected, queue_full, and not_registered (the
+# sender has no service name to reply to).  Modules/eds_rpc.py has a helper for
+# clients.  Messages without a correlation ID are routed as before.
+
+# Fill in the reply address of a correlated request.
+# Input: src_conn, the sending connection record.  s_data, the request data, which
+# starts with '?'.
+# Output: a tuple of the correlation ID and the data to deliver, with the sender's
+# service name inserted.  The data is None if the sender has no service name.  The
+# ID is None if the data doesn't hold one, and the data is then returned as it is.
+
+def correlate(src_conn, s_data):
+    request = s_data.tobytes()
+    sep = request.find(' ')
+    if (sep < 0):
+        sep = len(request) - 1
+    corr_id = request[1:sep]
+    if (corr_id == ''):
+        return (None, s_data)
+    if (src_conn['service'] == ''):
+        return (corr_id, None)
+    return (corr_id, request[:sep] + ' ' + src_conn['service'] + request[sep:])
+
+# Send a NACK for a correlated request back to its sender.
+# Input: src_conn, the sending connection record.  corr_id, the request's correlation
+# ID.  reason, why it couldn't be delivered.  s_name, the service it was sent to.
+# Output: None.
+
+def send_nack(src_conn, corr_id, reason, s_name):
+    service_stats_for(s_name)['nacks'] = service_stats_for(s_name)['nacks'] + 1
+    log_message = 'send_nack: Request ' + corr_id + ' from ' + src_conn['service'] + ' to ' + s_name + ' failed: ' + reason
+    debug(log_message)
+    nack = '!' + corr_id + ' ' + reason + ' ' + s_name + '\n'
+    if (src_conn['type'] == 4 or src_conn['type'] == 8):
+        # The request came from another worker, or node.  The NACK goes back
+        # there, to the requesting service.
+        send_shard(src_conn, None, src_conn['service'], nack, None, 0)
+    else:
+        deliver_data(src_conn, nack, None)
+
+# Store-and-forward.  Messages for a service with no connections are held in
+# held_table, which maps the service name to a deque of [expiry time, data,
+# source connection record, priority, journal entry] lists, oldest first.  When a
+# connection for the service arrives, forward_held() delivers them to it in
+# order, so modules can start up in any order, or restart, without losing
+# commands sent meanwhile.  Each service holds at most pending_max_messages
+# messages (the oldest are dropped to make room), and each message for at most
+# pending_ttl seconds.
+
+# Hold a message for a service that isn't connected.  The data is copied out of
+# the receive buffer, which gets reused by the next read.
+# Input: s_name, the service name.  s_data, the data, newline included.  src_conn,
+# the connection record the data came from.  priority, 1 for a priority message.
+# entry, the message's journal entry if it's durable, or None.
+# Output: None.
+
+def hold_message(s_name, s_data, src_conn, priority=0, entry=None):
+    max_held = config_data['eds']['pending_max_messages']
+    if (max_held <= 0):
+        log_message = 'route_data: No connections found for service: ' + s_name
+        warning(log_message)
+        return
+    if (held_table.has_key(s_name) == 0):
+        held_table[s_name] = collections.deque()
+    held = held_table[s_name]
+    stats = service_stats_for(s_name)
+    stats['held'] = stats['held'] + 1
+    if (len(held) >= max_held):
+        dropped = held.popleft()
+        stats['drops'] = stats['drops'] + 1
+        log_message = 'hold_message: Pending queue for ' + s_name + ' full.  Dropped oldest message.'
+        warning(log_message)
+        if (dropped[4] != None):
+            release_entry(dropped[4])
+    held.append([time.time() + config_data['eds']['pending_ttl'], s_data.tobytes(), src_conn, priority, entry])
+    if (entry != None):
+        take_entry(entry)
+    if (held_timer == None):
+        expire_held_timer(config_data['eds']['pending_ttl'])
+    if (debug_enabled == 1):
+        log_message = 'hold_message: ' + s_name + ' not connected.  Holding message (' + str(len(held)) + ' pending).'
+        debug(log_message)
+
+# Deliver a service's held messages, once it has a connection.
+# Input: s_name, a service name with at least one connection.
+# Output: None.
+
+def forward_held(s_name):
+    if (held_table.has_key(s_name) == 0):
+        return
+    held = held_table[s_name]
+    del held_table[s_name]
+    log_message = 'forward_held: Forwarding ' + str(len(held)) + ' held messages to ' + s_name + '.'
+    debug(log_message)
+    now = time.time()
+    for expiry, data, src_conn, priority, entry in held:
+        if (expiry < now):
+            if (entry != None):
+                release_entry(entry)
+            continue
+        # Backpressure only applies if the sender is still connected.
+        if (conn_table.get(src_conn['fd']) is not src_conn):
+            src_conn = None
+        deliver_data(conn_table[pick_instance(s_name)], data, src_conn, priority, entry)
+        if (entry != None):
+            release_entry(entry)
+
+# Start (or restart) the timer that expires held messages.
+# Input: delay, the number of seconds until the next held message expires, or None
+# if no messages are held.
+# Output: None.
+
+def expire_held_timer(delay):
+    global held_timer
+    held_timer = None
+    if (delay != None):
+        held_timer = call_later(delay, expire_held_timer_fired)
+
+def expire_held_timer_fired():
+    expire_held_timer(expire_held())
+
+# Drop held messages whose time to live has run out.
+# Input: None.
+# Output: The number of seconds until the next held message expires, or None if no
+# messages are held.
+
+def expire_held():
+    now = time.time()
+    next_expiry = None
+    for s_name in held_table.keys():
+        held = held_table[s_name]
+        expired = 0
+        while (len(held) > 0 and held[0][0] < now):
+            dropped = held.popleft()
+            expired = expired + 1
+            if (dropped[4] != None):
+                release_entry(dropped[4])
+        if (expired > 0):
+            stats = service_stats_for(s_name)
+            stats['drops'] = stats['drops'] + expired
+            log_message = 'expire_held: ' + str(expired) + ' held messages for ' + s_name + ' expired.'
+            warning(log_message)
+        if (len(held) == 0):
+            del held_table[s_name]
+        elif (next_expiry == None or held[0][0] < next_expiry):
+            next_expiry = held[0][0]
+    if (next_expiry == None):
+        return None
+    return max(next_expiry - now, 0)
+
+# Durable messages.  With journal_file set in the [eds] section, messages listed
+# in the [durable] section of the config file are written to a journal (see
+# Modules/eds_journal.py) before they're routed, so a crash of the EDS can't lose
+# them.  Rather than syncing the journal to disk for each message, messages wait
+# (parked, in journal_parked) until the next commit, every journal_interval
+# seconds, which syncs all of them at once, and then routes them.  Messages from
+# a module with a durable message waiting wait behind it, so nothing overtakes it.
+# A journalled message (an entry) is acknowledged in the journal once it has been
+# sent to every connection it was queued for, or once the EDS has given up on it
+# (dropped from a full queue, expired while held, or undeliverable).  A durable
+# message queued for a connection that closes before it's sent is held for its
+# service again, so it may arrive twice, but it won't go missing.  When the EDS
+# starts, entries that were never acknowledged are routed again.  journal_refs
+# counts the places each entry is waiting (connection queues, held messages, and
+# messages being routed), keyed by entry number; when the count drops to 0, the
+# entry is acknowledged.  A connection keeps the entries queued on it in
+# conn['entries'], as [mark, entry] pairs: the message has been sent once
+# conn['wdone'], the number of messages taken off the front of its queue, reaches
+# mark.  The journal is compacted once it's bigger than journal_compact_bytes,
+# and less than half of it is unacknowledged entries.
+
+# Write a durable message to the journal, and park it until the next commit.  Other
+# messages from a module with messages parked are parked behind them, without
+# being journalled.
+# Input: src_conn, the connection record the message came from.  s_name, the
+# service name.  s_data, the data, newline included.  corr_id, the correlation ID
+# of a request, or None.  priority, 1 for a priority message.  durable, 1 to
+# journal the message.
+# Output: None.
+
+def park_message(src_conn, s_name, s_data, corr_id, priority, durable):
+    if (type(s_data) == memoryview):
+        s_data = s_data.tobytes()
+    entry = None
+    if (durable == 1):
+        entry = journal.append(src_conn['service'], s_name, s_data, priority)
+        take_entry(entry)
+    journal_parked.append((src_conn, s_name, s_data, corr_id, priority, entry))
+    src_conn['parked'] = src_conn['parked'] + 1
+    schedule_commit()
+
+# Make sure a commit is due within journal_interval seconds.
+# No input, no output.
+
+def schedule_commit():
+    global journal_timer
+    if (journal_timer == None):
+        journal_timer = call_later(config_data['eds']['journal_interval'], commit_journal)
+
+# Commit the journal: write out and sync everything added to it since the last
+# commit, then route the parked messages, and compact the journal if it's time.
+# Runs on a timer (see schedule_commit()).
+# No input, no output.
+
+def commit_journal():
+    global journal_timer
+    if (journal_timer != None):
+        cancel_timer(journal_timer)
+        journal_timer = None
+    try:
+        journal.commit()
+        if (journal.size > config_data['eds']['journal_compact_bytes'] and journal.live_bytes < journal.size / 2):
+            old_size = journal.size
+            journal.compact()
+            log_message = 'commit_journal: Compacted the journal from ' + str(old_size) + ' to ' + str(journal.size) + ' bytes.'
+            debug(log_message)
+    except (IOError, OSError), exc:
+        log_message = 'commit_journal: Unable to write the journal (' + str(exc) + ').  Messages are not durable.'
+        critical(log_message)
+
+    parked = journal_parked[:]
+    del journal_parked[:]
+    for src_conn, s_name, s_data, corr_id, priority, entry in parked:
+        src_conn['parked'] = src_conn['parked'] - 1
+        if (conn_table.get(src_conn['fd']) is not src_conn):
+            # The sender has gone.  Nobody's left to answer a NACK.
+            src_conn = gone_source(src_conn['service'])
+            corr_id = None
+        dispatch_message(src_conn, s_name, memoryview(s_data), corr_id, priority, entry)
+        if (entry != None):
+            release_entry(entry)
+    flush_pending()
+
+# Count another place a journal entry is waiting.
+# Input: entry, the entry number.
+# Output: None.
+
+def take_entry(entry):
+    journal_refs[entry] = journal_refs.get(entry, 0) + 1
+
+# Count one place fewer that a journal entry is waiting, and acknowledge it if it's
+# no longer waiting anywhere.
+# Input: entry, the entry number.
+# Output: None.
+
+def release_entry(entry):
+    count = journal_refs[entry] - 1
+    if (count > 0):
+        journal_refs[entry] = count
+        return
+    del journal_refs[entry]
+    journal.ack(entry)
+    schedule_commit()
+
+# Note a journal entry as waiting in a connection's queue, for the message just
+# queued on it.
+# Input: conn, a connection record.  entry, the entry number.  priority, 1 if the
+# message went into the priority lane.
+# Output: None.
+
+def add_entry(conn, entry, priority):
+    take_entry(entry)
+    if (priority == 1):
+        conn['entries'].append([conn['wdone'] + conn['urgent'], entry])
+    else:
+        conn['entries'].append([conn['wdone'] + len(conn['wqueue']), entry])
+
+# Release the journal entries queued on a connection.
+# Input: conn, a connection record.
+# Output: None.
+
+def release_entries(conn):
+    entries = conn['entries']
+    conn['entries'] = []
+    for mark, entry in entries:
+        release_entry(entry)
+
+# Release the journal entries of the messages a connection has finished sending.
+# Input: conn, a connection record.
+# Output: None.
+
+def release_sent(conn):
+    waiting = []
+    for pair in conn['entries']:
+        if (pair[0] <= conn['wdone']):
+            release_entry(pair[1])
+        else:
+            waiting.append(pair)
+    conn['entries'] = waiting
+
+# Keep the marks of a connection's journal entries right when messages are put into,
+# or taken out of, the middle of its queue.  The entries of messages taken out are
+# released.
+# Input: conn, a connection record.  place, the number of messages in front of the
+# change.  count, the number of messages put in, or minus the number taken out.
+# Output: None.
+
+def shift_entries(conn, place, count):
+    waiting = []
+    for pair in conn['entries']:
+        position = pair[0] - conn['wdone']
+        if (position <= place):
+            waiting.append(pair)
+        elif (position <= place - count):
+            release_entry(pair[1])
+        else:
+            pair[0] = pair[0] + count
+            waiting.append(pair)
+    conn['entries'] = waiting
+
+# Hold the durable messages queued on a connection that's closing, so they're sent
+# again once their service has a connection.
+# Input: conn, a connection record.
+# Output: None.
+
+def requeue_entries(conn):
+    log_message = 'requeue_entries: Holding ' + str(len(conn['entries'])) + ' unsent durable messages for ' + conn['service'] + ' again.'
+    warning(log_message)
+    for mark, entry in conn['entries']:
+        source, dest, data, priority = journal.message(entry)
+        hold_message(dest, memoryview(data), gone_source(source), priority, entry)
+    release_entries(conn)
+
+# Route the journal entries left unacknowledged by the last EDS to run, other than
+# any it handed over (see take_over()).  Their services aren't connected yet, so
+# most are held until they are.
+# No input, no output.
+
+def replay_journal():
+    count = 0
+    for entry, source, dest, data, priority in journal.entries():
+        if (journal_refs.has_key(entry)):
+            continue
+        take_entry(entry)
+        dispatch_message(gone_source(source), dest, memoryview(data), None, priority, entry)
+        release_entry(entry)
+        count = count + 1
+    if (count > 0):
+        log_message = 'replay_journal: Routing ' + str(count) + ' durable messages left over from the last run.'
+        info(log_message)
+
+# Stand in for a module that isn't connected, as the sender of a message.
+# Input: service, its service name.
+# Output: a connection record that's not in conn_table.
+
+def gone_source(service):
+    return {'fd': None, 'type': 1, 'service': service}
+
+# Look up the dispatch policy for a service.  The [dispatch_policy] section of the
+# config file holds service_name = policy lines, where policy is one of:
+# single - everything goes to the newest connection (default).  A module that
+# reconnects takes over from its old socket straight away.
+# round_robin - messages go to each connection in turn.
+# least_outstanding - messages go to the connection with the fewest messages
+# still queued in the EDS.
+# Input: service name.
+# Output: policy name.
+
+def dispatch_policy(service):
+    try:
+        return config_data[dispatch_sec][service]
+    except KeyError:
+        return config_data['eds']['dispatch_policy']
+
+# Pick the connection of a service that a message should be delivered to.  This
+# lets several instances of a slow module (worker processes) share its work.
+# Input: s_name, a service name with at least one connection.
+# Output: a file descriptor number.
+
+def pick_instance(s_name):
+    service_fds = service_table[s_name]
+    if (len(service_fds) == 1):
+        return service_fds[0]
+
+    policy = dispatch_policy(s_name)
+    if (policy == 'round_robin'):
+        next_index = service_rr.get(s_name, 0) % len(service_fds)
+        service_rr[s_name] = next_index + 1
+        return service_fds[next_index]
+
+    if (policy == 'least_outstanding'):
+        best_fd = service_fds[0]
+        for fd in service_fds:
+            if (len(conn_table[fd]['wqueue']) < len(conn_table[best_fd]['wqueue'])):
+                best_fd = fd
+        return best_fd
+
+    # single: the newest connection.
+    return service_fds[-1]
+
+# A newly accepted connection for a single instance service replaces the service's
+# older connections, which most likely belong to a module that's since reconnected.
+# Messages still waiting in their queues (apart from one that's partly written) are
+# moved across to the new connection, in order, so nothing is lost or reordered by
+# the switch.  Moved messages that are still views into a receive buffer are
+# copied, since they end up behind whatever the new connection has queued, out of
+# the tail that release_views() copies.  The old sockets are left open until their
+# module closes them.
+# Input: new_conn, the new connection record.  replaced, the one connection to take
+# over from, or None for all the service's other connections.
+# Output: None.
+
+def take_over_service(new_conn, replaced=None):
+    for fd in service_table[new_conn['service']]:
+        old_conn = conn_table[fd]
+        if (old_conn is new_conn or len(old_conn['wqueue']) == 0):
+            continue
+        if (replaced != None and old_conn is not replaced):
+            continue
+        if (old_conn['frame_out'] != new_conn['frame_out']):
+            # Lines can't be moved to a framed connection, or frames to a text
+            # one.  Modules that use frames should register before switching.
+            log_message = 'take_over_service: ' + new_conn['service'] + ' generation ' + str(old_conn['gen']) + ' uses a different framing.  Its queued messages stay with it.'
+            warning(log_message)
+            continue
+        keep = []
+        if (old_conn['woffset'] > 0):
+            keep.append(old_conn['wqueue'].popleft())
+        moved = len(old_conn['wqueue'])
+        # The journal entries of durable messages go with them.
+        waiting = []
+        for pair in old_conn['entries']:
+            position = pair[0] - old_conn['wdone']
+            if (position <= len(keep)):
+                waiting.append(pair)
+            else:
+                new_conn['entries'].append([new_conn['wdone'] + len(new_conn['wqueue']) + position - len(keep), pair[1]])
+        old_conn['entries'] = waiting
+        if (len(new_conn['wqueue']) == 0):
+            new_conn['wtime'] = old_conn['wtime']
+        while (len(old_conn['wqueue']) > 0):
+            message = old_conn['wqueue'].popleft()
+            old_conn['wbytes'] = old_conn['wbytes'] - len(message)
+            if (type(message) == memoryview):
+                message = message.tobytes()
+            new_conn['wqueue'].append(message)
+            new_conn['wbytes'] = new_conn['wbytes'] + len(message)
+        for message in keep:
+            old_conn['wqueue'].append(message)
+        # Moved messages join the new connection's queue behind its own, so any
+        # that were in the priority lane lose their place in it.
+        old_conn['urgent'] = min(old_conn['urgent'], len(keep))
+        old_conn['views'] = 0
+        update_interest(old_conn)
+        flush_table[new_conn['fd']] = new_conn
+        log_message = 'take_over_service: Moved ' + str(moved) + ' queued messages from ' + new_conn['service'] + ' generation ' + str(old_conn['gen']) + ' to generation ' + str(new_conn['gen']) + '.'
+        debug(log_message)
+
+# Queue data on a destination connection, and mark the connection for flushing.
+# Everything delivered to it during this pass of the event loop goes out together
+# in one send() once the pass is over (see flush_pending()).
+# Input: conn, the destination connection record.  s_data, the data, newline
+# included.  src_conn, the connection record the data came from, or None.
+# priority, 1 to queue the data in the priority lane.  entry, the message's journal
+# entry if it's durable, or None.  It stays unacknowledged until the message has
+# been sent.
+# Output: 1 if the data was queued, 0 if it was dropped because the queue was full.
+
+def deliver_data(conn, s_data, src_conn, priority=0, entry=None):
+    if (src_conn == None):
+        src_name = eds_service
+    else:
+        src_name = src_conn['service']
+    if (conn['frame_out'] == 1):
+        s_data = frame_message(s_data, src_name, priority)
+        if (s_data == None):
+            log_message = 'deliver_data: Message from ' + src_name + ' has a field too long for a frame.  Dropping it.'
+            warning(log_message)
+            return 0
+    if (debug_enabled == 1):
+        log_message = 'deliver_data: Routing ' + str(len(s_data)) + ' bytes from ' + src_name + ' to ' + conn['service'] + ' (fd ' + str(conn['fd']) + ').'
+        debug(log_message)
+    if (queue_data(conn, s_data, src_conn, priority) == 1):
+        flush_table[conn['fd']] = conn
+        if (entry != None):
+            add_entry(conn, entry, priority)
+        return 1
+    return 0
+
+# Handle a command sent to the EDS itself, as 'eds: command [arguments]'.
+# Commands are:
+# register service [instance] - attach a connection from the registration port to
+# a service (see register_service(), below)
+# subscribe topic - deliver messages sent to topic to this connection
+# unsubscribe topic - stop delivering messages sent to topic to this connection
+# stats [service] - send traffic statistics back to this connection (see send_stats())
+# log [count] - send the most recent log messages back to this connection
+# framing - switch this connection to frames (see split_frames())
+# channel service - open a direct channel to service (see open_channel())
+# channel_accept - let other modules open direct channels to this connection
+# channel_mark service id - everything for service before this came through the EDS
+# channel_close service id - the direct channel to service has closed
+# Input: conn, the connection record the command came from.  command, the command.
+# Output: None.
+
+def eds_command(conn, command):
+    args = string.split(command)
+    if (len(args) == 0):
+        return
+    log_message = 'eds_command: ' + command + ' from ' + conn['service'] + ' (fd ' + str(conn['fd']) + ')'
+    debug(log_message)
+
+    if (args[0] == 'register' and (len(args) == 2 or len(args) == 3)):
+        register_service(conn, args[1], string.join(args[2:], ''))
+    elif (args[0] == 'subscribe' and len(args) == 2):
+        subscribe(conn, args[1])
+    elif (args[0] == 'unsubscribe' and len(args) == 2):
+        unsubscribe(conn, args[1])
+    elif (args[0] == 'stats' and len(args) <= 2):
+        send_stats(conn, string.join(args[1:], ''))
+    elif (args[0] == 'log' and len(args) <= 2):
+        send_log(conn, string.join(args[1:], ''))
+    elif (args[0] == 'framing' and len(args) == 1):
+        if (conn['frame_out'] == 0):
+            # The answer is the last line the connection gets.  Everything
+            # after it is frames.
+            deliver_data(conn, eds_frame.FRAMING_REPLY, None)
+            conn['frame_out'] = 1
+    elif (args[0] == 'channel' and len(args) == 2):
+        open_channel(conn, args[1])
+    elif (args[0] == 'channel_accept' and len(args) == 1):
+        conn['channel_ok'] = 1
+    elif (args[0] == 'channel_mark' and len(args) == 3):
+        mark_channel(conn, args[1], args[2])
+    elif (args[0] == 'channel_close' and len(args) == 3):
+        close_channel(conn, args[1], args[2])
+    else:
+        log_message = 'eds_command: Unknown command (' + command + ') from ' + conn['service']
+        warning(log_message)
+
+# Send the log messages in the logger's ring buffer to a connection, oldest first,
+# in answer to 'eds: log [count]'.  Each line starts with 'log ', and a 'log end'
+# line ends the list.
+# Input: conn, the connection to send to.  count, the number of messages to send,
+# as a string, or an empty string for all of them.
+# Output: None.
+
+def send_log(conn, count):
+    try:
+        lines = logger.dump(int(count))
+    except ValueError:
+        lines = logger.dump()
+    out = []
+    for line in lines:
+        out.append('log ' + line + '\n')
+    out.append('log end\n')
+    deliver_data(conn, string.join(out, ''), None)
+
+# Attach a connection accepted on the registration port to a service.  Services
+# don't need to be listed in the [module_reg] section of the config file: the first
+# module to register a name creates it.  A module can give an instance id as well;
+# a new connection registering the same service and instance id replaces the old
+# one, which gets closed, and any messages still queued on it are moved across.
+# Without an instance id, the service's dispatch policy decides how messages are
+# shared out, as with connections to a service's own port.
+# Input: conn, a connection record.  service, the service name.  instance, the
+# instance id, or an empty string.
+# Output: None.
+
+def register_service(conn, service, instance):
+    if (conn['service'] != ''):
+        log_message = 'register_service: Connection on fd ' + str(conn['fd']) + ' is already registered as ' + conn['service'] + '.'
+        warning(log_message)
+        return
+    if (service == eds_service):
+        warning('register_service: Refusing to register the eds service name.')
+        return
+    if (shard_count > 1 and shard_of(service) != shard_id):
+        # The supervisor passed the connection to this worker for another service,
+        # or for none (see hand_off()).  The service's messages go to another worker.
+        log_message = 'register_service: ' + service + ' belongs to another shard.  Registration must be the first line sent in sharded mode.'
+        warning(log_message)
+        return
+
+    if (service_table.has_key(service) == 0):
+        service_table[service] = []
+        log_message = 'register_service: New service ' + service + ' created.'
+        debug(log_message)
+
+    # Find a stale connection for the same instance before adding the new one.
+    old_conn = None
+    if (instance != ''):
+        for fd in service_table[service]:
+            if (conn_table[fd]['instance'] == instance):
+                old_conn = conn_table[fd]
+
+    conn['service'] = service
+    conn['instance'] = instance
+    attach_service(conn)
+    log_message = 'register_service: fd ' + str(conn['fd']) + ' registered as ' + service + ' instance ' + repr(instance) + ', generation ' + str(conn['gen']) + '.'
+    debug(log_message)
+
+    if (old_conn != None):
+        take_over_service(conn, old_conn)
+        log_message = 'register_service: Replacing ' + service + ' instance ' + repr(instance) + ' generation ' + str(old_conn['gen']) + '.'
+        debug(log_message)
+        remove_connection(old_conn)
+    elif (dispatch_policy(service) == 'single'):
+        take_over_service(conn)
+
+# Topics are names made of levels separated by '/', like 'mp3/now_playing'.  A
+# subscription is either to a topic name, or to a pattern, in which '*' matches any
+# one level, and a final '#' matches any number of levels (including none):
+# 'mp3/*' matches 'mp3/now_playing', and 'system/#' matches 'system' and
+# 'system/shutdown/now'.  Exact subscriptions are kept in topic_subs, patterns in
+# pattern_subs.  Both map the topic or pattern to a hash table of subscribed file
+# descriptors.  The list of subscribers for each topic name that's been published
+# to is cached in topic_cache, which is cleared whenever a subscription changes.
+
+# Subscribe a connection to a topic or pattern.
+# Input: conn, a connection record.  topic, a topic name or pattern.
+# Output: None.
+
+def subscribe(conn, topic):
+    if (string.find(topic, '*') >= 0 or string.find(topic, '#') >= 0):
+        table = pattern_subs
+    else:
+        table = topic_subs
+    if (table.has_key(topic) == 0):
+        table[topic] = {}
+    if ((shard_count > 1 or federated == 1) and conn['type'] == 1 and conn['subs'].has_key(topic) == 0):
+        announce_subscription(topic, 1)
+    table[topic][conn['fd']] = 1
+    conn['subs'][topic] = 1
+    topic_cache.clear()
+    log_message = 'subscribe: ' + conn['service'] + ' (fd ' + str(conn['fd']) + ') subscribed to ' + topic
+    debug(log_message)
+
+# Remove a connection's subscription to a topic or pattern.
+# Input: conn, a connection record.  topic, a topic name or pattern.
+# Output: None.
+
+def unsubscribe(conn, topic):
+    for table in (topic_subs, pattern_subs):
+        if (table.has_key(topic) and table[topic].has_key(conn['fd'])):
+            del table[topic][conn['fd']]
+            if (len(table[topic]) == 0):
+                del table[topic]
+    if (conn['subs'].has_key(topic)):
+        del conn['subs'][topic]
+        if ((shard_count > 1 or federated == 1) and conn['type'] == 1):
+            announce_subscription(topic, -1)
+    topic_cache.clear()
+
+# Check a topic name against a subscription pattern.
+# Input: topic_levels, pattern_levels, the topic name and pattern split on '/'.
+# Output: 1 if the topic matches the pattern, 0 if not.
+
+def topic_match(topic_levels, pattern_levels):
+    for i in range(len(pattern_levels)):
+        if (pattern_levels[i] == '#'):
+            return 1
+        if (i >= len(topic_levels)):
+            return 0
+        if (pattern_levels[i] != '*' and pattern_levels[i] != topic_levels[i]):
+            return 0
+    return len(topic_levels) == len(pattern_levels)
+
+# Return the file descriptors of all connections subscribed to a topic, either by
+# name or by pattern.  Results are cached per topic name, so after the first
+# message, this is a single hash table lookup however many patterns there are.
+# Input: topic, a topic name.
+# Output: a list of file descriptor numbers.
+
+def topic_subscribers(topic):
+    try:
+        return topic_cache[topic]
+    except KeyError:
+        pass
+
+    subscribers = {}
+    if (topic_subs.has_key(topic)):
+        subscribers.update(topic_subs[topic])
+    if (len(pattern_subs) > 0):
+        topic_levels = string.split(topic, '/')
+        for pattern in pattern_subs.keys():
+            if (topic_match(topic_levels, string.split(pattern, '/')) == 1):
+                subscribers.update(pattern_subs[pattern])
+    topic_cache[topic] = subscribers.keys()
+    return topic_cache[topic]
+
+# Look up the queue policy for a service.  The [queue_policy] section of the config
+# file holds service_name = policy lines, where policy is one of:
+# block - stop reading from the sending module until the queue drains (default)
+# drop_oldest - throw away the oldest queued messages to make room
+# drop_newest - throw away the message that didn't fit
+# Input: service name.
+# Output: policy name.
+
+def queue_policy(service):
+    try:
+        return config_data[policy_sec][service]
+    except KeyError:
+        return config_data['eds']['queue_policy']
+
+# Add data to the outbound queue of a connection.  Queues hold whole messages, and
+# are bounded by max_queue_bytes.  When a message doesn't fit, the destination
+# service's queue policy (see queue_policy(), above) decides what happens.  A message
+# that's partly written to the socket is never dropped, so a receiving module never
+# sees half a message.
+# Each queue has two lanes.  Priority messages (a stop_play or quit, say) are queued
+# in order at the head of the queue, ahead of all the ordinary ones, so they go out
+# in the very next send() however much LCD or speech output is waiting.  Only a
+# message that's partly written already stays in front of them.  conn['urgent'] is
+# the number of messages at the head of the queue that priority messages go behind.
+# Priority messages are never dropped for want of room.
+# Input: conn, the destination connection record.  data, the message to queue,
+# newline included.  src_conn, the connection record the message came from, or None.
+# priority, 1 to queue the message in the priority lane.
+# Output: 1 if the data was queued, 0 if it was dropped.
+
+def queue_data(conn, data, src_conn, priority=0):
+    max_bytes = config_data['eds']['max_queue_bytes']
+
+    if (conn['wbytes'] + len(data) > max_bytes):
+        # Shard and peer links never drop anything.
+        if (conn['type'] == 4 or conn['type'] == 8):
+            policy = 'block'
+        else:
+            policy = queue_policy(conn['service'])
+
+        if (policy == 'drop_newest' and priority == 0 and type(data) != ChannelNotice):
+            log_message = 'queue_data: ' + conn['service'] + ' queue full (' + str(conn['wbytes']) + ' bytes).  Dropping new message.'
+            warning(log_message)
+            conn['drops'] = conn['drops'] + 1
+            return 0
+
+        if (policy == 'drop_oldest'):
+            # Keep the head of the queue if part of it has already gone out, and
+            # the priority lane.  Nothing from a channel notice on is dropped (see
+            # queue_channel()).
+            keep = []
+            while (len(keep) < lane_end(conn)):
+                keep.append(conn['wqueue'].popleft())
+            dropped = 0
+            while (len(conn['wqueue']) > 0 and conn['wbytes'] + len(data) > max_bytes and type(conn['wqueue'][0]) != ChannelNotice):
+                conn['wbytes'] = conn['wbytes'] - len(conn['wqueue'].popleft())
+                dropped = dropped + 1
+            conn['wqueue'].extendleft(reversed(keep))
+            conn['views'] = min(conn['views'], len(conn['wqueue']) - len(keep))
+            conn['drops'] = conn['drops'] + dropped
+            if (len(conn['entries']) > 0):
+                shift_entries(conn, len(keep), -dropped)
+            log_message = 'queue_data: ' + conn['service'] + ' queue full.  Dropped ' + str(dropped) + ' old messages.'
+            warning(log_message)
+
+        if (policy == 'block'):
+            # Queue the message anyway, but stop reading from the module that sent
+            # it until this queue drains.  Its socket buffers fill up, and it
+            # blocks in its own send() instead of us dropping anything.
+            if (src_conn != None and src_conn is not conn and conn_table.has_key(src_conn['fd'])):
+                pause_source(src_conn, conn)
+
+    # Time in the EDS is measured from the start of the pass of the event loop that
+    # queued the oldest message still waiting.
+    if (len(conn['wqueue']) == 0):
+        conn['wtime'] = pass_time
+    if (priority == 0):
+        conn['wqueue'].append(data)
+        if (type(data) == memoryview):
+            conn['views'] = conn['views'] + 1
+    else:
+        # Views have to stay at the tail of the queue (see release_views()), so a
+        # priority message is copied.  A deque has no insert(), so it's turned to
+        # put the message's place at the front.
+        if (type(data) == memoryview):
+            data = data.tobytes()
+        place = lane_end(conn)
+        conn['wqueue'].rotate(-place)
+        conn['wqueue'].appendleft(data)
+        conn['wqueue'].rotate(place)
+        conn['urgent'] = place + 1
+        if (len(conn['entries']) > 0):
+            shift_entries(conn, place, 1)
+    conn['wbytes'] = conn['wbytes'] + len(data)
+    conn['msgs_out'] = conn['msgs_out'] + 1
+    conn['bytes_out'] = conn['bytes_out'] + len(data)
+    if (conn['wbytes'] > conn['max_queue']):
+        conn['max_queue'] = conn['wbytes']
+    return 1
+
+# Find the end of a connection's priority lane: the place in its queue where the
+# next priority message goes.
+# Input: conn, a connection record.
+# Output: the number of messages in front of that place.
+
+def lane_end(conn):
+    if (conn['urgent'] == 0 and conn['woffset'] > 0):
+        return 1
+    return conn['urgent']
+
+# Write as much of a connection's outbound queue as the socket will take, without
+# blocking.  Queued messages are joined and written with a single send() call, up to
+# max_queue_bytes at a time, so a burst of small messages (an LCD redraw, say) costs
+# one system call instead of one per message.  A partial write leaves the rest of
+# the unsent message at the head of the queue, with woffset marking how much of it
+# has gone out already.  If data is left over, the connection is registered for
+# write events, and this gets called again when the socket is writable.
+# Input: conn, a connection record.
+# Output: 1 if the connection is still alive, 0 if it was removed.
+
+def flush_queue(conn):
+    max_bytes = config_data['eds']['max_queue_bytes']
+    while (len(conn['wqueue']) > 0):
+        # Gather queued messages into one buffer.  A lone message is sent as it is,
+        # which for data routed during this pass means straight out of the sending
+        # connection's receive buffer.
+        chunks = []
+        size = 0
+        for message in conn['wqueue']:
+            if (conn['notices'] > 0 and type(message) == ChannelNotice and message.sock != None):
+                # A channel end goes out with its notice, in a send of its own.
+                if (len(chunks) == 0):
+                    chunks.append(message)
+                break
+            chunks.append(message)
+            size = size + len(message)
+            if (size >= max_bytes):
+                break
+        if (len(chunks) == 1):
+            out_data = chunks[0]
+        else:
+            out_data = bytearray()
+            for message in chunks:
+                out_data += message
+        if (conn['woffset'] > 0):
+            out_data = memoryview(out_data)[conn['woffset']:]
+
+        try:
+            if (type(out_data) == ChannelNotice and out_data.sock != None):
+                sent = eds_fdpass.send_fds(conn['sock'], out_data, [out_data.sock.fileno()])
+                out_data.sock.close()
+                out_data.sock = None
+                conn['notices'] = conn['notices'] - 1
+            else:
+                sent = conn['sock'].send(out_data)
+        except socket.error, exc:
+            if (exc.args[0] in (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)):
+                break
+            log_message = 'flush_queue: Send to ' + conn['service'] + ' failed (' + str(exc) + ').  Closing connection.'
+            warning(log_message)
+            remove_connection(conn)
+            return 0
+
+        if (debug_enabled == 1):
+            log_message = 'flush_queue: ' + str(sent) + ' of ' + str(len(out_data)) + ' bytes (' + str(len(chunks)) + ' messages) sent to ' + conn['service'] + '.'
+            debug(log_message)
+
+        # Take the messages that went out completely off the queue.
+        sent = sent + conn['woffset']
+        conn['woffset'] = 0
+        done = 0
+        while (sent > 0):
+            head_len = len(conn['wqueue'][0])
+            if (sent < head_len):
+                conn['woffset'] = sent
+                break
+            conn['wqueue'].popleft()
+            conn['wbytes'] = conn['wbytes'] - head_len
+            sent = sent - head_len
+            done = done + 1
+        conn['urgent'] = max(conn['urgent'] - done, 0)
+        conn['views'] = min(conn['views'], len(conn['wqueue']))
+        conn['wdone'] = conn['wdone'] + done
+        if (done > 0 and conn['type'] == 1):
+            observe(service_stats_for(conn['service'])['latency'], time.time() - conn['wtime'], done)
+
+        if (conn['woffset'] > 0):
+            # Short write.  The socket buffer is full; wait for a write event.
+            break
+
+    # Durable messages that have been sent are finished with.
+    if (len(conn['entries']) > 0):
+        release_sent(conn)
+
+    # Let any modules we stopped reading from carry on, once the queue has
+    # drained to half its limit.
+    if (len(conn['blocked']) > 0 and conn['wbytes'] <= max_bytes / 2):
+        resume_sources(conn)
+
+    # A metrics connection is closed once its response has gone out.
+    if (conn['closing'] == 1 and len(conn['wqueue']) == 0):
+        remove_connection(conn)
+        return 0
+
+    update_interest(conn)
+    return 1
+
+# Flush the outbound queue of every connection that had data routed to it, or became
+# writable, during this pass of the event loop, and empty flush_table.
+# No input, no output.
+
+def flush_pending():
+    released = {}
+    for conn in flush_table.values():
+        if (conn_table.has_key(conn['fd']) and flush_queue(conn) == 1):
+            release_views(conn, released)
+    flush_table.clear()
+
+# Messages are queued as memoryviews into the receive buffer of the connection they
+# came from.  That buffer gets reused on the next read, so anything that couldn't be
+# sent during this pass is copied out of it first.  Only messages queued during this
+# pass can still be views, and they're always at the tail of the queue.  A message
+# delivered to several connections is the same view in each queue, so copies are
+# shared through the released hash table, keyed by the view's id().
+# Input: conn, a connection record.  released, a hash table of copies already made
+# during this flush.
+# Output: None.
+
+def release_views(conn, released):
+    queue = conn['wqueue']
+    if (debug_enabled == 1):
+        check_views(conn)
+    for i in range(len(queue) - conn['views'], len(queue)):
+        if (type(queue[i]) == memoryview):
+            view_id = id(queue[i])
+            if (released.has_key(view_id) == 0):
+                released[view_id] = queue[i].tobytes()
+            queue[i] = released[view_id]
+    conn['views'] = 0
+
+# Check that no view is queued ahead of the tail that conn['views'] counts.  Any code
+# that moves queued messages around has to keep the count right, and a view it
+# misses is left pointing into a receive buffer that's about to be reused, so the
+# message would go out with another message's bytes in it.  A view found there is
+# logged, and copied.  This looks at the whole queue, so it's only done while
+# debug messages are enabled.
+# Input: conn, a connection record.
+# Output: None.
+
+def check_views(conn):
+    queue = conn['wqueue']
+    for i in range(len(queue) - conn['views']):
+        if (type(queue[i]) == memoryview):
+            log_message = 'check_views: Message ' + str(i) + ' of ' + str(len(queue)) + ' queued for ' + conn['service'] + ' is a view outside the last ' + str(conn['views']) + '.  Copying it.'
+            critical(log_message)
+            queue[i] = queue[i].tobytes()
+
+# Stop reading from a source connection, because a destination it's sending to
+# has a full queue.
+# Input: src_conn, the sending connection.  dest_conn, the destination connection.
+# Output: None.
+
+def pause_source(src_conn, dest_conn):
+    if (src_conn['paused_by'].has_key(dest_conn['fd']) == 0):
+        log_message = 'pause_source: ' + dest_conn['service'] + ' queue full.  Pausing reads from ' + src_conn['service'] + '.'
+        debug(log_message)
+    src_conn['paused_by'][dest_conn['fd']] = 1
+    dest_conn['blocked'][src_conn['fd']] = 1
+    update_interest(src_conn)
+
+# Start reading again from all the connections a destination connection paused.
+# Input: dest_conn, the destination connection.
+# Output: None.
+
+def resume_sources(dest_conn):
+    for src_fd in dest_conn['blocked'].keys():
+        if (conn_table.has_key(src_fd)):
+            src_conn = conn_table[src_fd]
+            del src_conn['paused_by'][dest_conn['fd']]
+            log_message = 'resume_sources: Resuming reads from ' + src_conn['service'] + '.'
+            debug(log_message)
+            update_interest(src_conn)
+    dest_conn['blocked'] = {}
+
+# Work out which events we want from a connected socket, and tell the event backend
+# if that's changed.  We read unless the connection is paused, or has a backlog of
+# messages still to route, and want write events while there's queued data.
+# Input: conn, a connection record.
+# Output: None.
+
+def update_interest(conn):
+    mask = 0
+    if (len(conn['paused_by']) == 0 and conn['active'] == 0):
+        mask = mask | eds_backend.READ
+    if (len(conn['wqueue']) > 0):
+        mask = mask | eds_backend.WRITE
+    if (mask != conn['mask']):
+        backend.modify(conn['fd'], mask)
+        conn['mask'] = mask
+
+# Traffic statistics.  Each connection record counts the messages and bytes it has
+# sent in (msgs_in, bytes_in), the messages and bytes routed to it (msgs_out,
+# bytes_out), the messages dropped from its queue (drops), and the largest its
+# queue has been (max_queue, in bytes).  service_stats holds a record per service
+# name with the totals of its closed connections, the messages held for it, NACKs
+# sent on its behalf, and a histogram of how long its messages spent in the EDS,
+# from the start of the pass of the event loop that read them to the send() that
+# wrote them out.  When several messages go out in one send(), all of them are
+# counted with the time of the oldest, so the histogram errs on the slow side.
+# The statistics are read with the 'eds: stats' command, or from the metrics port.
+
+# Upper bounds of the latency histogram buckets, in seconds.  A final bucket
+# catches anything slower.
+latency_bounds = [0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+                  0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# Connection counters that get added to the service totals.
+conn_counters = ['msgs_in', 'bytes_in', 'msgs_out', 'bytes_out', 'drops']
+
+# Look up a service's statistics record, creating it if it's new.
+# Input: s_name, a service name.
+# Output: The service's statistics record (a hash table).
+
+def service_stats_for(s_name):
+    try:
+        return service_stats[s_name]
+    except KeyError:
+        stats = {'held': 0, 'nacks': 0,
+                 'latency': {'counts': [0] * (len(latency_bounds) + 1), 'sum': 0.0, 'count': 0}}
+        for key in conn_counters:
+            stats[key] = 0
+        service_stats[s_name] = stats
+        return stats
+
+# Add samples to a histogram.
+# Input: hist, a histogram from a service statistics record.  value, the sample, in
+# seconds.  count, the number of samples with this value.
+# Output: None.
+
+def observe(hist, value, count):
+    hist['counts'][bisect.bisect_left(latency_bounds, value)] += count
+    hist['sum'] = hist['sum'] + value * count
+    hist['count'] = hist['count'] + count
+
+# Estimate a quantile from a histogram, as the upper bound of the bucket it falls in.
+# Input: hist, a histogram.  q, the quantile (0.5 for the median).
+# Output: The estimate in seconds, None for an empty histogram, or -1 if it's
+# beyond the last bound.
+
+def hist_quantile(hist, q):
+    if (hist['count'] == 0):
+        return None
+    rank = q * hist['count']
+    seen = 0
+    for i in range(len(latency_bounds)):
+        seen = seen + hist['counts'][i]
+        if (seen >= rank):
+            return latency_bounds[i]
+    return -1
+
+# Total up a service's statistics, over its closed and live connections.
+# Input: s_name, a service name.
+# Output: A hash table of totals, including the current queue length (queue_msgs,
+# queue_bytes), the number of connections, and the latency histogram.
+
+def service_totals(s_name):
+    stats = service_stats_for(s_name)
+    totals = stats.copy()
+    totals['queue_msgs'] = 0
+    totals['queue_bytes'] = 0
+    totals['connections'] = 0
+    for conn in service_connections(s_name):
+        for key in conn_counters:
+            totals[key] = totals[key] + conn[key]
+        totals['queue_msgs'] = totals['queue_msgs'] + len(conn['wqueue'])
+        totals['queue_bytes'] = totals['queue_bytes'] + conn['wbytes']
+        totals['connections'] = totals['connections'] + 1
+    if (held_table.has_key(s_name)):
+        for expiry, data, src_conn, priority, entry in held_table[s_name]:
+            totals['queue_msgs'] = totals['queue_msgs'] + 1
+            totals['queue_bytes'] = totals['queue_bytes'] + len(data)
+    return totals
+
+# Input: s_name, a service name, or an empty string for connections that haven't
+# registered one.
+# Output: A list of the service's live connection records.
+
+def service_connections(s_name):
+    if (s_name != ''):
+        return [conn_table[fd] for fd in service_table.get(s_name, [])]
+    return [conn for conn in conn_table.values() if conn['type'] == 1 and conn['service'] == '']
+
+# Output: A sorted list of every service name there are statistics for.
+
+def stats_services():
+    names = {}
+    for table in (service_table, service_stats, held_table):
+        for s_name in table.keys():
+            names[s_name] = 1
+    names = names.keys()
+    names.sort()
+    return names
+
+# Send traffic statistics to a connection, in answer to 'eds: stats [service]'.
+# Each service gets a 'stats service' line, followed by a 'stats conn' line for each
+# of its connections, and a 'stats end' line ends the list.  Connections that
+# haven't registered a service are listed under 'unregistered'.
+# Input: conn, the connection to send to.  s_name, the service to report on, or an
+# empty string for all of them.
+# Output: None.
+
+def send_stats(conn, s_name):
+    if (s_name == ''):
+        names = stats_services()
+    else:
+        names = [s_name]
+    lines = []
+    for name in names:
+        totals = service_totals(name)
+        label = name
+        if (label == ''):
+            label = 'unregistered'
+        line = 'stats service ' + label
+        for key in ('msgs_in', 'bytes_in', 'msgs_out', 'bytes_out', 'drops', 'held', 'nacks', 'queue_msgs', 'queue_bytes', 'connections'):
+            line = line + ' ' + key + ' ' + str(totals[key])
+        for key, q in (('p50', 0.5), ('p99', 0.99)):
+            line = line + ' ' + key + ' ' + format_latency(hist_quantile(totals['latency'], q))
+        lines.append(line + '\n')
+        for c in service_connections(name):
+            line = 'stats conn ' + label + ' fd ' + str(c['fd']) + ' gen ' + str(c['gen'])
+            for key in ('msgs_in', 'bytes_in', 'msgs_out', 'bytes_out', 'drops', 'max_queue'):
+                line = line + ' ' + key + ' ' + str(c[key])
+            line = line + ' queue_msgs ' + str(len(c['wqueue'])) + ' queue_bytes ' + str(c['wbytes'])
+            lines.append(line + '\n')
+    lines.append('stats end\n')
+    deliver_data(conn, string.join(lines, ''), None)
+
+# Input: a latency quantile from hist_quantile().
+# Output: The quantile as a string.
+
+def format_latency(value):
+    if (value == None):
+        return '-'
+    if (value < 0):
+        return '>' + str(latency_bounds[-1])
+    return str(value)
+
+# Build a dump of the traffic statistics in the Prometheus text format.
+# No input.
+# Output: The dump, as a string.
+
+def metrics_text():
+    out = []
+    counters = [('msgs_in', 'turbolift_eds_messages_in_total', 'counter', 'Messages received from the service.'),
+                ('bytes_in', 'turbolift_eds_bytes_in_total', 'counter', 'Bytes received from the service.'),
+                ('msgs_out', 'turbolift_eds_messages_out_total', 'counter', 'Messages routed to the service.'),
+                ('bytes_out', 'turbolift_eds_bytes_out_total', 'counter', 'Bytes routed to the service.'),
+                ('drops', 'turbolift_eds_dropped_total', 'counter', 'Messages for the service that were dropped.'),
+                ('held', 'turbolift_eds_held_total', 'counter', 'Messages held while the service was not connected.'),
+                ('nacks', 'turbolift_eds_nacks_total', 'counter', 'Requests to the service that were NACKed.'),
+                ('queue_msgs', 'turbolift_eds_queue_messages', 'gauge', 'Messages waiting for the service.'),
+                ('queue_bytes', 'turbolift_eds_queue_bytes', 'gauge', 'Bytes waiting for the service.'),
+                ('connections', 'turbolift_eds_connections', 'gauge', 'Live connections of the service.')]
+    all_totals = []
+    for name in stats_services():
+        all_totals.append(('service="' + name + '"', service_totals(name)))
+    for key, metric, m_type, m_help in counters:
+        out.append('# HELP ' + metric + ' ' + m_help)
+        out.append('# TYPE ' + metric + ' ' + m_type)
+        for labels, totals in all_totals:
+            out.append(metric + '{' + labels + '} ' + str(totals[key]))
+
+    metric = 'turbolift_eds_latency_seconds'
+    out.append('# HELP ' + metric + ' Time messages for the service spent in the EDS.')
+    out.append('# TYPE ' + metric + ' histogram')
+    for labels, totals in all_totals:
+        hist = totals['latency']
+        seen = 0
+        for i in range(len(latency_bounds)):
+            seen = seen + hist['counts'][i]
+            out.append(metric + '_bucket{' + labels + ',le="' + repr(latency_bounds[i]) + '"} ' + str(seen))
+        out.append(metric + '_bucket{' + labels + ',le="+Inf"} ' + str(hist['count']))
+        out.append(metric + '_sum{' + labels + '} ' + repr(hist['sum']))
+        out.append(metric + '_count{' + labels + '} ' + str(hist['count']))
+
+    metric = 'turbolift_eds_connection_queue_bytes'
+    out.append('# HELP ' + metric + ' Bytes waiting for each connection.')
+    out.append('# TYPE ' + metric + ' gauge')
+    for conn in conn_table.values():
+        if (conn['type'] == 1):
+            out.append(metric + '{service="' + conn['service'] + '",fd="' + str(conn['fd']) + '"} ' + str(conn['wbytes']))
+    return string.join(out, '\n') + '\n'
+
+# Answer a request on the metrics port with a dump of the traffic statistics.  It
+# works as an HTTP server for Prometheus, and with anything else that sends a blank
+# line: once the end of the request arrives, the dump is queued, and the connection
+# is closed when it has gone out.
+# Input: conn, a connection record accepted on the metrics port.
+# Output: None.
+
+def serve_metrics(conn):
+    try:
+        data = conn['sock'].recv(4096)
+    except socket.error:
+        return
+    if (data == ''):
+        if (conn['closing'] == 0):
+            debug('serve_metrics: Connection closed before a request arrived.')
+        remove_connection(conn)
+        return
+    if (conn['closing'] == 1):
+        return
+    conn['request'] = conn['request'] + data
+    request = string.replace(conn['request'], '\r', '')
+    if (string.find(request, '\n\n') < 0 and len(request) < 4096):
+        return
+
+    body = metrics_text()
+    response = 'HTTP/1.0 200 OK\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: ' + str(len(body)) + '\r\n\r\n' + body
+    conn['wqueue'].append(response)
+    conn['wbytes'] = len(response)
+    conn['closing'] = 1
+    flush_table[conn['fd']] = conn
+
+# Create a connection record, enter it into conn_table under its file descriptor, and
+# register it with the event backend for read events.  Connected sockets are also
+# appended to the service_table entry of the service they belong to, so route_data()
+# can find them without scanning.
+# Input: sock, a socket object.  service, the service name the socket belongs to, or
+# an empty string for the registration port, and connections accepted on it that
+# haven't registered yet.  sock_type, 0 for listening sockets, and 1 for connected
+# sockets.  Type 2 is the metrics listener, and type 3 a connection accepted on it
+# (see serve_metrics()).  Types 4 to 6 are only used in sharded mode: a link to
+# another worker, a worker's socket from the supervisor, and a connection the
+# supervisor is reading a registration from (see shard_of()).  Type 7 is the
+# socket to a successor taking over from this EDS (see restart_eds()).  Type 8 is
+# a link to another node, and type 9 the listener for them (see peer_up()).
+# Output: The new connection record (a hash table).
+
+def add_connection(sock, service, sock_type):
+    conn = {'sock': sock,
+            'fd': sock.fileno(),
+            'service': service,
+            'type': sock_type,
+            'rbuf': None,
+            'rview': None,
+            'rstart': 0,
+            'rend': 0,
+            'rscan': 0,
+            'discard': 0,
+            'framed': 0,
+            'backlog': collections.deque(),
+            'active': 0,
+            'deficit': 0,
+            'frame_out': 0,
+            'skip': 0,
+            'wqueue': collections.deque(),
+            'views': 0,
+            'wbytes': 0,
+            'woffset': 0,
+            'urgent': 0,
+            'wdone': 0,
+            'entries': [],
+            'parked': 0,
+            'blocked': {},
+            'paused_by': {},
+            'subs': {},
+            'gen': 0,
+            'instance': '',
+            'mask': eds_backend.READ,
+            'msgs_in': 0,
+            'bytes_in': 0,
+            'msgs_out': 0,
+            'bytes_out': 0,
+            'drops': 0,
+            'max_queue': 0,
+            'wtime': 0,
+            'closing': 0,
+            'channels': {},
+            'channel_ok': 0,
+            'notices': 0,
+            'request': ''}
+    conn_table[conn['fd']] = conn
+    backend.register(conn['fd'], conn['mask'])
+    if (sock_type == 3 or sock_type == 5 or sock_type == 6 or sock_type == 7):
+        sock.setblocking(0)
+    if (sock_type == 1 and config_data['eds']['send_buffer_size'] > 0):
+        # Data in the socket's send buffer can't be overtaken by priority messages,
+        # so a small buffer keeps a module's backlog in its queue instead.
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, config_data['eds']['send_buffer_size'])
+    if ((sock_type == 1 or sock_type == 8) and config_data['eds']['keepalive_interval'] > 0):
+        set_keepalive(sock, config_data['eds']['keepalive_interval'])
+    if (sock_type == 1 or sock_type == 4 or sock_type == 8):
+        # Connected sockets never block.  Reads only happen after a read event,
+        # and writes go through the connection's outbound queue.
+        sock.setblocking(0)
+        if (sock_type == 1 and service != ''):
+            attach_service(conn)
+
+        # Preallocate the receive buffer.  It's big enough to hold the largest
+        # message we route (as a line, or as a frame), plus a full read behind it.
+        frame_extra = eds_frame.header.size + 2 * eds_frame.MAX_FIELD
+        conn['rbuf'] = bytearray(config_data['eds']['max_message_size'] + 2 + frame_extra + config_data['eds']['recv_size'])
+        conn['rview'] = memoryview(conn['rbuf'])
+    return conn
+
+# Add a connection to its service's list of connections in service_table, and
+# give it the service's next generation number.
+# Input: conn, a connection record with its service name set.
+# Output: None.
+
+def attach_service(conn):
+    service = conn['service']
+    service_table[service].append(conn['fd'])
+
+    # Number the connections of each service in the order they arrive.
+    service_gen[service] = service_gen.get(service, 0) + 1
+    conn['gen'] = service_gen[service]
+
+    # Anything sent to the service while it had no connections goes out now.
+    if (len(service_table[service]) == 1):
+        forward_held(service)
+        if (federated == 1):
+            announce_service('up', service)
+
+# Read from a connection into its receive buffer, and split out every complete,
+# newline terminated message in it.  Data is read with recv_into() straight into the
+# connection's preallocated buffer, and nothing gets copied on the way through: each
+# message is returned as its service name, and a memoryview of its data (newline
+# included) in the buffer.  Any trailing partial message stays in the buffer, and is
+# completed by later reads.  Messages longer than max_message_size are dropped whole:
+# once the limit is passed without a newline, everything up to the next newline is
+# discarded.  Lines that aren't in 'service_name: data' form are ignored.
+# Connections that have switched to frames (see split_frames(), below) are split
+# by frame instead.
+# Input: conn, a connection record.
+# Output: A list of (service name, data) tuples, or None if the connection closed.
+# Raises socket.error if there was nothing to read.
+
+def read_messages(conn):
+    rbuf = conn['rbuf']
+    rview = conn['rview']
+    max_size = config_data['eds']['max_message_size']
+
+    # Move any partial message left over from the last read to the front of the
+    # buffer.  Nothing from that read can still be queued as a view (see
+    # release_views()), so this is safe.
+    if (conn['rstart'] > 0):
+        partial = conn['rend'] - conn['rstart']
+        if (partial > 0):
+            rbuf[0:partial] = rbuf[conn['rstart']:conn['rend']]
+        conn['rscan'] = conn['rscan'] - conn['rstart']
+        conn['rstart'] = 0
+        conn['rend'] = partial
+
+    space = min(len(rbuf) - conn['rend'], config_data['eds']['recv_size'])
+    nbytes = conn['sock'].recv_into(rview[conn['rend']:], space)
+    if (nbytes == 0):
+        return None
+    conn['rend'] = conn['rend'] + nbytes
+
+    messages = []
+    if (conn['type'] == 4 or conn['type'] == 8):
+        split_shard_frames(conn, messages)
+        return messages
+    if (conn['framed'] == 1):
+        split_frames(conn, messages)
+        return messages
+
+    start = conn['rstart']
+    while 1:
+        newline = rbuf.find('\n', conn['rscan'], conn['rend'])
+        if (newline < 0):
+            break
+        conn['rscan'] = newline + 1
+
+        if (conn['discard'] == 1):
+            # This is the tail end of an oversized message.  The newline
+            # ends it, so go back to normal framing from here on.
+            conn['discard'] = 0
+        elif (newline - start > max_size):
+            log_message = 'read_messages: Dropping ' + str(newline - start) + ' byte message from ' + conn['service'] + ' (limit ' + str(max_size) + ').'
+            warning(log_message)
+        else:
+            message = split_message(rbuf, rview, start, newline)
+            if (message != None):
+                messages.append(message)
+                # Everything after 'eds: framing' is frames.
+                if (message[0] == eds_service and string.strip(message[1].tobytes()) == 'framing'):
+                    conn['framed'] = 1
+                    conn['rstart'] = newline + 1
+                    split_frames(conn, messages)
+                    return messages
+        start = newline + 1
+
+    conn['rstart'] = start
+    conn['rscan'] = conn['rend']
+
+    if (conn['discard'] == 1 or conn['rend'] - start > max_size + 1):
+        if (conn['discard'] == 0):
+            log_message = 'read_messages: Message from ' + conn['service'] + ' exceeds ' + str(max_size) + ' bytes.  Discarding to next newline.'
+            warning(log_message)
+            conn['discard'] = 1
+        conn['rstart'] = 0
+        conn['rend'] = 0
+        conn['rscan'] = 0
+
+    return messages
+
+# Framed connections.  A module can switch its connection from lines to frames by
+# sending 'eds: framing' (see Modules/eds_frame.py for the frame layout).  Each
+# frame's header gives the length of the frame, so splitting a buffer into frames
+# takes no scanning, and the payload can hold newlines.  Inside the EDS, messages
+# from framed connections are turned into the same form as lines (data, newline
+# included, with a '?', '=' or '!' correlation mark in front for frames flagged as
+# requests, replies or NACKs), and routed as usual.  Messages for a framed
+# connection are turned back into frames by frame_message() as they're delivered,
+# so framed and text modules can talk to each other.  A payload with newlines in
+# it reaches a text module as several lines.  A frame with a priority above 0 is
+# routed as if its service name had a '^' in front (see route_data()), and the
+# frames of priority messages are sent with a priority of 1.
+
+# Split the complete frames in a connection's receive buffer into messages.  Frames
+# with a payload over max_message_size are skipped.
+# Input: conn, a framed connection record.  messages, the list to add the messages
+# to, as (service name, data) tuples.
+# Output: None.
+
+def split_frames(conn, messages):
+    rbuf = conn['rbuf']
+    rview = conn['rview']
+    max_size = config_data['eds']['max_message_size']
+    start = conn['rstart']
+    end = conn['rend']
+
+    while 1:
+        # Skip what's arrived of a frame that's too big.
+        if (conn['skip'] > 0):
+            skipped = min(conn['skip'], end - start)
+            conn['skip'] = conn['skip'] - skipped
+            start = start + skipped
+
+        if (end - start < eds_frame.header.size):
+            break
+        size, length, name_len, id_len, flags, priority = eds_frame.frame_size(rbuf, start)
+        if (length > max_size):
+            log_message = 'split_frames: Dropping ' + str(length) + ' byte frame from ' + conn['service'] + ' (limit ' + str(max_size) + ').'
+            warning(log_message)
+            conn['skip'] = size
+            continue
+        if (end - start < size):
+            break
+
+        name_start = start + eds_frame.header.size
+        id_start = name_start + name_len
+        data_start = id_start + id_len
+        s_name = str(rbuf[name_start:id_start])
+        corr_id = str(rbuf[id_start:data_start])
+        if (priority > 0):
+            s_name = '^' + s_name
+        messages.append((s_name, frame_text(flags, corr_id, rview[data_start:start + size])))
+        start = start + size
+
+    conn['rstart'] = start
+    conn['rscan'] = start
+
+# Turn a received frame into the form routed inside the EDS.
+# Input: flags, corr_id, the frame's flags and correlation ID.  payload, a
+# memoryview of its payload.
+# Output: a memoryview of the data, newline included.
+
+def frame_text(flags, corr_id, payload):
+    mark = ''
+    if (corr_id != ''):
+        if (flags & eds_frame.REQUEST):
+            mark = '?' + corr_id + ' '
+        elif (flags & eds_frame.REPLY):
+            mark = '=' + corr_id + ' '
+        elif (flags & eds_frame.NACK):
+            mark = '!' + corr_id + ' '
+    return memoryview(mark + payload.tobytes() + '\n')
+
+# Turn a message into a frame, for delivery to a framed connection.  A request
+# ('?17 mp3_module data') becomes a request frame from the requesting service, a
+# reply ('=17 data') a reply frame, and a NACK ('!17 reason service') a NACK frame
+# from the service the request was for, with the reason as its payload.
+# Input: s_data, the message, newline included.  src_name, the service it came
+# from.  priority, the priority of the frame.
+# Output: the frame, or None if its fields are too long for one.
+
+def frame_message(s_data, src_name, priority=0):
+    if (type(s_data) == memoryview):
+        data = s_data.tobytes()
+    else:
+        data = str(s_data)
+    if (data[-1:] == '\n'):
+        data = data[:-1]
+
+    flags = 0
+    corr_id = ''
+    name = src_name
+    mark = data[:1]
+    if (mark == '?' or mark == '=' or mark == '!'):
+        # Requests and NACKs have a field more than replies.
+        if (mark == '='):
+            count = 1
+        else:
+            count = 2
+        fields = string.split(data[1:], ' ', count)
+        while (len(fields) < count + 1):
+            fields.append('')
+        if (fields[0] != ''):
+            corr_id = fields[0]
+            if (mark == '?'):
+                flags = eds_frame.REQUEST
+                name = fields[1]
+                data = fields[2]
+            elif (mark == '='):
+                flags = eds_frame.REPLY
+                data = fields[1]
+            else:
+                flags = eds_frame.NACK
+                name = fields[2]
+                data = fields[1]
+    try:
+        return eds_frame.pack_frame(name, data, flags, corr_id, priority)
+    except ValueError:
+        return None
+
+# Split one line of a receive buffer into a service name and its data, by looking
+# for the first ': ' separator.  The service name is the word just before it.
+# Whitespace (a \r that's arrived in transit, for instance) is trimmed from both
+# ends of the data.  If anything was trimmed from the end, the newline is moved up
+# over it, so the data still ends with one, and can be forwarded as-is.
+# Input: rbuf, the receive buffer.  rview, a memoryview of it.  start, end, the
+# position of the line in the buffer, end being the position of its newline.
+# Output: A (service name, memoryview of data) tuple, or None if the line isn't in
+# 'service_name: data' form.
+
+def split_message(rbuf, rview, start, end):
+    sep = rbuf.find(': ', start, end)
+    if (sep < 0):
+        return None
+    name_start = rbuf.rfind(' ', start, sep) + 1
+    if (name_start == 0):
+        name_start = start
+    s_name = str(rbuf[name_start:sep])
+
+    data_start = sep + 2
+    data_end = end
+    while (data_start < data_end and rbuf[data_start] in whitespace_bytes):
+        data_start = data_start + 1
+    while (data_end > data_start and rbuf[data_end - 1] in whitespace_bytes):
+        data_end = data_end - 1
+    if (data_end < end):
+        rbuf[data_end] = newline_byte
+    return (s_name, rview[data_start:data_end + 1])
+
+# Remove a connection record from conn_table and service_table, unregister it from
+# the event backend, and close the socket.
+# Input: conn, a connection record created by add_connection().
+# Output: None.
+
+def remove_connection(conn):
+    backend.unregister(conn['fd'])
+    debug('remove_connection: Socket unregistered from event backend.')
+
+    del conn_table[conn['fd']]
+    if (conn['type'] == 4 and running == 1):
+        # Another worker has gone.  The supervisor stops the rest.
+        log_message = 'remove_connection: Lost the link to shard ' + str(conn['shard']) + '.  Stopping.'
+        critical(log_message)
+        stop_eds(None, None)
+    if (conn['type'] == 8):
+        drop_peer(conn)
+    if (conn['type'] == 1 or conn['type'] == 4 or conn['type'] == 8):
+        if (conn['type'] == 1 and conn['service'] != ''):
+            service_table[conn['service']].remove(conn['fd'])
+            if (federated == 1 and len(service_table[conn['service']]) == 0):
+                announce_service('down', conn['service'])
+
+        # Whatever was still queued for this connection is lost with it, except
+        # durable messages, which are held to be sent again.
+        if (conn['wbytes'] > 0):
+            log_message = 'remove_connection: ' + str(len(conn['wqueue'])) + ' queued messages for ' + conn['service'] + ' discarded.'
+            warning(log_message)
+        if (len(conn['entries']) > 0):
+            requeue_entries(conn)
+
+        # Release any modules this connection had paused, and forget any
+        # pauses on this connection.
+        resume_sources(conn)
+        for dest_fd in conn['paused_by'].keys():
+            if (conn_table.has_key(dest_fd)):
+                del conn_table[dest_fd]['blocked'][conn['fd']]
+
+        # Drop the connection's topic subscriptions, and its direct channels.
+        for topic in conn['subs'].keys():
+            unsubscribe(conn, topic)
+        if (len(conn['channels']) > 0 or conn['notices'] > 0):
+            drop_channels(conn)
+
+        # Messages the connection sent that haven't been routed yet still go
+        # out, now it's out of the tables, to whichever of their destinations
+        # are still there.  Commands to the EDS are left out (see route_data()).
+        backlog = conn['backlog']
+        if (len(backlog) > 0):
+            log_message = 'remove_connection: Routing ' + str(len(backlog)) + ' messages left from ' + conn['service'] + '.'
+            debug(log_message)
+        while (len(backlog) > 0):
+            s_name, s_data = backlog.popleft()
+            route_data(conn, s_name, s_data)
+        deactivate_source(conn)
+
+        # Keep the connection's traffic counts in its service's totals.
+        if (conn['type'] == 1):
+            stats = service_stats_for(conn['service'])
+            for key in conn_counters:
+                stats[key] = stats[key] + conn[key]
+    conn['sock'].close()
+    log_message = 'remove_connection: ' + conn['service'] + ' connection on fd ' + str(conn['fd']) + ' removed.'
+    debug(log_message)
+
+
+# Open a TCP listening socket, and add a connection record for it to conn_table.
+# If the EDS this one took over from was listening on the port, its socket is used.
+# Input: port, the port number to listen on.  service, the service name connections
+# accepted on it belong to, or an empty string for the registration port.
+# sock_type, the type of listener (see add_connection()).
+# Output: None.  Failures are logged.
+
+def open_listener(port, service, sock_type=0):
+    log_message = 'init: Starting service on port ' + str(port)
+    debug(log_message)
+    if (adopted_listeners.has_key(port)):
+        add_connection(adopted_listeners.pop(port), service, sock_type)
+        return
+    try:
+        listen_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listen_sock.bind(('', port))
+        listen_sock.listen(config_data['eds']['listen_backlog'])
+        try:
+            # Add the listener to conn_table, which registers it with the
+            # event backend.
+            add_connection(listen_sock, service, sock_type)
+        except:
+            log_message = 'init: Unable to complete initialization of service on port ' + str(port)
+            warning(log_message)
         
-        s_name = string.strip(data_sep.search(indata).group(1))
-        s_data = string.strip(data_sep.search(indata).group(2))
+    except socket.error:
+        log_message = 'init: Unable to start service on port ' + str(port)
+        warning(log_message)
 
-        # This is a neat little side effect of using a hash table as the canonical
-        # source for config information.  Our port assignment variable names in the
-        # config file double as our service names, so we simply reference the
-        # port name here by key.
+
+# Open a Unix domain listening socket, and add a connection record for it to
+# conn_table.  Modules on the same machine as the EDS can connect here instead
+# of to the TCP port, which saves going through the TCP/IP stack.  Connections
+# accepted on it are handled exactly like TCP ones.
+# Input: path, the filename of the socket.  A stale socket left behind by an
+# earlier run is removed first, but one handed over by the EDS this one took over
+# from is used as it is.  service, as for open_listener().
+# Output: None.  Failures are logged.
+
+def open_unix_listener(path, service):
+    log_message = 'init: Starting service on ' + path
+    debug(log_message)
+    if (adopted_listeners.has_key(path)):
+        add_connection(adopted_listeners.pop(path), service, 0)
+        unix_paths.append(path)
+        return
+    try:
+        if (os.path.exists(path)):
+            os.unlink(path)
+        listen_sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        listen_sock.bind(path)
+        listen_sock.listen(config_data['eds']['listen_backlog'])
+        add_connection(listen_sock, service, 0)
+        unix_paths.append(path)
+    except (socket.error, OSError):
+        log_message = 'init: Unable to start service on ' + path
+        warning(log_message)
+
+# Turn on TCP keepalives for a connected socket, so a module whose machine has
+# gone away (rather than one that closed its connection) is noticed, and its
+# connection removed.  Where the operating system allows it, the first probe is
+# sent after interval seconds without traffic, and the connection is dropped
+# after 4 probes interval seconds apart go unanswered.  Unix domain sockets
+# don't need keepalives, and are left alone.
+# Input: sock, a connected socket.  interval, in seconds.
+# Output: None.
+
+def set_keepalive(sock, interval):
+    if (sock.family != socket.AF_INET):
+        return
+    try:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        for opt_name, value in (('TCP_KEEPIDLE', interval), ('TCP_KEEPINTVL', interval), ('TCP_KEEPCNT', 4)):
+            if (hasattr(socket, opt_name)):
+                sock.setsockopt(socket.IPPROTO_TCP, getattr(socket, opt_name), value)
+    except socket.error, exc:
+        log_message = 'set_keepalive: Unable to set keepalive (' + str(exc) + ').'
+        warning(log_message)
+
+# Timers.  call_later() runs a function once a number of seconds have passed; the
+# event loop sleeps until the first timer is due, and runs it with run_timers().
+# Each timer is a list of [due time, sequence number, function, arguments], kept
+# in timer_heap, ordered by due time.  The sequence number keeps timers that are
+# due at the same time in the order they were set.
+
+# Input: delay, in seconds.  func, the function to call.  args, a tuple of its
+# arguments.
+# Output: The timer, which can be passed to cancel_timer().
+
+def call_later(delay, func, args=()):
+    global timer_seq
+    timer_seq = timer_seq + 1
+    timer = [time.time() + delay, timer_seq, func, args]
+    heapq.heappush(timer_heap, timer)
+    return timer
+
+# Cancel a timer that hasn't run yet.  It stays in timer_heap, but does nothing
+# when it comes due.
+# Input: timer, from call_later().
+# Output: None.
+
+def cancel_timer(timer):
+    timer[2] = None
+
+# Run every timer that's due.
+# No input.
+# Output: The number of seconds until the next timer is due, or None if there are
+# no timers.
+
+def run_timers():
+    now = time.time()
+    while (len(timer_heap) > 0 and timer_heap[0][0] <= now):
+        timer = heapq.heappop(timer_heap)
+        if (timer[2] != None):
+            timer[2](*timer[3])
+    if (len(timer_heap) == 0):
+        return None
+    return max(timer_heap[0][0] - time.time(), 0)
+
+# Add a connection record for a newly accepted socket, under the same service as
+# the listening socket.  Connections on the registration port get their service
+# when they register.
+# Input: sock, the accepted socket.  service, the listener's service name.
+# Output: None.
+
+def accept_connection(sock, service):
+    new_conn = add_connection(sock, service, 1)
+    log_message = 'event_loop: Connection accepted for ' + repr(new_conn['service']) + ', generation ' + str(new_conn['gen']) + '.  Now there are ' + str(len(conn_table)) + ' sockets.'
+    debug(log_message)
+    if (new_conn['service'] != '' and dispatch_policy(new_conn['service']) == 'single'):
+        take_over_service(new_conn)
+
+    # Don't read from the new socket here.  If the module has already sent
+    # something, the next poll reports it like any other incoming data.
+
+# Handle an event reported for a connection.  Listening sockets get their pending
+# connection accepted, connected sockets get read, and any messages read are added
+# to the connection's backlog, to be routed once every event of this pass has been
+# handled (see run_sources()).
+# Input: conn, a connection record.  events, the event mask reported for it.
+# Output: None.
+
+def handle_event(conn, events):
+    # The socket can take more data.  Its queue gets written out with everything
+    # else at the end of this pass.
+    if (events & eds_backend.WRITE and (conn['type'] == 1 or conn['type'] == 3 or conn['type'] == 4 or conn['type'] == 8)):
+        flush_table[conn['fd']] = conn
+
+    # An error or hangup reported without a read event means the socket is dead.
+    # It's reported even while we aren't reading from the connection, because it
+    # has a backlog or is paused, so a module connection may still have messages
+    # waiting, in its backlog or unread in the socket.  They're routed before it's
+    # removed (see drain_connection(), below).  With a read event as well, the data
+    # is read first; the recv() that follows returns an empty string or raises,
+    # and the connection gets cleaned up then.
+    if (events & eds_backend.READ == 0):
+        if (events & (eds_backend.ERROR | eds_backend.HANGUP | eds_backend.INVALID)):
+            log_message = 'event_loop: Error or hangup on ' + conn['service'] + ' fd ' + str(conn['fd']) + ' (events ' + str(events) + ').'
+            warning(log_message)
+            if (conn['type'] == 1):
+                drain_connection(conn)
+            elif (conn['type'] == 3 or conn['type'] == 4 or conn['type'] == 8):
+                remove_connection(conn)
+        return
+
+    debug('event_loop: Incoming data on socket.')
+
+    if (conn['type'] == 0 or conn['type'] == 2 or conn['type'] == 9):
+        debug('event_loop: Accepting new connection on socket.')
         try:
-            route_port = config_data[modreg_sec][s_name]
-        except KeyError:
-            log_message = 'route_data: WARNING: No service by name of ' + s_name + ' registered!'
+            new_sock = conn['sock'].accept()[0]
+        except socket.error, exc:
+            # The module gave up before we got to it, or another event got there
+            # first.
+            log_message = 'event_loop: accept() failed (' + str(exc) + ').'
             debug(log_message)
             return
-        
-        # Now that we know the destination port, we look through port_list for the
-        # SECOND instance of the port.  The first instance is just the listening
-        # socket, and the second is the actual connected port object.  If we don't
-        # find it, report an error to the log.
 
-        # We use the check flag, seen_first_instance, initially set to 0, to
-        # flag whether the first instance has been seen.  If the second instance
-        # instance is seen (what we're after), we increment it again, so its
-        # exit value is nominally 2.  If 0 or 1, we print an error message via debug()
+        if (conn['type'] == 2):
+            add_connection(new_sock, '', 3)
+        elif (conn['type'] == 9):
+            accept_peer(new_sock)
+        else:
+            accept_connection(new_sock, conn['service'])
+        return
+
+    if (conn['type'] == 3):
+        serve_metrics(conn)
+        return
+
+    if (conn['type'] == 5):
+        receive_connection(conn)
+        return
+
+    if (conn['type'] == 7):
+        successor_event(conn)
+        return
+
+    debug('event_loop: Data found on existing connection.')
+
+    # Messages still waiting in the backlog point into the receive buffer, so it
+    # can't be read into until they've been routed.  Reads stop while there's a
+    # backlog (see update_interest()), but an event may have been waiting already.
+    if (len(conn['backlog']) > 0):
+        return
+    if (debug_enabled == 1):
+        log_message = 'event_loop: Calling recv(' + str(config_data['eds']['recv_size']) + ') on socket object.'
+        debug(log_message)
 
-        seen_first_instance = 0
+    # The code below is a bit pedantic and paranoid.
+    # Since we're getting a read event on an already connected socket, there
+    # should always be actual data to read.  If for some reason there's not, we
+    # catch the socket.error, and wait for the next event.
+    try:
+        messages = read_messages(conn)
+    except socket.error:
+        debug('event_loop: No data to read on this socket yet.')
+        return
+
+    if (messages == None):
+        # Connection went away.  Need to do cleanup.
+        debug('event_loop: Connection went away. Cleaning up.')
+        remove_connection(conn)
+        log_message = 'event_loop: Now there are ' + str(len(conn_table)) + ' sockets.'
+        debug(log_message)
+        return
+
+    # Messages from other workers have already had their turn, in the worker
+    # that read them.
+    if (conn['type'] == 4):
+        for s_name, s_data, src_name, flags, priority in messages:
+            route_shard(conn, s_name, s_data, src_name, flags, priority)
+        return
+
+    # So have messages from other nodes, in the node that sent them.  The link
+    # is closed if the other end turns out not to be a node we want.
+    if (conn['type'] == 8):
+        for s_name, s_data, src_name, flags, priority in messages:
+            if (conn_table.get(conn['fd']) is not conn):
+                break
+            route_peer(conn, s_name, s_data, src_name, flags, priority)
+        return
+
+    # Data can arrive split across reads, or with several messages together.
+    # read_messages() hands back every complete message, and holds on to any
+    # partial one until the rest of it arrives.
+    if (len(messages) > 0):
+        conn['backlog'].extend(messages)
+        if (conn['active'] == 0):
+            conn['active'] = 1
+            active_sources.append(conn)
+
+# Route everything a module sent before it hung up, or its connection failed: its
+# backlog, then whatever is left in the socket, read through to the end of the
+# connection.  Then remove the connection.  Nothing more can come from the module,
+# so its fair share, rate limit and any pause don't apply; holding its messages back
+# would only mean losing them with the connection.
+# Input: conn, a module connection record.
+# Output: None.
 
+def drain_connection(conn):
+    backlog = conn['backlog']
+    while 1:
+        while (len(backlog) > 0):
+            s_name, s_data = backlog.popleft()
+            route_data(conn, s_name, s_data)
+            if (conn_table.get(conn['fd']) is not conn):
+                return
+
+        # The next read reuses the receive buffer, so whatever was routed from it
+        # has to be sent or copied out first.
+        flush_pending()
+        if (conn_table.get(conn['fd']) is not conn):
+            return
+        try:
+            messages = read_messages(conn)
+        except socket.error:
+            break
+        if (messages == None):
+            break
+        backlog.extend(messages)
+
+    log_message = 'drain_connection: ' + conn['service'] + ' fd ' + str(conn['fd']) + ' read to the end.'
+    debug(log_message)
+    remove_connection(conn)
+
+# Fair sharing between sources.  Messages read from a connection wait in its
+# backlog, and each pass of the event loop routes some of every backlog, in turn,
+# by deficit round robin: each connection with a backlog (an active source, in
+# active_sources) gets source_quantum more bytes of credit per pass, and routes
+# messages while it has credit for them.  A module that sends a burst (info_module
+# reading out a channel, or an LCD redraw) can't hold up a module that sends one
+# message meanwhile: that message goes out in the same pass.  Credit is only kept
+# while the backlog lasts.  A connection isn't read from again until its backlog is
+# empty, so a module that sends faster than its share ends up blocked in its own
+# send(), just as when a destination's queue fills up.
+# Services can also have a rate limit, set in the [rate_limit] section of the
+# config file as 'service_name = messages_per_second [burst]'.  Each service has a
+# token bucket holding up to burst tokens (the rate, by default), refilled at the
+# given rate.  Routing a message from the service takes a token, and when the
+# bucket is empty, the service's messages wait in its backlog until it refills.
+
+# Look up a service's token bucket, creating it if the service has a rate limit.
+# Input: s_name, a service name.
+# Output: The bucket (a hash table), or None if the service isn't rate limited.
+
+def rate_bucket(s_name):
+    try:
+        return rate_buckets[s_name]
+    except KeyError:
+        pass
+    bucket = None
+    if (config_data[rate_sec].has_key(s_name)):
+        try:
+            limit = map(float, string.split(config_data[rate_sec][s_name]))
+            rate = limit[0]
+            burst = max(limit[-1], 1)
+            if (rate <= 0 or len(limit) > 2):
+                raise ValueError
+            bucket = {'rate': rate, 'burst': burst, 'tokens': burst, 'time': time.time()}
+        except (ValueError, IndexError):
+            log_message = 'rate_bucket: Bad rate limit for ' + s_name + ' (' + config_data[rate_sec][s_name] + ').  Not limiting it.'
+            warning(log_message)
+    rate_buckets[s_name] = bucket
+    return bucket
+
+# Top up a token bucket for the time since it was last topped up.
+# Input: bucket, a token bucket.  now, the time.
+# Output: None.
 
-        for i in range(len(port_list)):
-            if (route_port == port_list[i]):
-                seen_first_instance = seen_first_instance + 1
-            if (seen_first_instance == 2):
-                port_index = i
+def refill_bucket(bucket, now):
+    bucket['tokens'] = min(bucket['burst'], bucket['tokens'] + (now - bucket['time']) * bucket['rate'])
+    bucket['time'] = now
+
+# Route messages from the backlogs of the active sources: one round of deficit round
+# robin.
+# No input.
+# Output: How many seconds the event loop can wait before the next round: 0 if any
+# active source can route more straight away, the time until a rate limited
+# source's next token if that's all there is, or None if there are no backlogs.
+
+def run_sources():
+    quantum = config_data['eds']['source_quantum']
+    now = time.time()
+    timeout = None
+    for conn in active_sources[:]:
+        # The connection may have been removed while routing another's messages.
+        if (conn['active'] == 0):
+            continue
+        backlog = conn['backlog']
+        bucket = rate_bucket(conn['service'])
+        if (bucket != None):
+            refill_bucket(bucket, now)
+        if (quantum > 0 and (bucket == None or bucket['tokens'] >= 1)):
+            conn['deficit'] = conn['deficit'] + quantum
+
+        while (len(backlog) > 0):
+            s_name, s_data = backlog[0]
+            if (quantum > 0 and len(s_data) > conn['deficit']):
+                break
+            if (bucket != None):
+                if (bucket['tokens'] < 1):
+                    break
+                bucket['tokens'] = bucket['tokens'] - 1
+            backlog.popleft()
+            conn['deficit'] = conn['deficit'] - len(s_data)
+            route_data(conn, s_name, s_data)
+            if (conn['active'] == 0):
                 break
 
-        if (seen_first_instance == 0):
-            log_message = 'route_data: CRITICAL: No listening or connected sockets found for service ' + s_name + ' Very bad.'
+        if (conn['active'] == 0):
+            continue
+        if (len(backlog) == 0):
+            # Start reading from the connection again.
+            deactivate_source(conn)
+            update_interest(conn)
+        elif (bucket != None and bucket['tokens'] < 1):
+            wait = (1 - bucket['tokens']) / bucket['rate']
+            if (timeout == None or wait < timeout):
+                timeout = wait
+        else:
+            timeout = 0
+    return timeout
+
+# Take a connection out of active_sources, and forget its credit.
+# Input: conn, a connection record.
+# Output: None.
+
+def deactivate_source(conn):
+    if (conn['active'] == 1):
+        active_sources.remove(conn)
+        conn['active'] = 0
+        conn['deficit'] = 0
+
+# Finish a pass of the event loop: route messages from the sources' backlogs, and
+# send everything that was routed, one send() per destination.
+# No input, no output.
+
+def end_pass():
+    global source_timeout
+    if (debug_enabled == 1):
+        log_message = 'event_loop: ' + str(len(active_sources)) + ' sources with messages waiting.'
+        debug(log_message)
+    source_timeout = run_sources()
+    flush_pending()
+    if (capture != None):
+        capture.flush()
+    if (restart_pending == 1):
+        start_successor()
+    elif (successor != None and successor['ready'] == 1):
+        hand_over(successor)
+
+# Work out how long the event loop can wait for events: until the next timer is
+# due, or the sources' backlogs need another round.
+# No input.
+# Output: The timeout, in seconds, or None to wait indefinitely.
+
+def loop_timeout():
+    timeout = run_timers()
+    if (source_timeout != None and (timeout == None or source_timeout < timeout)):
+        timeout = source_timeout
+    return timeout
+
+# The poll event loop.  The event backend reports which sockets are ready, and
+# handle_event() deals with each of them.
+# No input, no output.  Returns when the EDS is asked to stop.
+
+def run_poll_loop():
+    global pass_time
+    while (running == 1):
+        # Wait for events, or until the next timer is due.
+        debug('event_loop: Waiting for incoming events.')
+        event_list = backend.poll(loop_timeout())
+        pass_time = time.time()
+        if (debug_enabled == 1):
+            log_message = 'event_loop: event_list: ' + str(event_list)
             debug(log_message)
-            
-        if (seen_first_instance == 1):
-            log_message = 'route_data: WARNING: Only found listener socket for service: ' + s_name
+
+        for fd, events in event_list:
+            if (debug_enabled == 1):
+                log_message = 'event_loop: Operating on fd ' + str(fd)
+                debug(log_message)
+            # A connection removed earlier in this pass may still have an event
+            # waiting in event_list.  Skip it.
+            try:
+                conn = conn_table[fd]
+            except KeyError:
+                log_message = 'event_loop: fd ' + str(fd) + ' no longer registered.  Skipping.'
+                debug(log_message)
+                continue
+            handle_event(conn, events)
+        end_pass()
+
+# asyncore server mode.  Instead of the EDS polling an event backend itself, every
+# connection gets a dispatcher object, and asyncore's loop calls it when its socket
+# is ready.  The dispatchers hand events to handle_event(), so routing, queueing
+# and the line protocol are exactly the same as in the poll loop.  Dispatchers
+# live in dispatcher_map, keyed by file descriptor.
+
+class EdsDispatcher(asyncore.dispatcher):
+    def __init__(self, conn):
+        asyncore.dispatcher.__init__(self, conn['sock'], dispatcher_map)
+        self.conn = conn
+        if (conn['type'] == 0 or conn['type'] == 2 or conn['type'] == 9):
+            self.accepting = True
+
+    # asyncore asks these before every wait.  The connection's event mask is kept
+    # up to date by update_interest().
+    def readable(self):
+        return self.conn['mask'] & eds_backend.READ
+
+    def writable(self):
+        return self.conn['mask'] & eds_backend.WRITE
+
+    def handle_read_event(self):
+        self.handle(eds_backend.READ)
+
+    def handle_write_event(self):
+        self.handle(eds_backend.WRITE)
+
+    def handle_expt_event(self):
+        self.handle(eds_backend.ERROR)
+
+    # asyncore calls this for a hangup whether we're reading from the socket or
+    # not, and in the same pass as handle_read_event() if there's data as well.
+    # handle_event() reads what's left before the connection is removed.
+    def handle_close(self):
+        self.handle(eds_backend.HANGUP)
+
+    def handle(self, events):
+        # The connection may have been removed by an earlier event in this pass.
+        if (conn_table.get(self.conn['fd']) is self.conn):
+            handle_event(self.conn, events)
+
+    def handle_error(self):
+        log_message = 'EdsDispatcher: Error handling ' + self.conn['service'] + ' fd ' + str(self.conn['fd']) + ': ' + str(sys.exc_info()[1])
+        warning(log_message)
+        if (conn_table.get(self.conn['fd']) is self.conn and self.conn['type'] != 0):
+            remove_connection(self.conn)
+
+# Stands in for the event backend in asyncore mode, so add_connection(),
+# update_interest() and remove_connection() work unchanged.  Registering a file
+# descriptor creates a dispatcher for its connection.
+class DispatcherBackend:
+    name = 'asyncore'
+
+    def register(self, fd, mask):
+        EdsDispatcher(conn_table[fd])
+
+    def modify(self, fd, mask):
+        pass
+
+    def unregister(self, fd):
+        if (dispatcher_map.has_key(fd)):
+            dispatcher_map[fd].del_channel(dispatcher_map)
+
+    def close(self):
+        pass
+
+# The asyncore event loop.  Each call to asyncore.loop() waits for events, or until
+# the next timer is due, and calls the dispatchers of the ready sockets.
+# No input, no output.  Returns when the EDS is asked to stop.
+
+def run_asyncore_loop():
+    global pass_time
+    use_poll = (config_data['eds']['event_backend'] != 'select' and hasattr(select, 'poll'))
+    while (running == 1):
+        debug('event_loop: Waiting for incoming events.')
+        asyncore.loop(loop_timeout(), use_poll, dispatcher_map, 1)
+        pass_time = time.time()
+        end_pass()
+
+# Sharded mode.  With shards set above 1 in the [eds] section, the EDS runs as a
+# supervisor process and that many worker processes, so routing is spread over
+# several processor cores.  Every service belongs to one worker (its shard),
+# picked by a hash of its name.  The supervisor owns the listening sockets: it
+# accepts each connection, and passes it to the worker that owns its service, as
+# SCM_RIGHTS data on a Unix domain socket (see Modules/eds_fdpass.py).  A
+# connection on the registration port goes to the owner of the name in its
+# 'eds: register' line, which the supervisor reads without taking it off the
+# socket.  Each worker serves its connections just as a single EDS would.
+# Workers are joined to each other by a socketpair each (a shard link), and a
+# message for a service of another worker is passed along it as a frame (see
+# send_shard()).  Topic subscriptions are announced to every worker, which
+# subscribes the announcing worker's link, so messages reach subscribers on every
+# shard.  Statistics, logs and metrics are each worker's own, and capture files
+# get the worker's number added to their name.
+
+# Find the shard a service or topic belongs to.
+# Input: s_name, a service or topic name.
+# Output: the shard number.
+
+def shard_of(s_name):
+    try:
+        return shard_cache[s_name]
+    except KeyError:
+        shard = (zlib.crc32(s_name) & 0xffffffff) % shard_count
+        shard_cache[s_name] = shard
+        return shard
+
+# Pass a message to another worker over its shard link.  The frame carries the
+# service or topic name, the name of the service the message came from in the
+# correlation ID field, and the data, newline included, as the payload.  Requests
+# are flagged, so the worker that owns the service can NACK them.  A link is queued
+# and written like any other connection, but never drops anything: when its queue
+# is full, the sending module is paused (see queue_data()).
+# Peer links (see peer_up(), below) carry messages to other nodes the same way.
+# Input: link, a shard or peer link record.  src_conn, the connection record the
+# message came from, or None for the EDS itself.  s_name, s_data, corr_id,
+# priority, entry, as for dispatch_message().
+# Output: None.
+
+def send_shard(link, src_conn, s_name, s_data, corr_id, priority, entry=None):
+    if (src_conn == None):
+        src_name = eds_service
+    else:
+        src_name = src_conn['service']
+    flags = 0
+    if (corr_id != None):
+        flags = eds_frame.REQUEST
+    if (type(s_data) == memoryview):
+        s_data = s_data.tobytes()
+    try:
+        frame = eds_frame.pack_frame(s_name, s_data, flags, src_name, priority)
+    except ValueError:
+        log_message = 'send_shard: Name too long to pass on: ' + s_name
+        warning(log_message)
+        return
+    if (queue_data(link, frame, src_conn, priority) == 1):
+        flush_table[link['fd']] = link
+        if (entry != None):
+            add_entry(link, entry, priority)
+
+# Tell the other workers, or nodes, about a change to this one's subscriptions.
+# Only the first subscription to a topic or pattern, and the last unsubscription,
+# are announced, as 'subscribe topic' or 'unsubscribe topic' sent to the eds
+# service.
+# Input: topic, a topic name or pattern.  change, 1 for a new subscriber, -1 for
+# one gone.
+# Output: None.
+
+def announce_subscription(topic, change):
+    count = shard_subs.get(topic, 0) + change
+    if (count > 0):
+        shard_subs[topic] = count
+    elif (shard_subs.has_key(topic)):
+        del shard_subs[topic]
+    if (count == 1 and change == 1):
+        command = 'subscribe'
+    elif (count == 0):
+        command = 'unsubscribe'
+    else:
+        return
+    for link in shard_links.values() + peer_links.values():
+        send_shard(link, None, eds_service, command + ' ' + topic + '\n', None, 0)
+
+# Route a message that came from another worker.  While it's routed, the link's
+# service name is that of the service the message came from, so replies, NACKs
+# and frames for framed modules name the right sender.
+# Input: link, the shard link record.  s_name, the service or topic name.
+# s_data, a memoryview of the data, newline included.  src_name, the service the
+# message came from.  flags, priority, from the frame.
+# Output: None.
+
+def route_shard(link, s_name, s_data, src_name, flags, priority):
+    link['msgs_in'] = link['msgs_in'] + 1
+    link['bytes_in'] = link['bytes_in'] + len(s_data)
+    if (s_name == eds_service):
+        args = string.split(s_data.tobytes())
+        if (len(args) == 2 and args[0] == 'subscribe'):
+            subscribe(link, args[1])
+        elif (len(args) == 2 and args[0] == 'unsubscribe'):
+            unsubscribe(link, args[1])
+        return
+    link['service'] = src_name
+    corr_id = None
+    if (flags & eds_frame.REQUEST):
+        request = s_data.tobytes()
+        corr_id = request[1:request.find(' ')]
+    dispatch_message(link, s_name, s_data, corr_id, priority)
+
+# Split the complete frames in a shard link's receive buffer into messages.
+# Input: conn, a shard link record.  messages, the list to add the messages to, as
+# (service name, data, source service name, flags, priority) tuples.
+# Output: None.
+
+def split_shard_frames(conn, messages):
+    rbuf = conn['rbuf']
+    rview = conn['rview']
+    start = conn['rstart']
+    end = conn['rend']
+    while (end - start >= eds_frame.header.size):
+        size, length, name_len, id_len, flags, priority = eds_frame.frame_size(rbuf, start)
+        if (end - start < size):
+            break
+        name_start = start + eds_frame.header.size
+        id_start = name_start + name_len
+        data_start = id_start + id_len
+        messages.append((str(rbuf[name_start:id_start]), rview[data_start:start + size],
+                         str(rbuf[id_start:data_start]), flags, priority))
+        start = start + size
+    conn['rstart'] = start
+    conn['rscan'] = start
+
+# Take the connections the supervisor has passed to this worker.  Each comes with
+# a line giving the connection type, the socket's address family and its service.
+# Input: conn, the worker's connection record for its socket from the supervisor.
+# Output: None.
+
+def receive_connection(conn):
+    try:
+        data, fds = eds_fdpass.recv_fds(conn['sock'], 1024)
+    except socket.error:
+        return
+    if (data == ''):
+        critical('receive_connection: Lost the supervisor.  Stopping.')
+        stop_eds(None, None)
+        return
+    fields = string.split(data, ' ', 2)
+    for fd in fds:
+        sock = socket.fromfd(fd, int(fields[1]), socket.SOCK_STREAM)
+        os.close(fd)
+        if (fields[0] == '3'):
+            add_connection(sock, '', 3)
+        else:
+            accept_connection(sock, fields[2])
+
+# Pass an accepted connection to a worker, and close the supervisor's copy.
+# Input: sock, the connected socket.  sock_type, 1 for a module connection, 3 for a
+# metrics connection.  service, the connection's service, or an empty string.
+# shard, the worker to pass it to.
+# Output: None.
+
+def hand_off(sock, sock_type, service, shard):
+    try:
+        eds_fdpass.send_fds(worker_socks[shard], str(sock_type) + ' ' + str(sock.family) + ' ' + service, [sock.fileno()])
+        if (debug_enabled == 1):
+            log_message = 'hand_off: Passed a connection for ' + repr(service) + ' to shard ' + str(shard) + '.'
             debug(log_message)
+    except socket.error, exc:
+        log_message = 'hand_off: Unable to pass a connection to shard ' + str(shard) + ' (' + str(exc) + ').  Closing it.'
+        warning(log_message)
+    sock.close()
+
+# Read the first line from a connection on the registration port, without taking
+# it off the socket, and pass the connection to the worker that owns the service it
+# registers.  Connections that don't register first are shared out in turn.
+# Input: conn, the connection record.
+# Output: None.
+
+def peek_registration(conn):
+    global next_shard
+    limit = config_data['eds']['max_message_size'] + 2
+    try:
+        data = conn['sock'].recv(limit, socket.MSG_PEEK)
+    except socket.error:
+        return
+    if (data == ''):
+        remove_connection(conn)
+        return
+    newline = string.find(data, '\n')
+    if (newline < 0 and len(data) < limit):
+        # Only part of the line is here.  Look again shortly, rather than being
+        # woken up by the same data straight away.
+        backend.modify(conn['fd'], 0)
+        conn['mask'] = 0
+        call_later(0.05, peek_again, (conn,))
+        return
+    args = string.split(data[:newline])
+    if (len(args) > 2 and args[0] == eds_service + ':' and args[1] == 'register'):
+        shard = shard_of(args[2])
+    else:
+        shard = next_shard
+        next_shard = (next_shard + 1) % shard_count
+    del conn_table[conn['fd']]
+    backend.unregister(conn['fd'])
+    hand_off(conn['sock'], 1, '', shard)
+
+# Start watching a connection on the registration port again.
+def peek_again(conn):
+    if (conn_table.get(conn['fd']) is conn):
+        conn['mask'] = eds_backend.READ
+        backend.modify(conn['fd'], conn['mask'])
+
+# Start the workers.  Each gets a Unix domain socket from the supervisor, and a
+# shard link to every other worker, all made before forking, so each process
+# inherits the ends it needs, and closes the rest.
+# No input.
+# Output: None, in the supervisor.  Workers don't return.
+
+def start_shards():
+    pairs = []
+    for shard in range(shard_count):
+        pairs.append(socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM))
+    links = {}
+    for i in range(shard_count):
+        for j in range(i + 1, shard_count):
+            links[(i, j)] = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+
+    # Anything still buffered would be written by every process.
+    sys.stdout.flush()
+    for shard in range(shard_count):
+        pid = os.fork()
+        if (pid == 0):
+            run_shard(shard, pairs, links)
+        workers[pid] = shard
+        log_message = 'start_shards: Started shard ' + str(shard) + ' as process ' + str(pid) + '.'
+        info(log_message)
+
+    for supervisor_sock, worker_sock in pairs:
+        worker_socks.append(supervisor_sock)
+        worker_sock.close()
+    for pair in links.values():
+        pair[0].close()
+        pair[1].close()
+    call_later(1.0, check_workers)
+
+# Run a worker.  It takes over the event loop with an event backend of its own (an
+# epoll object is shared with the process that made it), and its ends of the
+# sockets made by start_shards().
+# Input: shard, the worker's shard number.  pairs, links, the sockets made by
+# start_shards().
+# Output: None.  Exits the process when the worker stops.
+
+def run_shard(shard, pairs, links):
+    global shard_id, backend, capture
+    shard_id = shard
+    logger.forked('eds shard ' + str(shard))
+    backend.close()
+    backend = open_event_backend()
+
+    for i in range(shard_count):
+        pairs[i][0].close()
+        if (i == shard):
+            add_connection(pairs[i][1], 'supervisor', 5)
+        else:
+            pairs[i][1].close()
+    for i, j in links.keys():
+        if (i == shard):
+            mine, other, peer = links[(i, j)][0], links[(i, j)][1], j
+        elif (j == shard):
+            mine, other, peer = links[(i, j)][1], links[(i, j)][0], i
+        else:
+            links[(i, j)][0].close()
+            links[(i, j)][1].close()
+            continue
+        other.close()
+        link = add_connection(mine, 'shard ' + str(peer), 4)
+        link['shard'] = peer
+        shard_links[peer] = link
+
+    if (config_data['eds']['capture_file'] != ''):
+        capture = open_capture(config_data['eds']['capture_file'] + '.' + str(shard))
+    signal.signal(signal.SIGTERM, stop_eds)
+    signal.signal(signal.SIGINT, stop_eds)
+    if (config_data['eds']['server_mode'] == 'asyncore'):
+        run_asyncore_loop()
+    else:
+        run_poll_loop()
+    shutdown_eds()
+    os._exit(0)
+
+# Check whether any worker has died, in which case the supervisor stops them all.
+# Runs on a timer in the supervisor.
+# No input, no output.
+
+def check_workers():
+    try:
+        pid, status = os.waitpid(-1, os.WNOHANG)
+    except OSError:
+        pid = 0
+    if (workers.has_key(pid)):
+        log_message = 'check_workers: Shard ' + str(workers[pid]) + ' (process ' + str(pid) + ') stopped.  Stopping.'
+        critical(log_message)
+        del workers[pid]
+        stop_eds(None, None)
+        return
+    call_later(1.0, check_workers)
+
+# The supervisor's event loop.  It only accepts connections, and hands them to the
+# workers.  Module connections are passed to the owner of their service, and
+# metrics connections to the first worker.
+# No input, no output.  Returns when the EDS is asked to stop.
+
+def run_supervisor():
+    global pass_time
+    while (running == 1):
+        event_list = backend.poll(loop_timeout())
+        pass_time = time.time()
+        for fd, events in event_list:
+            conn = conn_table.get(fd)
+            if (conn == None):
+                continue
+            if (conn['type'] == 6):
+                peek_registration(conn)
+                continue
+            try:
+                new_sock = conn['sock'].accept()[0]
+            except socket.error:
+                continue
+            if (conn['type'] == 2):
+                hand_off(new_sock, 3, '', 0)
+            elif (conn['service'] != ''):
+                hand_off(new_sock, 1, conn['service'], shard_of(conn['service']))
+            else:
+                add_connection(new_sock, '', 6)
+
+# Stop the workers, and wait for them to finish.
+# No input, no output.
+
+def stop_shards():
+    for pid in workers.keys():
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except OSError:
+            pass
+    for pid in workers.keys():
+        try:
+            os.waitpid(pid, 0)
+        except OSError:
+            pass
+
+# Federation.  EDSes on different machines (nodes) can be joined, so modules
+# connected to one can send to services connected to another: speech recognition
+# on a bigger machine, say, while the LCD and MP3 modules stay in the car.  Each
+# node has a name (node_name in the [eds] section, or its host name), accepts links
+# from other nodes on peer_port, and makes links to the nodes listed in its
+# [peers] section.  Two nodes share a single TCP connection (a peer link) for all
+# their traffic.  Messages go along it as frames, just as over a shard link (see
+# send_shard()), so everything queued for the other node in a pass of the event
+# loop goes out in one send().  Over the link, each node says which of its services
+# have connections ('up service' and 'down service', sent to the eds service), and
+# announces its modules' subscriptions.  A message for a service that has no
+# connections here, but is up on another node, is passed to that node, and
+# messages for topics another node's modules subscribe to are copied to it.
+# Messages that came from another node are only ever delivered to this node's own
+# modules, so they can't go round in circles, and each pair of nodes whose
+# modules talk to each other needs a link.  The node that made a link makes it
+# again, every peer_retry seconds, if it's lost.
+
+# Make a link to a node in the [peers] section.  The connection is made without
+# blocking; anything sent meanwhile waits in the link's queue until it's up.
+# Input: name, the node's name.
+# Output: None.
 
-        if (seen_first_instance == 2):
-            log_message = 'route_data: Found ' + s_name + ' service instance.'
+def open_peer(name):
+    host, port = peer_addresses[name]
+    try:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setblocking(0)
+        err = sock.connect_ex((host, port))
+    except socket.error, exc:
+        err = exc.args[0]
+    if (err not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK)):
+        log_message = 'open_peer: Unable to connect to node ' + name + ' at ' + host + ':' + str(port) + ' (' + str(err) + ').'
+        debug(log_message)
+        sock.close()
+        call_later(config_data['eds']['peer_retry'], retry_peer, (name,))
+        return
+    link = add_connection(sock, name, 8)
+    link['node'] = ''
+    link['outbound'] = name
+    peer_links[link['fd']] = link
+    start_peer(link)
+
+# Make a link to a node again, unless there's already one to it.
+# Input: name, the node's name.
+# Output: None.
+
+def retry_peer(name):
+    if (running == 0):
+        return
+    for link in peer_links.values():
+        if (link['node'] == name or link['outbound'] == name):
+            call_later(config_data['eds']['peer_retry'], retry_peer, (name,))
+            return
+    open_peer(name)
+
+# Add a link another node has made, accepted on peer_port.
+# Input: sock, the accepted socket.
+# Output: None.
+
+def accept_peer(sock):
+    link = add_connection(sock, '', 8)
+    link['node'] = ''
+    link['outbound'] = ''
+    peer_links[link['fd']] = link
+    log_message = 'accept_peer: Link from ' + str(sock.getpeername()) + ' accepted.'
+    debug(log_message)
+    start_peer(link)
+
+# Introduce this node over a new link: its name, its connected services, and its
+# modules' subscriptions.
+# Input: link, a peer link record.
+# Output: None.
+
+def start_peer(link):
+    send_shard(link, None, eds_service, 'peer ' + node_name + '\n', None, 0)
+    for service in service_table.keys():
+        if (len(service_table[service]) > 0):
+            send_shard(link, None, eds_service, 'up ' + service + '\n', None, 0)
+    for topic in shard_subs.keys():
+        send_shard(link, None, eds_service, 'subscribe ' + topic + '\n', None, 0)
+
+# Tell the other nodes a service has gained its first connection, or lost its last.
+# Input: change, 'up' or 'down'.  service, the service name.
+# Output: None.
+
+def announce_service(change, service):
+    for link in peer_links.values():
+        send_shard(link, None, eds_service, change + ' ' + service + '\n', None, 0)
+
+# Route a message that came from another node.  The other node's announcements are
+# handled here, and everything else is routed as for a shard link.
+# Input: link, the peer link record.  s_name, s_data, src_name, flags, priority, as
+# for route_shard().
+# Output: None.
+
+def route_peer(link, s_name, s_data, src_name, flags, priority):
+    if (s_name == eds_service):
+        args = string.split(s_data.tobytes())
+        if (len(args) == 2 and args[0] == 'peer'):
+            peer_hello(link, args[1])
+            return
+        if (len(args) == 2 and args[0] == 'up'):
+            peer_up(link, args[1])
+            return
+        if (len(args) == 2 and args[0] == 'down'):
+            if (peer_services.get(args[1]) is link):
+                del peer_services[args[1]]
+            return
+    route_shard(link, s_name, s_data, src_name, flags, priority)
+    if (link['node'] != ''):
+        link['service'] = link['node']
+
+# Take note of the name of the node at the other end of a link.  If two nodes have
+# each made a link to the other, both keep the one made by the node whose name
+# comes first, and close the other.
+# Input: link, the peer link record.  name, the other node's name.
+# Output: None.
+
+def peer_hello(link, name):
+    if (name == node_name):
+        warning('peer_hello: Linked to this node.  Closing the link.')
+        remove_connection(link)
+        return
+    for other in peer_links.values():
+        if (other is link or other['node'] != name):
+            continue
+        if (link['outbound'] != ''):
+            maker = node_name
+        else:
+            maker = name
+        if (maker != min(node_name, name)):
+            remove_connection(link)
+            return
+        remove_connection(other)
+    link['node'] = name
+    link['service'] = name
+    log_message = 'peer_hello: Linked to node ' + name + '.'
+    info(log_message)
+
+# Another node has a service up.  Messages for it go there from now on, while it
+# has no connections here, starting with any held for it.
+# Input: link, the peer link record.  service, the service name.
+# Output: None.
+
+def peer_up(link, service):
+    if (link['node'] == ''):
+        return
+    peer_services[service] = link
+    if (held_table.has_key(service) == 0 or len(service_table.get(service, ())) > 0):
+        return
+    held = held_table[service]
+    del held_table[service]
+    log_message = 'peer_up: Passing ' + str(len(held)) + ' held messages for ' + service + ' to node ' + link['node'] + '.'
+    debug(log_message)
+    now = time.time()
+    for expiry, data, src_conn, priority, entry in held:
+        if (expiry >= now):
+            send_shard(link, src_conn, service, data, None, priority, entry)
+        if (entry != None):
+            release_entry(entry)
+
+# Forget a link that's closing, and the services it was carrying.  A link this node
+# made is made again after peer_retry seconds.
+# Input: link, the peer link record.
+# Output: None.
+
+def drop_peer(link):
+    del peer_links[link['fd']]
+    for service in peer_services.keys():
+        if (peer_services[service] is link):
+            del peer_services[service]
+    if (link['node'] != ''):
+        log_message = 'drop_peer: Lost the link to node ' + link['node'] + '.'
+        warning(log_message)
+    if (link['outbound'] != '' and running == 1):
+        call_later(config_data['eds']['peer_retry'], retry_peer, (link['outbound'],))
+
+# Direct channels.  Most of the traffic through the EDS goes between a few pairs of
+# modules (the MP3 module redrawing the LCD, mostly), and every byte of it is read
+# and written twice on the way.  A module can ask for a direct channel to a service
+# instead, with 'eds: channel service'.  If the service has a single connection,
+# which has said it takes channels ('eds: channel_accept'), and both modules are
+# connected over Unix domain sockets, the EDS makes a socket pair, and sends one
+# end to each module as SCM_RIGHTS data (see Modules/eds_fdpass.py), along with a
+# 'channel open name id' line, where name is the service at the other end, and id
+# the channel's number, which goes with everything said about it after that, so
+# nothing meant for a channel that's gone can touch a newer one.  From then
+# on each module writes the data of its messages for the other (without a service
+# name) straight to the channel, and the EDS never sees it.  To keep messages in
+# order, a module sends 'eds: channel_mark name id' once it has its end, before it
+# writes anything to it, and the EDS passes 'channel mark name id' on to the other
+# module, which only starts reading the channel once that line arrives: everything
+# sent through the EDS before the switch is ahead of it.  A request the EDS can't
+# grant is answered with 'channel refused name reason'.  Reasons are
+# not_registered, parked (the module has durable messages waiting), unavailable,
+# not_local (the service is on another worker or node), unknown_service,
+# not_connected, several_connections, not_accepting, not_unix, and open (there's
+# already a channel between them).  A module that finds its channel closed says
+# so with 'eds: channel_close name id', and goes back to sending through the EDS,
+# and the module at the other end is told 'channel closed name id', as it is when a
+# module's connection to the EDS closes.  Messages on a channel don't get queue
+# policies, priority lanes, the journal, capture or statistics.
+# Modules/eds_channel.py does all this for a module.
+
+# A notice about a direct channel, waiting in a module's queue.  Notices are never
+# dropped, and a 'channel open' notice carries its end of the channel in sock
+# until flush_queue() has sent it.
+class ChannelNotice(str):
+    sock = None
+
+# Queue a channel notice for a module.
+# Input: conn, the module's connection record.  line, the notice, newline included.
+# sock, the module's end of the channel, for a 'channel open' notice, or None.
+# Output: None.
+
+def queue_channel(conn, line, sock):
+    if (conn['frame_out'] == 1):
+        line = frame_message(line, eds_service)
+    notice = ChannelNotice(line)
+    if (sock != None):
+        notice.sock = sock
+        conn['notices'] = conn['notices'] + 1
+    queue_data(conn, notice, None)
+    flush_table[conn['fd']] = conn
+
+# Open a direct channel between a module and the connection of a service, in answer
+# to 'eds: channel service'.
+# Input: conn, the asking module's connection record.  service, the service name.
+# Output: None.
+
+def open_channel(conn, service):
+    global channel_count
+    fds = service_table.get(service, [])
+    reason = ''
+    if (conn['service'] == ''):
+        reason = 'not_registered'
+    elif (conn['parked'] > 0):
+        reason = 'parked'
+    elif (eds_fdpass.available() == 0):
+        reason = 'unavailable'
+    elif ((shard_count > 1 and shard_of(service) != shard_id) or (len(fds) == 0 and peer_services.has_key(service))):
+        reason = 'not_local'
+    elif (service_table.has_key(service) == 0):
+        reason = 'unknown_service'
+    elif (len(fds) == 0):
+        reason = 'not_connected'
+    elif (len(fds) > 1):
+        reason = 'several_connections'
+    elif (conn_table[fds[0]] is conn or conn_table[fds[0]]['channel_ok'] == 0):
+        reason = 'not_accepting'
+    elif (conn['sock'].family != socket.AF_UNIX or conn_table[fds[0]]['sock'].family != socket.AF_UNIX):
+        reason = 'not_unix'
+    elif (conn['channels'].has_key(fds[0])):
+        reason = 'open'
+    if (reason == ''):
+        try:
+            end, other_end = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+        except socket.error, exc:
+            log_message = 'open_channel: Unable to make a channel (' + str(exc) + ').'
+            warning(log_message)
+            reason = 'unavailable'
+    if (reason != ''):
+        log_message = 'open_channel: Channel from ' + conn['service'] + ' to ' + service + ' refused (' + reason + ').'
+        debug(log_message)
+        deliver_data(conn, 'channel refused ' + service + ' ' + reason + '\n', None)
+        return
+
+    other = conn_table[fds[0]]
+    channel_count = channel_count + 1
+    channel_id = str(channel_count)
+    queue_channel(conn, 'channel open ' + service + ' ' + channel_id + '\n', end)
+    queue_channel(other, 'channel open ' + conn['service'] + ' ' + channel_id + '\n', other_end)
+    conn['channels'][other['fd']] = channel_id
+    other['channels'][conn['fd']] = channel_id
+    log_message = 'open_channel: Direct channel opened between ' + conn['service'] + ' and ' + service + '.'
+    info(log_message)
+
+# Pass a module's mark on to the other end of its channel to a service.  A mark for
+# a channel that has closed since is ignored.
+# Input: conn, the module's connection record.  service, the service name.
+# channel_id, the channel's number.
+# Output: None.
+
+def mark_channel(conn, service, channel_id):
+    for fd in conn['channels'].keys():
+        if (conn['channels'][fd] == channel_id and conn_table[fd]['service'] == service):
+            queue_channel(conn_table[fd], 'channel mark ' + conn['service'] + ' ' + channel_id + '\n', None)
+
+# Forget a module's channel to a service, which has closed, and tell the other end.
+# Nothing happens if the channel has already gone, so a late close can't take a
+# newer channel to the service with it.
+# Input: conn, the module's connection record.  service, the service name.
+# channel_id, the channel's number.
+# Output: None.
+
+def close_channel(conn, service, channel_id):
+    for fd in conn['channels'].keys():
+        other = conn_table[fd]
+        if (conn['channels'][fd] == channel_id and other['service'] == service):
+            del conn['channels'][fd]
+            del other['channels'][conn['fd']]
+            queue_channel(other, 'channel closed ' + conn['service'] + ' ' + channel_id + '\n', None)
+            log_message = 'close_channel: Direct channel between ' + conn['service'] + ' and ' + service + ' closed.'
             debug(log_message)
 
+# Close the channels of a connection that's closing: tell the modules at the other
+# ends, and close any channel ends that never went out.
+# Input: conn, the connection record.
+# Output: None.
+
+def drop_channels(conn):
+    for fd in conn['channels'].keys():
+        other = conn_table[fd]
+        del other['channels'][conn['fd']]
+        queue_channel(other, 'channel closed ' + conn['service'] + ' ' + conn['channels'][fd] + '\n', None)
+    conn['channels'] = {}
+    for message in conn['wqueue']:
+        if (type(message) == ChannelNotice and message.sock != None):
+            message.sock.close()
+            message.sock = None
+    conn['notices'] = 0
+
+# Restarting without dropping connections.  A SIGHUP makes the EDS start a new copy
+# of itself (its successor), which reads the config file afresh, so a restart can
+# pick up a new [module_reg] entry, or a new version of this file.  Once the
+# successor has read its config, it says it's ready on a Unix domain socket pair it
+# shares with the old EDS, which stops routing and hands over everything it has:
+# its listening sockets and module connections go across as SCM_RIGHTS data (see
+# Modules/eds_fdpass.py), and a description of each connection (its service,
+# subscriptions, framing, the partial message in its receive buffer, the messages
+# still waiting to be routed from it and to be sent to it) and the service table,
+# held messages and statistics go across as a pickle.  The successor carries on
+# with those connections, which never notice, and opens listeners for anything
+# new in its config.  Once it says it's done, the old EDS closes its copies of the
+# sockets and exits.  If the successor fails before then, the old EDS kills it and
+# carries on where it left off.  Direct channels between modules carry on as they
+# are, but a channel end still waiting to go out is lost.  Metrics connections
+# and links to other nodes aren't handed over (the links are made again), and
+# sharded mode can't be restarted this way.
+
+# Ask for a restart.  Called for SIGHUP.  The restart starts at the end of the
+# current pass of the event loop (see end_pass()).
+# Input: signum, frame, as for any signal handler.
+# Output: None.
+
+def restart_eds(signum, frame):
+    global restart_pending
+    restart_pending = 1
+
+# Start the successor: a new select_ports.py, run the way this one was, with its
+# end of a socket pair, whose file descriptor is passed in EDS_HANDOFF_FD.  Nothing
+# else this process has open is left open in it.
+# No input, no output.
+
+def start_successor():
+    global restart_pending, successor
+    restart_pending = 0
+    if (successor != None):
+        warning('start_successor: A restart is already under way.')
+        return
+    info('start_successor: Restarting.')
+    my_sock, other_sock = socket.socketpair(socket.AF_UNIX, socket.SOCK_STREAM)
+    keep_fd = other_sock.fileno()
+    sys.stdout.flush()
+    pid = os.fork()
+    if (pid == 0):
+        try:
             try:
-                # We don't want this blocking.  Turn it off while we do the send, then turn it back on,
-                # before another read or poll is attempted.
-                sock_obj_list[i][0].setblocking(0)
-                
-                # Add a CR to the data before it gets sent.  Without this, the receiving socket
-                # will in all likelihood not see the sent data.
-                s_data = s_data + '\n'
+                fds = map(int, os.listdir('/proc/self/fd'))
+            except OSError:
+                fds = range(3, os.sysconf('SC_OPEN_MAX'))
+            for fd in fds:
+                if (fd > 2 and fd != keep_fd):
+                    try:
+                        os.close(fd)
+                    except OSError:
+                        pass
+            os.environ['EDS_HANDOFF_FD'] = str(keep_fd)
+            os.execv(sys.executable, [sys.executable] + sys.argv)
+        finally:
+            os._exit(1)
+    other_sock.close()
+    conn = add_connection(my_sock, 'successor', 7)
+    conn['pid'] = pid
+    conn['ready'] = 0
+    conn['timer'] = call_later(config_data['eds']['handoff_timeout'], drop_successor, (conn, 'did not get ready in time'))
+    successor = conn
+    log_message = 'start_successor: Started the successor as process ' + str(pid) + '.'
+    debug(log_message)
 
-                # Send the data to the correct socket, and print a status message.
-                sock_obj_list[i][0].send(s_data)
-                log_message = 'route_data: data send (' + s_data + ') successful.'
-                debug(log_message)
+# Give up on a restart: stop the successor, and carry on.
+# Input: conn, the connection record of the successor's socket.  reason, why, for
+# the log.
+# Output: None.
 
-                # Make the socket blocking again.
-                sock_obj_list[i][0].setblocking(1)
-                
-            except:
-                log_message = 'route_data: WARNING:' + 'The attempt to send data (' + s_data + ') failed.'
-                debug(log_message)
-                sock_obj_list[i][0].setblocking(1)
-                
+def drop_successor(conn, reason):
+    global successor
+    log_message = 'drop_successor: The successor (process ' + str(conn['pid']) + ') ' + reason + '.  Not restarting.'
+    warning(log_message)
+    cancel_timer(conn['timer'])
+    if (conn_table.get(conn['fd']) is conn):
+        remove_connection(conn)
+    try:
+        os.kill(conn['pid'], signal.SIGKILL)
+    except OSError:
+        pass
+    try:
+        os.waitpid(conn['pid'], 0)
+    except OSError:
+        pass
+    successor = None
+
+# Describe a connection for the successor.
+# Input: conn, a listener or module connection record.
+# Output: a hash table of what the successor needs to carry on with it.
+
+def connection_state(conn):
+    state = {'fd': conn['fd'], 'type': conn['type'], 'family': conn['sock'].family,
+             'service': conn['service']}
+    if (conn['type'] != 1):
+        return state
+    for key in ('instance', 'gen', 'framed', 'frame_out', 'discard', 'skip', 'woffset', 'urgent', 'wdone', 'max_queue', 'channel_ok') + tuple(conn_counters):
+        state[key] = conn[key]
+    state['subs'] = conn['subs'].keys()
+    state['channels'] = conn['channels'].items()
+    state['entries'] = conn['entries']
+    state['input'] = str(conn['rbuf'][conn['rstart']:conn['rend']])
+    state['rscan'] = conn['rscan'] - conn['rstart']
+    state['backlog'] = map(lambda message: (message[0], message[1].tobytes()), conn['backlog'])
+    state['output'] = []
+    for message in conn['wqueue']:
+        if (type(message) == memoryview):
+            message = message.tobytes()
+        state['output'].append(str(message))
+    return state
+
+# Hand everything over to the successor, once it's ready.  Runs at the end of a
+# pass of the event loop, which stops afterwards.  Module connections are
+# described in service order, oldest first, so their order in service_table
+# survives.  If the successor doesn't confirm it has taken over, this EDS carries on
+# as if nothing had happened: nothing it has is changed until then.
+# Input: conn, the connection record of the successor's socket.
+# Output: None.
+
+def hand_over(conn):
+    global running, handed_over, successor
+    cancel_timer(conn['timer'])
+    if (journal != None):
+        # The successor reads the journal once it's taken over, so everything
+        # has to be in it.
+        commit_journal()
+        try:
+            journal.commit()
+        except (IOError, OSError), exc:
+            log_message = 'hand_over: Unable to write the journal (' + str(exc) + ').'
+            critical(log_message)
+            drop_successor(conn, 'journal not written')
+            return
+    flush_pending()
+    if (capture != None):
+        capture.flush()
+    start_time = time.time()
+
+    conns = []
+    for other in conn_table.values():
+        if (other['type'] == 0 or other['type'] == 2 or other['type'] == 9):
+            conns.append(other)
+    for service in service_table.keys():
+        for fd in service_table[service]:
+            conns.append(conn_table[fd])
+    for other in conn_table.values():
+        if (other['type'] == 1 and other['service'] == ''):
+            conns.append(other)
+
+    held = {}
+    for s_name in held_table.keys():
+        held[s_name] = []
+        for expiry, data, src_conn, priority, entry in held_table[s_name]:
+            held[s_name].append((expiry, data, src_conn['fd'], src_conn['service'], priority, entry))
+    state = {'conns': map(connection_state, conns),
+             'services': service_table.keys(),
+             'service_gen': service_gen,
+             'service_rr': service_rr,
+             'held': held,
+             'stats': service_stats,
+             'journal_refs': journal_refs}
+    data = pickle.dumps(state, 2)
+
+    sock = conn['sock']
+    try:
+        sock.setblocking(1)
+        sock.sendall(str(len(data)) + '\n' + data)
+        for other in conns:
+            eds_fdpass.send_fds(sock, 'F', [other['fd']])
+        ready = select.select([sock], [], [], config_data['eds']['handoff_timeout'])[0]
+        if (len(ready) == 0):
+            raise socket.error('timed out')
+        answer = sock.recv(16)
+    except (socket.error, select.error):
+        answer = ''
+    if (answer != 'done\n'):
+        drop_successor(conn, 'failed to take over')
+        return
+
+    log_message = 'hand_over: Handed ' + str(len(conns)) + ' sockets over to process ' + str(conn['pid']) + ' in ' + ('%.1f' % ((time.time() - start_time) * 1000)) + ' ms.  Stopping.'
+    info(log_message)
+    handed_over = 1
+    running = 0
+
+# Handle an event on the successor's socket: the successor is ready to take over,
+# or it has stopped.  The hand over happens at the end of the pass, once the
+# messages read during it have been routed, and nothing more will be read.
+# Input: conn, the connection record of the successor's socket.
+# Output: None.
+
+def successor_event(conn):
+    try:
+        data = conn['sock'].recv(16)
+    except socket.error:
+        return
+    if (data == 'ready\n'):
+        conn['ready'] = 1
+    else:
+        drop_successor(conn, 'stopped')
+
+# Read exactly size bytes from a blocking socket.
+# Input: sock, the socket.  size, the number of bytes.
+# Output: the data.  Raises socket.error if the socket closes first.
+
+def recv_exact(sock, size):
+    chunks = []
+    while (size > 0):
+        data = sock.recv(min(size, 1048576))
+        if (data == ''):
+            raise socket.error('connection closed')
+        chunks.append(data)
+        size = size - len(data)
+    return string.join(chunks, '')
+
+# In the successor, take over from the EDS that started it.  Listening sockets are
+# kept in adopted_listeners until the listeners are opened (see open_listener()),
+# and module connections carry on straight away.
+# Input: fd, the file descriptor of the socket shared with the old EDS.
+# Output: the socket, for finish_take_over().  Exits if the hand over fails, which
+# leaves the old EDS running.
+
+def take_over(fd):
+    global channel_count
+    sock = socket.fromfd(fd, socket.AF_UNIX, socket.SOCK_STREAM)
+    os.close(fd)
+    try:
+        sock.sendall('ready\n')
+        line = ''
+        while (line[-1:] != '\n'):
+            line = line + recv_exact(sock, 1)
+        state = pickle.loads(recv_exact(sock, int(line)))
+        socks = []
+        for c_state in state['conns']:
+            data, fds = eds_fdpass.recv_fds(sock, 1)
+            if (len(fds) != 1):
+                raise socket.error('expected a socket from the old EDS')
+            socks.append(socket.fromfd(fds[0], c_state['family'], socket.SOCK_STREAM))
+            os.close(fds[0])
+    except (socket.error, ValueError, EOFError, pickle.UnpicklingError), exc:
+        log_message = 'take_over: Unable to take over from the old EDS (' + str(exc) + ').  Stopping.'
+        critical(log_message)
+        sys.exit(1)
+
+    for service in state['services']:
+        if (service_table.has_key(service) == 0):
+            service_table[service] = []
+    service_rr.update(state['service_rr'])
+    service_stats.update(state['stats'])
+    journal_refs.update(state['journal_refs'])
+
+    restored = {}
+    for i in range(len(socks)):
+        c_state = state['conns'][i]
+        if (c_state['type'] == 1):
+            restored[c_state['fd']] = restore_connection(socks[i], c_state)
+        elif (c_state['family'] == socket.AF_INET):
+            adopted_listeners[socks[i].getsockname()[1]] = socks[i]
+        else:
+            adopted_listeners[socks[i].getsockname()] = socks[i]
+    # Direct channels are between the same connections, under their new numbers,
+    # and new ones are numbered on from the old EDS's.
+    for c_state in state['conns']:
+        if (c_state['type'] == 1):
+            for other_fd, channel_id in c_state['channels']:
+                if (restored.has_key(other_fd)):
+                    restored[c_state['fd']]['channels'][restored[other_fd]['fd']] = channel_id
+                    channel_count = max(channel_count, int(channel_id))
+
+    # Connections are numbered on from where the old EDS left off.
+    for service in state['service_gen'].keys():
+        service_gen[service] = max(service_gen.get(service, 0), state['service_gen'][service])
+
+    # Held messages keep their sender, if it's still connected.
+    for s_name in state['held'].keys():
+        held_table[s_name] = collections.deque()
+        for expiry, data, src_fd, src_service, priority, entry in state['held'][s_name]:
+            src_conn = restored.get(src_fd, gone_source(src_service))
+            held_table[s_name].append([expiry, data, src_conn, priority, entry])
+    expire_held_timer(expire_held())
+
+    log_message = 'take_over: Took over ' + str(len(restored)) + ' connections and ' + str(len(adopted_listeners)) + ' listeners.'
+    info(log_message)
+    return sock
+
+# Carry on with a module connection the old EDS handed over, as it left it.
+# Input: sock, the socket.  c_state, its description (see connection_state()).
+# Output: the new connection record.
+
+def restore_connection(sock, c_state):
+    service = c_state['service']
+    if (service != '' and service_table.has_key(service) == 0):
+        service_table[service] = []
+    conn = add_connection(sock, service, 1)
+    for key in ('instance', 'gen', 'framed', 'frame_out', 'discard', 'skip', 'woffset', 'urgent', 'wdone', 'max_queue', 'channel_ok') + tuple(conn_counters):
+        conn[key] = c_state[key]
+    for topic in c_state['subs']:
+        subscribe(conn, topic)
+    conn['entries'] = c_state['entries']
+
+    # What the old EDS had read of a message still to come, and the messages it
+    # hadn't routed yet.
+    partial = c_state['input']
+    if (len(partial) > len(conn['rbuf'])):
+        log_message = 'restore_connection: Partial message from ' + service + ' too big for its buffer.  Discarding it.'
+        warning(log_message)
+        partial = ''
+        conn['discard'] = 1
+    conn['rbuf'][0:len(partial)] = partial
+    conn['rend'] = len(partial)
+    conn['rscan'] = min(c_state['rscan'], len(partial))
+    for s_name, data in c_state['backlog']:
+        conn['backlog'].append((s_name, memoryview(data)))
+    if (len(conn['backlog']) > 0):
+        conn['active'] = 1
+        active_sources.append(conn)
+
+    # What it hadn't sent yet.
+    for data in c_state['output']:
+        conn['wqueue'].append(data)
+        conn['wbytes'] = conn['wbytes'] + len(data)
+    if (len(conn['wqueue']) > 0):
+        conn['wtime'] = time.time()
+        flush_table[conn['fd']] = conn
+    update_interest(conn)
+    return conn
+
+# In the successor, once the listeners are open, close any listeners handed over
+# that the new config doesn't have, and tell the old EDS it can stop.
+# Input: sock, the socket shared with the old EDS.
+# Output: None.
+
+def finish_take_over(sock):
+    for address in adopted_listeners.keys():
+        log_message = 'finish_take_over: Closing listener on ' + str(address) + ', which is no longer configured.'
+        info(log_message)
+        adopted_listeners[address].close()
+        if (type(address) == str):
+            try:
+                os.unlink(address)
+            except OSError:
+                pass
+        del adopted_listeners[address]
+    try:
+        sock.sendall('done\n')
+    except socket.error:
+        pass
+    sock.close()
+
+# Ask the event loop to stop.  Called for SIGTERM and SIGINT (Ctrl-C), which also
+# interrupt the wait for events.
+# Input: signum, frame, as for any signal handler.
+# Output: None.
+
+def stop_eds(signum, frame):
+    global running
+    running = 0
+
+# Shut the EDS down cleanly, once the event loop has stopped: give queued data one
+# last chance to go out, close every connection and listener, remove the Unix
+# domain sockets, and write out the log.
+# No input, no output.
+
+def shutdown_eds():
+    if (handed_over == 1):
+        # The successor has the sockets now.  Only close this process's copies.
+        for conn in conn_table.values():
+            conn['sock'].close()
+        backend.close()
+        if (capture != None):
+            capture.close()
+        if (journal != None):
+            journal.close()
+        logger.close()
+        return
+    info('shutdown: Stopping.')
+    for conn in conn_table.values():
+        if ((conn['type'] == 1 or conn['type'] == 3 or conn['type'] == 8) and len(conn['wqueue']) > 0):
+            flush_queue(conn)
+    for conn in conn_table.values():
+        remove_connection(conn)
+    for path in unix_paths:
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+    backend.close()
+    if (capture != None):
+        capture.close()
+    if (journal != None):
+        try:
+            journal.close()
+        except (IOError, OSError), exc:
+            log_message = 'shutdown: Unable to write the journal (' + str(exc) + ').'
+            critical(log_message)
+    logger.close()
+
+# Create the event backend for the server mode.  In asyncore mode, asyncore does
+# the waiting, and the event_backend option only chooses between its poll() and
+# select() loops.
+# No input.
+# Output: the backend.  Raises ValueError if the server mode or event backend is
+# unknown.
+
+def open_event_backend():
+    if (config_data['eds']['server_mode'] == 'asyncore'):
+        return DispatcherBackend()
+    elif (config_data['eds']['server_mode'] == 'poll'):
+        return eds_backend.open_backend(config_data['eds']['event_backend'])
+    raise ValueError('unknown server mode ' + config_data['eds']['server_mode'])
+
+# Open a capture file to record every message received to.
+# Input: path, the file name.
+# Output: the CaptureWriter, or None if the file can't be opened.
+
+def open_capture(path):
+    try:
+        writer = eds_capture.CaptureWriter(path)
+        log_message = 'init: Recording traffic to ' + path
+        info(log_message)
+        return writer
+    except IOError, exc:
+        log_message = 'init: Unable to open capture file ' + path + ' (' + str(exc) + ').  Not recording traffic.'
+        warning(log_message)
+        return None
 
 
 # -- MAIN PROGRAM --
@@ -210,6 +3566,15 @@ def route_data(indata):
 print 'init: Welcome to Turbolift. Starting up...'
 print 'init: Beginning initialization.'
 
+# Create the logger behind debug(), warning() and critical().  Messages logged
+# before it's configured, below, are only kept in memory.
+try:
+    import turbolog
+except ImportError:
+    print 'init: CRITICAL: You must install the Modules/turbolog.py module in your Python module directory.  Stopping.'
+    sys.exit(1)
+logger = turbolog.Logger('eds')
+
 # Config file to use.
 config_file_loc = "Config/alice.config"
 log_message = 'init: Using configuration file ' + config_file_loc
@@ -222,7 +3587,36 @@ print 'init: Configuration object created.'
 # Build list of static options to retrieve from config file:
 config_options = [('eds', 'debug_flag', 'b'),\
                   ('eds', 'log_messages', 'b'),\
-                  ('eds', 'log_file', 's')]
+                  ('eds', 'log_file', 's'),\
+                  ('eds', 'max_message_size', 'i', 8192),\
+                  ('eds', 'recv_size', 'i', 16384),\
+                  ('eds', 'event_backend', 's', 'auto'),\
+                  ('eds', 'max_queue_bytes', 'i', 65536),\
+                  ('eds', 'send_buffer_size', 'i', 0),\
+                  ('eds', 'queue_policy', 's', 'block'),\
+                  ('eds', 'dispatch_policy', 's', 'single'),\
+                  ('eds', 'listen_backlog', 'i', 5),\
+                  ('eds', 'register_port', 'i', 0),\
+                  ('eds', 'unix_socket_dir', 's', ''),\
+                  ('eds', 'pending_max_messages', 'i', 100),\
+                  ('eds', 'pending_ttl', 'f', 30.0),\
+                  ('eds', 'metrics_port', 'i', 0),\
+                  ('eds', 'server_mode', 's', 'poll'),\
+                  ('eds', 'keepalive_interval', 'i', 0),\
+                  ('eds', 'capture_file', 's', ''),\
+                  ('eds', 'source_quantum', 'i', 4096),\
+                  ('eds', 'shards', 'i', 0),\
+                  ('eds', 'handoff_timeout', 'f', 10.0),\
+                  ('eds', 'journal_file', 's', ''),\
+                  ('eds', 'journal_interval', 'f', 0.01),\
+                  ('eds', 'journal_compact_bytes', 'i', 1048576),\
+                  ('eds', 'node_name', 's', ''),\
+                  ('eds', 'peer_port', 'i', 0),\
+                  ('eds', 'peer_retry', 'f', 5.0),\
+                  ('logging', 'log_level', 's', 'debug'),\
+                  ('logging', 'ring_level', 's', 'warning'),\
+                  ('logging', 'ring_size', 'i', 1000),\
+                  ('logging', 'flush_interval', 'f', 0.5)]
 
 # Location of module registration information section
 modreg_sec = 'module_reg'
@@ -242,8 +3636,53 @@ for i in range(len_rmodule_list):
     # Append the dynamically generated config file info to the list.
     config_options.append(rmodule_list[i])
 
+# Per-service queue and dispatch policies, rate limits, and priority and durable
+# commands, from the optional queue_policy, dispatch_policy, rate_limit, priority
+# and durable sections.  The addresses of other nodes come from the optional
+# peers section.
+policy_sec = 'queue_policy'
+dispatch_sec = 'dispatch_policy'
+rate_sec = 'rate_limit'
+priority_sec = 'priority'
+durable_sec = 'durable'
+peer_sec = 'peers'
+for c_section in (policy_sec, dispatch_sec, rate_sec, priority_sec, durable_sec, peer_sec):
+    if (config_obj.has_section(c_section) == 1):
+        for policy_opt in grab_section_optlist(config_obj, c_section):
+            config_options.append((c_section, policy_opt, 's'))
+
 # In one pass, build the config_data hash table.
 config_data = set_configs(config_obj, config_options)
+for c_section in (policy_sec, dispatch_sec, rate_sec, priority_sec, durable_sec, peer_sec):
+    if (config_data.has_key(c_section) == 0):
+        config_data[c_section] = {}
+
+# Hash table of the priority commands for each service, from the priority section
+# (see command_priority()), each a hash table keyed by the command.
+priority_rules = {}
+for c_service in config_data[priority_sec].keys():
+    priority_rules[c_service] = {}
+    for c_command in string.split(config_data[priority_sec][c_service]):
+        priority_rules[c_service][c_command] = 1
+
+# The same for the durable commands, from the durable section (see
+# command_durable()).
+durable_rules = {}
+for c_service in config_data[durable_sec].keys():
+    durable_rules[c_service] = {}
+    for c_command in string.split(config_data[durable_sec][c_service]):
+        durable_rules[c_service][c_command] = 1
+
+# Hash table of the (host, port) addresses of the nodes to make links to, from the
+# peers section, keyed by node name.
+peer_addresses = {}
+for c_node in config_data[peer_sec].keys():
+    try:
+        c_host, c_port = string.split(config_data[peer_sec][c_node], ':')
+        peer_addresses[c_node] = (c_host, int(c_port))
+    except ValueError:
+        log_message = 'init: Bad address for node ' + c_node + ' (' + config_data[peer_sec][c_node] + ').  Ignoring it.'
+        print log_message
 
 # Create a blank list that holds our list of listener ports for modules to connect to.
 port_list = []
@@ -258,349 +3697,338 @@ for i in range(len_rmodule_list):
 
 print 'init: Module registration completed successfully.'
   
-# Try to open a log file, if this feature has been enabled.
-
+# Start logging, to the console and log file as configured.  Until now, messages
+# have only been kept in memory.  Sending the process a SIGUSR1 writes out the
+# most recent messages, whatever their level.
+log_file = None
 if (config_data['eds']['log_messages'] == 1):
-    try:
-        log_fd = open(config_data['eds']['log_file'], 'a')
+    log_file = config_data['eds']['log_file']
+log_sec = config_data['logging']
+if (logger.configure(config_data['eds']['debug_flag'], log_file,
+                     turbolog.level_value(log_sec['log_level']),
+                     turbolog.level_value(log_sec['ring_level']),
+                     log_sec['ring_size'], log_sec['flush_interval']) == 0):
+    log_message = 'init: WARNING: Unable to open log file at ' + log_file
+    print log_message
+    print 'init: WARNING: Logging will occur to console only.'
+    config_data['eds']['log_messages']  = 0
+turbolog.dump_on_signal(logger)
 
-    except IOError:
-        log_message = 'init: WARNING: Unable to open log file at ' + config_data['eds']['log_file']
-        print log_message
-        print 'init: WARNING: Logging will occur to console only.'
-        config_data['eds']['log_messages']  = 0
+# Set to 1 if debug() messages are logged anywhere, or kept in the ring buffer.
+# Debug messages that are costly to put together are only built when it's set.
+debug_enabled = logger.enabled(turbolog.DEBUG)
         
-# Create polling object.  Poll doesn't work on all operating systems (Windows is the main culprit)
-# We use an alternate technique if this call throws an AttributeError.
-# alt_poll_flag is a check variable.  If set to 0, we assume that select.poll() style methods
-# such as select.register() can be used safely.  If set to 1 (by way of an AttributeError),
-# we assume that these methods are NOT safe, and use the poll_emulate module instead.
+# Create the event backend, which tells us which sockets are ready.  The backend is
+# picked by the event_backend option: epoll on Linux, poll, or select.select() on
+# operating systems that have neither (Windows is the main culprit).  'auto' picks
+# the best one available.  All of them report events in select.poll() form.
 try:
-    # Uncomment the line below to test the select.select() compatibility code.
-    # raise AttributeError
-    poll_obj = select.poll()
-    alt_poll_flag = 0
-    
-except AttributeError:
-    debug('init: select.poll() not implemented on this operating system.')
-    try:
-        import poll_emulate
-        # Set alt_poll_flag to 1 so we'll use select.select compatible routines further
-        # on in the program.
-        alt_poll_flag = 1
-
-        # Set up the three event lists that select.select() needs to operate.
-        # input_event - list of input events
-        # output_event - list of output events
-        # ex_event - list of exceptional events (errors, presumably)
-        input_event = []
-        output_event = []
-        ex_event = []
-        
-    except ImportError:
-        debug('init: CRITICAL: You must install the Module/poll_emulate.py module in your Python module directory.  Stopping.')
-        sys.exit(1)
-    
-# List of associated file descriptor numbers.  These match up
-# by subscript with the values in port_list, above.
-fileno_list = []
+    import eds_backend
+except ImportError:
+    critical('init: You must install the Modules/eds_backend.py module in your Python module directory.  Stopping.')
+    sys.exit(1)
+
+try:
+    import eds_frame
+except ImportError:
+    critical('init: You must install the Modules/eds_frame.py module in your Python module directory.  Stopping.')
+    sys.exit(1)
+
+try:
+    import eds_capture
+except ImportError:
+    critical('init: You must install the Modules/eds_capture.py module in your Python module directory.  Stopping.')
+    sys.exit(1)
+
+try:
+    import eds_fdpass
+except ImportError:
+    critical('init: You must install the Modules/eds_fdpass.py module in your Python module directory.  Stopping.')
+    sys.exit(1)
 
-# List of socket objects.
-sock_obj_list = []
+try:
+    import eds_journal
+except ImportError:
+    critical('init: You must install the Modules/eds_journal.py module in your Python module directory.  Stopping.')
+    sys.exit(1)
+
+# Number of worker processes in sharded mode (see shard_of(), above), or 1 if the
+# EDS runs as a single process.
+shard_count = max(config_data['eds']['shards'], 1)
+if (shard_count > 1 and eds_fdpass.available() == 0):
+    critical('init: Sharded mode needs file descriptor passing, which this system does not have.  Stopping.')
+    sys.exit(1)
 
-# Number of sockets to create:
-num_sockets = len(port_list)
+# A sharded EDS's supervisor only accepts connections, so it always polls.  Its
+# workers make backends of their own (see run_shard()).
+try:
+    backend = open_event_backend()
+    if (shard_count > 1 and backend.name == 'asyncore'):
+        backend = eds_backend.open_backend(config_data['eds']['event_backend'])
+except ValueError, exc:
+    log_message = 'init: ' + str(exc) + '.  Stopping.'
+    critical(log_message)
+    sys.exit(1)
+log_message = 'init: Using ' + backend.name + ' event backend.'
+debug(log_message)
+    
+# Connection records, keyed by file descriptor number.  Each record is a hash
+# table holding the socket object ('sock'), its file descriptor ('fd'), the
+# service name it belongs to ('service') and its socket type ('type'), which
+# is 0 for listening sockets, and 1 for connected sockets.
+conn_table = {}
+
+# Live connections for each service, keyed by service name.  Values are lists
+# of file descriptor numbers (keys into conn_table), oldest connection first.
+service_table = {}
+
+# Bytes trimmed from the ends of message data, and the newline that ends a message,
+# as they appear when indexing a receive buffer.
+whitespace_bytes = map(ord, string.whitespace)
+newline_byte = ord('\n')
+
+# Connection generation counters, and round robin positions, keyed by service name.
+service_gen = {}
+service_rr = {}
+
+# Service name for commands to the EDS itself.
+eds_service = 'eds'
+
+# Topic subscriptions.  See subscribe(), above.
+topic_subs = {}
+pattern_subs = {}
+topic_cache = {}
+
+# Messages held for services that aren't connected, keyed by service name.  See
+# hold_message(), above.
+held_table = {}
+
+# Traffic statistics for each service, keyed by service name.  See
+# service_stats_for(), above.
+service_stats = {}
+
+# Time the current pass of the event loop started.
+pass_time = time.time()
+
+# Connections with messages waiting to be routed, in the order they're served (see
+# run_sources()), and how long the event loop can wait before serving them again.
+active_sources = []
+source_timeout = None
+
+# Token buckets of rate limited services, keyed by service name.  Services without
+# a rate limit map to None.
+rate_buckets = {}
+
+# Pending timers (see call_later(), above), and the timer that expires held
+# messages, if any are held.
+timer_heap = []
+timer_seq = 0
+held_timer = None
+
+# Dispatchers for asyncore mode, keyed by file descriptor.
+dispatcher_map = {}
+
+# Unix domain socket files to remove at shutdown.
+unix_paths = []
+
+# Set to 0 to stop the event loop.
+running = 1
+
+# Capture file every message received is recorded to, or None.  See
+# Modules/eds_capture.py for the format, and eds_replay.py to play it back.  In
+# sharded mode, each worker records its own (see run_shard()).
+capture = None
+if (config_data['eds']['capture_file'] != '' and shard_count == 1):
+    capture = open_capture(config_data['eds']['capture_file'])
+
+# Journal durable messages are written to, or None.  See park_message(), above.
+# It's opened once any EDS this one is taking over from has committed what it
+# has.  journal_parked holds the messages waiting for the next commit, and
+# journal_timer is the timer for it.  journal_refs counts the places each journal
+# entry is waiting, keyed by entry number.
+journal = None
+journal_parked = []
+journal_timer = None
+journal_refs = {}
+if (config_data['eds']['journal_file'] != '' and shard_count > 1):
+    warning('init: Durable messages are not supported in sharded mode.  Not journalling.')
+
+# Sharded mode.  shard_id is this worker's shard number, or None in the supervisor,
+# or a single process EDS.  The shard each name belongs to is cached in
+# shard_cache.  shard_links holds the links to the other workers, keyed by shard
+# number, and shard_subs the number of this worker's connections subscribed to
+# each topic or pattern.  The supervisor keeps the shard number of each worker
+# process, keyed by process id, in workers, and its sockets to the workers in
+# worker_socks.  next_shard is the worker that gets the next connection that
+# doesn't register first.
+shard_id = None
+shard_cache = {}
+shard_links = {}
+shard_subs = {}
+workers = {}
+worker_socks = []
+next_shard = 0
+
+# Federation (see open_peer()).  federated is 1 if this node links to others.  Its
+# name is node_name.  peer_links holds the links to other nodes, keyed by file
+# descriptor number, and peer_services the link to the node each service is up
+# on, keyed by service name.  The number of this node's connections subscribed to
+# each topic or pattern is kept in shard_subs, as in sharded mode.
+federated = 0
+node_name = config_data['eds']['node_name']
+if (node_name == ''):
+    node_name = socket.gethostname()
+node_name = string.lower(node_name)
+peer_links = {}
+peer_services = {}
+if (config_data['eds']['peer_port'] != 0 or len(peer_addresses) > 0):
+    if (shard_count > 1):
+        warning('init: Linking to other nodes is not supported in sharded mode.  Not linking.')
+    else:
+        federated = 1
+
+# Direct channels (see open_channel()).  channel_count is the number of the last
+# channel opened.
+channel_count = 0
+
+# Restarts (see restart_eds()).  restart_pending is set when a restart has been
+# asked for, and successor is the connection record of the successor's socket
+# while one is starting.  handed_over is set once it has taken over.  In a
+# successor, handoff_sock is the socket shared with the EDS it's taking over
+# from, and adopted_listeners holds the listening sockets that EDS handed over
+# that haven't been opened yet, keyed by port number, or path for Unix domain
+# sockets.
+restart_pending = 0
+successor = None
+handed_over = 0
+handoff_sock = None
+adopted_listeners = {}
+
+# Connections with queued data to write at the end of the current pass of the
+# event loop, keyed by file descriptor number.
+flush_table = {}
 
 # Print a startup message.
 debug('init: Starting up EDS server.')
 
-# Create socket objects for each port in port_list, append to sock_obj_list in
-# the form of a tuple (socket object, socket type), where socket type is 0 for
-# listening sockets, and 1 for connected sockets.
+# Every registered module has a service.
+for i in range(len_rmodule_list):
+    service_table[rmodule_list[i][1]] = []
+
+# If this EDS was started by another one restarting, take over its connections.
+if (os.environ.has_key('EDS_HANDOFF_FD')):
+    handoff_fd = int(os.environ['EDS_HANDOFF_FD'])
+    del os.environ['EDS_HANDOFF_FD']
+    if (shard_count > 1):
+        critical('init: Unable to take over from another EDS in sharded mode.  Stopping.')
+        sys.exit(1)
+    handoff_sock = take_over(handoff_fd)
 
-for i in range(num_sockets):
-    log_message = 'init: Starting service on port ' + str(port_list[i])
-    debug(log_message)
+# Open the journal, and route whatever durable messages the last EDS left
+# undelivered.
+if (config_data['eds']['journal_file'] != '' and shard_count == 1):
     try:
-        sock_obj_list.append((socket.socket(socket.AF_INET, socket.SOCK_STREAM), 0))
-        sock_obj_list[i][0].setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        sock_obj_list[i][0].bind(('',port_list[i]))
-        sock_obj_list[i][0].listen(1)
-        try:
-            # Add the file descriptor to fileno_list.
-            fileno_list.append(sock_obj_list[i][0].fileno())
-
-            # Register the fd with poll_obj.
-            if (alt_poll_flag == 0):
-                poll_obj.register(sock_obj_list[i][0], 3)
-
-            if (alt_poll_flag == 1):
-                input_event, output_event, ex_event = poll_emulate.register(input_event, output_event, ex_event, sock_obj_list[i][0])
-
-                # Debug code -- show contents of event lists used in select.select()
-                # Commented out here, because it's a bit too verbose.
-                #log_message = 'input_event: ' + str(input_event)
-                #debug(log_message)
-                #log_message = 'output_event: ' + str(output_event)
-                #debug(log_message)
-                #log_message = 'ex_event: ' + str(ex_event)
-                #debug(log_message)
-        except:
-            log_message = 'init: WARNING: Unable to complete initialization of service on port ' + str(port_list[i])
-            debug(log_message)
-        
+        journal = eds_journal.Journal(config_data['eds']['journal_file'])
+    except (IOError, OSError, ValueError), exc:
+        log_message = 'init: Unable to open journal file ' + config_data['eds']['journal_file'] + ' (' + str(exc) + ').  Stopping.'
+        critical(log_message)
+        sys.exit(1)
+    log_message = 'init: Journalling durable messages to ' + config_data['eds']['journal_file']
+    info(log_message)
+    replay_journal()
+
+# In sharded mode, start the workers now.  This process carries on as the
+# supervisor, with the listening sockets.
+if (shard_count > 1):
+    start_shards()
+
+# Create a listening socket for each registered module, and add a connection
+# record for it to conn_table.
+
+for i in range(len_rmodule_list):
+    open_listener(port_list[i], rmodule_list[i][1])
+
+# Start the registration port, if it's enabled.  Modules connecting here name the
+# service they provide with 'eds: register service_name', so they don't need a
+# port of their own in the [module_reg] section.
+if (config_data['eds']['register_port'] != 0):
+    debug('init: Starting registration port.')
+    open_listener(config_data['eds']['register_port'], '')
+
+# Start the metrics port, if it's enabled.  It only listens on the local host.
+if (config_data['eds']['metrics_port'] != 0 and adopted_listeners.has_key(config_data['eds']['metrics_port'])):
+    add_connection(adopted_listeners.pop(config_data['eds']['metrics_port']), '', 2)
+elif (config_data['eds']['metrics_port'] != 0):
+    debug('init: Starting metrics port.')
+    try:
+        listen_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        listen_sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        listen_sock.bind(('127.0.0.1', config_data['eds']['metrics_port']))
+        listen_sock.listen(config_data['eds']['listen_backlog'])
+        add_connection(listen_sock, '', 2)
     except socket.error:
-        log_message = 'init: WARNING: Unable to start service on port ' + str(port_list[i])
-        debug(log_message)
+        log_message = 'init: Unable to start metrics port on ' + str(config_data['eds']['metrics_port'])
+        warning(log_message)
+
+# Start Unix domain listeners alongside the TCP ones, if unix_socket_dir is set.
+# Each service's socket is named after it, and the registration port's is eds.sock.
+unix_dir = config_data['eds']['unix_socket_dir']
+if (unix_dir != '' and hasattr(socket, 'AF_UNIX')):
+    # Modules connect to whatever socket they find in the directory, so it's
+    # kept private to this user.
+    if (os.path.isdir(unix_dir) == 0):
+        try:
+            os.makedirs(unix_dir, 0700)
+        except OSError:
+            log_message = 'init: Unable to create Unix socket directory ' + unix_dir
+            warning(log_message)
+    else:
+        dir_stat = os.stat(unix_dir)
+        if (dir_stat.st_uid != os.getuid() or dir_stat.st_mode & 022):
+            log_message = 'init: Unix socket directory ' + unix_dir + ' is not private to this user.  Another user could put a fake EDS there.'
+            warning(log_message)
+    for i in range(len_rmodule_list):
+        s_name = rmodule_list[i][1]
+        open_unix_listener(os.path.join(unix_dir, s_name + '.sock'), s_name)
+    if (config_data['eds']['register_port'] != 0):
+        open_unix_listener(os.path.join(unix_dir, eds_service + '.sock'), '')
 
 # Check to make sure that some modules actually got started successfully.
 # Die with an error if not.
 
-if (len(fileno_list) == 0):
-    debug('init: CRITICAL: 0 modules successfully registered. Terminating application.')
+if (len(conn_table) == 0):
+    critical('init: 0 modules successfully registered. Terminating application.')
     sys.exit(1)
 
-# Poll for data on each of the registered socket objects.
+# Start the listener for links from other nodes, and make links to the nodes in
+# the peers section.
+if (federated == 1):
+    if (config_data['eds']['peer_port'] != 0):
+        debug('init: Starting peer port.')
+        open_listener(config_data['eds']['peer_port'], '', 9)
+    for c_node in peer_addresses.keys():
+        open_peer(c_node)
+
+if (handoff_sock != None):
+    finish_take_over(handoff_sock)
 
-#log_message = 'fileno_list: ' + str(fileno_list)
-#debug(log_message)
 debug('init: Initialization completed successfully.')
 
 # --- Start of event loop --- #
 
-while 1:
-    # Start with an empty list that'll contain data from
-    # our sockets that have events.
-    data_list = []
-
-    # Poll for data on each of the sockets. 
-    debug('event_loop: Waiting for incoming events.')
-    if (alt_poll_flag == 0):
-        event_list = poll_obj.poll()
-
-    # Use an alternate method if we've already concluded that poll() isn't supported.
-    if (alt_poll_flag == 1):
-        debug('event_loop: Polling via select.select() method')
-        event_list_temp = select.select(input_event, output_event, ex_event)
-        log_message = 'event_loop: select.select() format event list: ' + str(event_list_temp)
-        debug(log_message)
-        debug('event_loop: Doing conversion of event list to select.poll() standard.')
-        event_list = poll_emulate.convert_select_elist(event_list_temp)
-                
-    log_message = 'event_loop: event_list: ' + str(event_list)
-    debug(log_message)
-
-    # Number of socket objects returned.
-    event_count = len(event_list)
-    log_message = 'event_loop: event_count: ' + str(event_count)
-    debug(log_message)
-
-    # Update the number of current sockets in sock_obj_list, in order
-    # to ensure that the for loop below operates within the full list.
-    
-    num_sockets = len(sock_obj_list)
-    log_message = 'event_loop: ' + str(num_sockets) + ' sockets detected.'
-    debug(log_message)
-
-    # Match the file descriptor values returned by .poll() into event_list with
-    # the socket that has that file descriptor value in sock_obj_list.
-    # Once we know the socket, call .accept() on it, then read 1024 bytes of data from
-    # it.  Then print the list of retrieved data.  Each item in the list is a two item
-    # tuple in the form (port_number, retrieved_data).
-    
-    for i in range(event_count):
-        current_fd = event_list[i][0]
-        log_message = 'event_loop: Operating on fd ' + str(current_fd)
-        debug(log_message)
-        for b in range(num_sockets):
-            
-            if (current_fd == fileno_list[b]):
-                # If the event we caught is actually incoming data, accept the connection,
-                # and add the connect socket to conn_obj_list.
-
-                if (event_list[i][1] != select.POLLIN):
-                    sys.exit(1)
-                
-                if (event_list[i][1] == select.POLLIN):
-	            # Accept the connection on the socket, and name the connection socket temporarily.
-                    debug('event_loop: Incoming data on socket.')
-                    
-                    if (sock_obj_list[b][1] == 0):
-                        debug('event_loop: Accepting new connection on socket.')
-
-                        # Return the connected socket object from the accept() call,
-                        # Append the new connected socket to the end of sock_obj_list, tagging it as a connected
-                        # socket in the second subscript of the tuple. 
-                        sock_obj_list.append((sock_obj_list[b][0].accept()[0], 1))
-                        
-                        # Debug code to display the contents of sock_obj_list.
-                        # Turn on if you need this sort of verbosity while debugging.
-                        #log_message = 'sock_obj_list: ' + str(sock_obj_list)
-                        #debug(log_message)
-
-                        # Append the port number of the connected socket (same as listening socket) to port_list.
-                        port_list.append(port_list[b])
-                        
-                        # Update number of sockets.
-                        num_sockets = len(sock_obj_list)
-                        log_message = 'event_loop: Now there are ' + str(num_sockets) + ' sockets.'
-                        debug(log_message)
-                        
-                        # Append the file descriptor number to the list of filenos:
-                        fileno_list.append(sock_obj_list[num_sockets-1][0].fileno())
-                        log_message = 'event_loop: fileno_list: ' + str(fileno_list)
-                        debug(log_message)
-                        
-                        # Register the socket with the polling object, so that future events on it get caught.
-                        # If we're using select.select(), do this in a different fashion, via use of the
-                        # poll_emulate.register() command, just like we did for the listener socket above.
-                        if (alt_poll_flag == 0):
-                            poll_obj.register(sock_obj_list[num_sockets-1][0], 3)
-                            
-                        if (alt_poll_flag == 1):
-                            input_event, output_event, ex_event = poll_emulate.register(input_event, output_event, ex_event, sock_obj_list[num_sockets-1][0])
-                            
-                            # Debug code.  Show contents of select's event lists.  Commented out
-                            # for log clarity.
-                            #log_message = 'input_event: ' + str(input_event)
-                            #debug(log_message)
-                            #log_message = 'output_event: ' + str(output_event)
-                            #debug(log_message)
-                            #log_message = 'ex_event: ' + str(ex_event)
-                            #debug(log_message)
-                            
-                        # Read data from the new socket.
-                        # There's no guarantee of there actually being data to read on the socket,
-                        # so we set the socket to be non-blocking before calling recv() on it.
-                        # If there's actual data, the recv() completes successfully, and we continue on.
-                        # If there's no data, a SocketError gets thrown here, which we catch,
-                        # and print an informative error message.
-                        # In both cases, s.setblocking(1) gets called on the socket afterwards, so it'll
-                        # block on future calls.
-
-                        try:
-                            sock_obj_list[num_sockets-1][0].setblocking(0)
-                            data_list.append([port_list[b], sock_obj_list[num_sockets-1][0].recv(1024)])
-                            sock_obj_list[num_sockets-1][0].setblocking(1)
-                        except:
-                            debug('event_loop: No data to read on this socket yet.')
-                            sock_obj_list[num_sockets-1][0].setblocking(1)
-
-                    if (sock_obj_list[b][1] == 1):
-                        debug('event_loop: Data found on existing connection.')
-
-                        if (sock_obj_list[b][0] != None):
-                            debug('event_loop: Calling recv(1024) on socket object.')
-
-                            # The code below is a bit pedantic and paranoid.
-                            # Since we're getting a select.POLLIN event on an already connected socket,
-                            # there should always be actual data to read.  If for some reason there's
-                            # not, however, we follow the same procedure outlined in the comment,
-                            # "Read data from the new socket", above.
-                            
-                            try:
-                                sock_obj_list[b][0].setblocking(0)
-                                in_data = sock_obj_list[b][0].recv(1024)
-
-                                # Sometimes, multiple items of data will arrive together, CR separated.
-                                # In this case, we execute a string.split() on the returned data, and append
-                                # each individual item in order to the data_list, using port_list[b] as the port
-                                # value for each item, since they all came from the same place..
-
-                                data_sublist = string.split(in_data, '\n')
-
-                                # Executing string.strip() on a string causes the remainder of the string
-                                # to be returned as the last element in the list.  Almost invariably, the
-                                # string will be 'completely split', that is, there will be no remainder.
-                                # This causes string.split() to return an empty string as the last element.
-                                # Since we're appending each item in the list to data_list, and data_list
-                                # sees an empty string as being indicative of a network error, we strip it
-                                # before going any further.
-                                
-                                if (len(data_sublist) > 1):
-                                    dslen = len(data_sublist)
-                                    log_message = 'event_loop: data_sublist length is ' + str(dslen)
-                                    debug(log_message)
-                                    log_message = 'event_loop: pretrim data_sublist is: ' + str(data_sublist)
-                                    debug(log_message)
-                                    del data_sublist[dslen-1]
-                                    log_message = 'event_loop: post-trim data_sublist is ' + str(data_sublist)
-                                    debug(log_message)
-                                for i in range(len(data_sublist)):
-                                    data_list.append([port_list[b], data_sublist[i]])
-                                    log_message = 'event_loop: separated data: ' + data_sublist[i]
-                                    debug(log_message)
-                             
-                                sock_obj_list[b][0].setblocking(1)
-                            except socket.error:
-                                debug('event_loop: No data to read on this socket yet.')
-                                sock_obj_list[b][0].setblocking(1)
-                            
-
-                        if (data_list[i][1] == ''):
-                            debug('event_loop: Connection went away. Cleaning up.')
-                            # Connection went away.  Need to do cleanup.
-                            # Unregister the connection socket from the polling object.
-                            # If we're not using select.poll() (i.e. alt_poll_flag == 1), do
-                            # an alternate routine via poll_emulate.unregister().
-                            if (alt_poll_flag == 0):
-                                poll_obj.unregister(sock_obj_list[b][0])
-                                debug('event_loop: Socket unregistered from poll_obj...')
-                            if (alt_poll_flag == 1):
-                                input_event, output_event, ex_event = poll_emulate.unregister(input_event, output_event, ex_event, sock_obj_list[b][0])
-                                debug('event_loop: Socket unregistered from select.select() event lists.')
-                                
-                            # Remove file descriptor number from fileno_list.
-                            del fileno_list[b]
-                            debug('event_loop: Socket removed from fileno_list.')
-                            log_message = "fileno_list: " + str(fileno_list)
-                            debug(log_message)
-                            
-                            # Remove connection from sock_obj_list, our list of sockets.
-                            del sock_obj_list[b]
-                            debug('event_loop: Socket removed from sock_obj_list.')
-                            # Debug code:
-                            #log_message = 'sock_obj_list: ' + str(sock_obj_list)
-                            #debug(log_message)
-
-                            # Remove port entry for the connection from port_list
-                            del port_list[b]
-                            log_message = 'event_loop: port_list: ' + str(port_list)
-                            debug('event_loop: Port removed from port_list.')
-                            debug(log_message)
-
-                            # Remove empty string data from data_list
-                            del data_list[i]
-
-                            # The contents of fileno_list b changed, so there's a chance
-                            # that the current 'b' subscript value for the list may no
-                            # longer be valid, thereby causing an IndexError.  We reset b
-                            # to 0, which results in a rescan of the list starting at the
-                            # first fileno_list value.  Slightly more work, since it's
-                            # potentially rescanning already examined file descriptors for
-                            # a match, but it's more robust.
-                            debug('event_loop: Rescanning fileno_list.')
-                            log_message = 'event_loop: current b value: ' + str(b)
-                            log_message2 = 'event_loop: fileno_list len: ' + str(len(fileno_list))
-                            debug(log_message)
-                            debug(log_message2)
-
-                            # Recalculate number of sockets, and print a log message.
-                            num_sockets = len(sock_obj_list)
-                            log_message = 'event_loop: Now there are ' + str(num_sockets) + ' sockets.'
-                            debug(log_message)
-
-                            # All done here.  Executing a break brings us back into the larger for loop
-                            # that this code is nested in, and we begin looking at the next event in the
-                            # event_list.
-                            break
-                        
-                            
-    # Print the data received from all events.
-    log_message = 'data: ' + str(data_list)
-    debug(log_message)
-    for i in range(len(data_list)):
-        route_data(data_list[i][1])
-
-    
-    
+# SIGTERM and Ctrl-C stop the EDS cleanly.
+signal.signal(signal.SIGTERM, stop_eds)
+signal.signal(signal.SIGINT, stop_eds)
+
+# SIGHUP restarts it without dropping any connections.
+if (shard_count == 1 and hasattr(signal, 'SIGHUP') and eds_fdpass.available() == 1):
+    signal.signal(signal.SIGHUP, restart_eds)
+
+if (shard_count > 1):
+    run_supervisor()
+    stop_shards()
+elif (config_data['eds']['server_mode'] == 'asyncore'):
+    run_asyncore_loop()
+else:
+    run_poll_loop()
+shutdown_eds()
@@ -27,7 +27,7 @@ along with this program; if not, write to the Free Software
 Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
 """
 
-import os, sys, socket, string, time, re, ConfigParser, pickle, speechrule, select, fileinput
+import os, sys, socket, string, time, re, ConfigParser, pickle, speechrule, select, fileinput, turbolog
 
 # Set configurations via ConfigParser for the module.
 # Options list is a list of options to return.  Each item in the list is a tuple in the form:
@@ -37,6 +37,8 @@ import os, sys, socket, string, time, re, ConfigParser, pickle, speechrule, sele
 # b = boolean
 # f = float
 # s = string
+# An optional fourth item in the tuple gives a default value, used when the option
+# isn't present in the config file.  Options without a default must be present.
 # The function returns a hash table that has as its top level keys section names, which have nested
 # hash tables as their values.  These nested hash tables have section option names as keys, and the
 # respective section option values as values.
@@ -67,6 +69,10 @@ def set_configs(config_file, options):
             if (config_core[c_section].has_key(c_option) == 1):
                 log_message = "set_configs: Warning.  Duplicate " + c_section + ":" + c_option + " found.  Using new value."
                 debug(log_message)
+            # Fall back on the default value if one was given, and the option is missing.
+            if (len(options[i]) > 3 and module_config.has_option(c_section, c_option) == 0):
+                config_core[c_section][c_option] = options[i][3]
+                continue
             # Extract data from config into hash table, doing appropriate coercions based on c_coerce flag.
             if (c_coerce == 'i'):
                 config_core[c_section][c_option] = module_config.getint(c_section, c_option)
@@ -80,14 +86,19 @@ def set_configs(config_file, options):
     return config_core
 
     
-# debug output function.
-def debug(msg):
-    msg = '[' + str(time.ctime(time.time())) + '] ' + 'speechio_module' + ': ' + msg + '\n'
-    if (config_data['speechio_module']['debug_flag'] == 1):
-        print string.strip(msg)
-    if (config_data['speechio_module']['log_messages'] == 1):
-        log_fd.write(msg)
-        log_fd.flush()
+# Log output functions.  Messages go through the shared logger in
+# Modules/turbolog.py, which only formats them if their level is enabled, and
+# writes them to the console and log file from a background thread.  Extra
+# arguments are formatted into msg with the % operator, so pass them rather
+# than building the string first: debug('fd %d ready', fd).
+def debug(msg, *args):
+    logger.log(turbolog.DEBUG, msg, args)
+
+def warning(msg, *args):
+    logger.log(turbolog.WARNING, msg, args)
+
+def critical(msg, *args):
+    logger.log(turbolog.CRITICAL, msg, args)
 
 # Load and parse speech/command binding file.  When we recognize speech,
 # we'll use this table to determine which command to pass back to the EDS.
@@ -115,7 +126,7 @@ def parse_bindings(bfile):
                 log_message = 'parse_bindings: speech text: ' + sptext + ' bound to command: ' + bound_cmd
                 debug(log_message)
     except IOError:
-        debug('parse_bindings: WARNING: Binding attempt failed.  No bindings loaded.  Check your configuration file.')
+        warning('parse_bindings: Binding attempt failed.  No bindings loaded.  Check your configuration file.')
 
 # Generate a correctly formatted Scheme language statement
 # to pass to the Festival server, in order to generate speech output.
@@ -130,12 +141,24 @@ def gen_scheme_string(speech_str):
 # Client-side network initialization.  Attempts to connect to
 # the host and port provided as input.  When successful, returns
 # a socket object.
+# If unix_path is given, and the EDS has put a Unix domain socket there
+# (unix_socket_dir in the [eds] section of the config file), that's used
+# instead, since it's cheaper than TCP when the EDS is on the same machine.
 # If connect is successful, returns a socket object.
 # If unsuccessful, waits five seconds before retrying.
-def network_init(host, port):
+def network_init(host, port, unix_path=''):
     connect_success = 0
     debug('network_init: Attempting to establish connection.')
     while (connect_success == 0):
+        if (unix_path != '' and os.path.exists(unix_path)):
+            try:
+                s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+                s.connect(unix_path)
+                debug('network_init: Connection established via ' + unix_path)
+                return s
+            except socket.error:
+                s.close()
+                debug('network_init: Unix domain connect unsuccessful.  Trying TCP.')
         try:
             s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             s.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
@@ -163,9 +186,9 @@ def send_to_socket(sockid, data):
             debug('send_to_socket: data sent to server.')
             send_success = 1
         except socket.error:
-            debug('send_to_socket: WARNING: Couldn\'t send command to server.  Reinitializing network link.')
+            warning('send_to_socket: Couldn\'t send command to server.  Reinitializing network link.')
             sock_obj_list[sockid].close()
-            sock_obj_list[sockid] = network_init(host_list[sockid], port_list[sockid])
+            sock_obj_list[sockid] = network_init(host_list[sockid], port_list[sockid], path_list[sockid])
 
 
 # Do data separation task.  Take in a CR separated list of items, and return a list of tokens.
@@ -190,13 +213,10 @@ def do_data_sep(in_data):
 
     if (len(data_sublist) > 1):
         dslen = len(data_sublist)
-        log_message = 'event_loop: data_sublist length is ' + str(dslen)
-        debug(log_message)
-        log_message = 'event_loop: pretrim data_sublist is: ' + str(data_sublist)
-        debug(log_message)
+        debug('event_loop: data_sublist length is %s', dslen)
+        debug('event_loop: pretrim data_sublist is: %s', data_sublist)
         del data_sublist[dslen-1]
-        log_message = 'event_loop: post-trim data_sublist is ' + str(data_sublist)
-        debug(log_message)
+        debug('event_loop: post-trim data_sublist is %s', data_sublist)
 
     # Append each of the separated data items into data_list
     for i in range(len(data_sublist)):
@@ -232,6 +252,7 @@ config_options = [('speechio_module', 'debug_flag', 'b'), \
                   ('speechio_module', 'log_messages', 'b'), \
                   ('speechio_module', 'eds_port', 'i'), \
                   ('speechio_module', 'eds_host', 's'), \
+                  ('eds', 'unix_socket_dir', 's', ''), \
                   ('speechio_module', 'sphinx_host', 's'), \
                   ('speechio_module', 'sphinx_port', 'i'), \
                   ('speechio_module', 'festival_host', 's'), \
@@ -240,24 +261,39 @@ config_options = [('speechio_module', 'debug_flag', 'b'), \
                   ('speechio_module', 'speech_data_file', 's'), \
                   ('speechio_module', 'vocab_file', 's'), \
                   ('speechio_module', 'cs_bindfile', 's'), \
-                  ('speechio_module', 'learn_threshold', 'i')]
+                  ('speechio_module', 'learn_threshold', 'i'), \
+                  ('logging', 'log_level', 's', 'debug'), \
+                  ('logging', 'ring_level', 's', 'warning'), \
+                  ('logging', 'ring_size', 'i', 1000), \
+                  ('logging', 'flush_interval', 'f', 0.5)]
 
 
+# Logger behind debug(), warning() and critical().  Messages logged before it's
+# configured, below, are only kept in memory.
+logger = turbolog.Logger('speechio_module')
+
 # Get configuration information
 config_data = set_configs(config_fn, config_options)
 log_message = 'init: Using config file ' + config_fn
 print log_message
 
-# Open a log file, if this feature has been enabled.
+# Start logging, to the console and log file as configured.  Until now, messages
+# have only been kept in memory.  Sending the process a SIGUSR1 writes out the
+# most recent messages, whatever their level.
 print 'init: Opening log file.'
+log_file = None
 if (config_data['speechio_module']['log_messages'] == 1):
-    try:
-        log_fd = open(config_data['speechio_module']['log_file'], 'a')
-    except IOError:
-        log_message = 'init: WARNING: Unable to open log file at ' + config_data['speechio_module']['log_file']
-        print log_message
-        print 'init: WARNING: Logging will occur to console only.'
-        config_data['speechio_module']['log_messages']  = 0
+    log_file = config_data['speechio_module']['log_file']
+log_sec = config_data['logging']
+if (logger.configure(config_data['speechio_module']['debug_flag'], log_file,
+                     turbolog.level_value(log_sec['log_level']),
+                     turbolog.level_value(log_sec['ring_level']),
+                     log_sec['ring_size'], log_sec['flush_interval']) == 0):
+    log_message = 'init: WARNING: Unable to open log file at ' + log_file
+    print log_message
+    print 'init: WARNING: Logging will occur to console only.'
+    config_data['speechio_module']['log_messages']  = 0
+turbolog.dump_on_signal(logger)
 
 # Create an empty file descriptor list
 fileno_list = []
@@ -278,6 +314,13 @@ host_list = [config_data['speechio_module']['eds_host'], \
             config_data['speechio_module']['sphinx_host'], \
             config_data['speechio_module']['festival_host']]
 
+# Create a Unix domain socket path list.  Only the EDS connection has one;
+# Sphinx and Festival are always reached over TCP.
+if (config_data['eds']['unix_socket_dir'] != ''):
+    path_list = [os.path.join(config_data['eds']['unix_socket_dir'], 'speechio_module.sock'), '', '']
+else:
+    path_list = ['', '', '']
+
 # Number of connections to make
 num_sockets = len(port_list)
 
@@ -287,7 +330,7 @@ num_sockets = len(port_list)
 for i in range(num_sockets):
     log_message = 'Connecting to ' + str(host_list[i]) + ":" + str(port_list[i])
     debug(log_message)
-    s = network_init(host_list[i], port_list[i])
+    s = network_init(host_list[i], port_list[i], path_list[i])
     sock_obj_list.append(s)
 
     # Append the file descriptor to fileno_list
@@ -349,19 +392,16 @@ while 1:
     debug('event_loop: Waiting for incoming events.')
     event_list = poll_obj.poll()
 
-    log_message = 'event_loop: event_list: ' + str(event_list)
-    debug(log_message)
+    debug('event_loop: event_list: %s', event_list)
 
     # Number of socket objects returned.
     event_count = len(event_list)
-    log_message = 'event_loop: event_count: ' + str(event_count)
-    debug(log_message)
+    debug('event_loop: event_count: %s', event_count)
 
     # Update the number of current sockets in sock_obj_list, in order
     # to ensure that the for loop below operates within the full list.    
     num_sockets = len(sock_obj_list)
-    log_message = 'event_loop: ' + str(num_sockets) + ' sockets detected.'
-    debug(log_message)
+    debug('event_loop: %s sockets detected.', num_sockets)
 
     # Match the file descriptor values returned by .poll() into event_list with
     # the socket that has that file descriptor value in sock_obj_list.
@@ -370,11 +410,10 @@ while 1:
     # tuple in the form (port_number, retrieved_data).    
     for i in range(event_count):
         current_fd = event_list[i][0]
-        log_message = 'event_loop: Operating on fd ' + str(current_fd)
-        debug(log_message)
-        debug(str(port_list))
-        debug(str(fileno_list))
-        debug(str(sock_obj_list))
+        debug('event_loop: Operating on fd %s', current_fd)
+        debug('%s', port_list)
+        debug('%s', fileno_list)
+        debug('%s', sock_obj_list)
         for b in range(num_sockets):
             
             if (current_fd == fileno_list[b]):
@@ -415,18 +454,15 @@ while 1:
                             sock_obj_list[b].setblocking(1)
                     
     # Print the list of received data.
-    log_message = 'event_loop: raw data received: ' + str(data_list)
-    debug(log_message)
+    debug('event_loop: raw data received: %s', data_list)
     for i in range(len(data_list)):
         log_message = 'event_loop: post-processing data item ' + str(i) + ' , contents: ' + str(data_list[i][1])
         debug(log_message)
         d_intermediate = do_data_sep(data_list[i][1])
-        log_message = 'event_loop: tokenized data is: ' + str(d_intermediate)
-        debug(log_message)
-        log_message = 'event_loop: first item in list is - ' + str(d_intermediate[0])
-        debug(log_message)
+        debug('event_loop: tokenized data is: %s', d_intermediate)
+        debug('event_loop: first item in list is - %s', d_intermediate[0])
         data_list[i][1] = d_intermediate[0]
-        debug(str(data_list))
+        debug('%s', data_list)
         
   
     # Now iterate through each item in data_list, and use the speechrules module to
@@ -436,14 +472,12 @@ while 1:
         # First, check to see if we even have workable data.  If it's an empty string, do cleanup.
         if (data_list[i][1] == ''):
             debug('event_loop: Connection went away.  Doing cleanup.')
-            log_message = 'event_loop: data_list contents: ' + str(data_list)
-            debug(log_message)
-            log_message = 'event_loop: port_list contents: ' + str(port_list)
-            debug(log_message)
+            debug('event_loop: data_list contents: %s', data_list)
+            debug('event_loop: port_list contents: %s', port_list)
 
             # Iterate through the list of sockets, looking for a match.
             for j in range(num_sockets):
-                debug(str(j))
+                debug('%s', j)
                 if (data_list[i][0] == port_list[j]):
 
                     # Unregister the socket from the polling object.
@@ -456,7 +490,7 @@ while 1:
 
                     # Recreate a new socket object.
                     debug('event_loop: Recreating socket.')
-                    sock_obj_list[j] = network_init(host_list[j], port_list[j])
+                    sock_obj_list[j] = network_init(host_list[j], port_list[j], path_list[j])
 
                     # Set the updated fileno of the socket object back in fileno_list
                     debug('event_loop: Updating fileno value in fileno_list')
@@ -560,8 +594,8 @@ while 1:
 
                 # If the speech bindings file exists and has changed, resync against the vocab file.
                 current_last_mod = os.path.getmtime(config_data['speechio_module']['vocab_file'])
-                debug(str(current_last_mod))
-                debug(str(time_since_mod))
+                debug('%s', current_last_mod)
+                debug('%s', time_since_mod)
 
                 # If the modification time of the speech binding file has changed, rebuild the
                 # speech data file (and migrate over all old bindings that exist in the current
@@ -653,10 +687,10 @@ while 1:
                             # doesn't match the regular expression, indicating that we can't
                             # provide what's needed.  So we throw up our hands, set len_utt_subgroups
                             # to a failure value (-1), and force the user to repeat themselves.
-                            log_message = 'event_loop: WARNING: negative match on string ' + utt + ' and regex ' + utt_regex
-                            debug(log_message)
-                            debug('event_loop: WARNING: speechrule and speechio_module regex inconsistency.')
-                            debug('event_loop: WARNING: Not sending this event to EDS.')
+                            log_message = 'event_loop: negative match on string ' + utt + ' and regex ' + utt_regex
+                            warning(log_message)
+                            warning('event_loop: speechrule and speechio_module regex inconsistency.')
+                            warning('event_loop: Not sending this event to EDS.')
                             len_utt_subgroups = -1
 
                     # Assuming that we aren't in a failure state by now (len_utt_subgroups = -1),
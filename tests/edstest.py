@@ -0,0 +1,240 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: EDS regression test support
+# Description:
+# Shared by the EDS regression tests in this directory.  EdsTestCase runs a copy
+# of select_ports.py in a scratch directory of its own, with a config file
+# written for the test (free ports, its own log, and any [eds] settings and
+# sections the test asks for), and gives the test modules' connections to it.
+# The tests are run from the top of the source tree with:
+#   python -m unittest discover -s tests
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+"""
+This program is free software; you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation; either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program; if not, write to the Free Software
+Foundation, Inc., 59 Temple Place, Suite 330, Boston, MA  02111-1307  USA
+"""
+
+import os, sys, socket, signal, string, subprocess, tempfile, shutil, time, unittest
+
+top_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+modules_dir = os.path.join(top_dir, 'Modules')
+if (modules_dir not in sys.path):
+    sys.path.insert(0, modules_dir)
+
+# Find a TCP port nothing is listening on.
+# No input.
+# Output: the port number.
+def free_port():
+    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    s.bind(('127.0.0.1', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+# A test case with an EDS of its own.  Subclasses set modules (the services given
+# ports in [module_reg]), eds_options (extra [eds] settings) and sections (extra
+# config sections, as hash tables of settings).  The EDS is started before each
+# test, and stopped after it.
+class EdsTestCase(unittest.TestCase):
+    modules = ['lcd_module', 'mp3_module', 'diagnostic_port']
+    eds_options = {}
+    sections = {}
+    # Set register to 1 to give the EDS a registration port, and unix to 1 to have
+    # it listen on Unix domain sockets too.
+    register = 0
+    unix = 0
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix='eds-test-')
+        os.mkdir(os.path.join(self.dir, 'Config'))
+        os.mkdir(os.path.join(self.dir, 'Logs'))
+        self.ports = {}
+        for module in self.modules:
+            self.ports[module] = free_port()
+        self.register_port = 0
+        if (self.register == 1):
+            self.register_port = free_port()
+        self.socks = []
+        self.eds = None
+        self.start_eds()
+
+    def tearDown(self):
+        for s in self.socks:
+            s.close()
+        self.stop_eds()
+        shutil.rmtree(self.dir, 1)
+
+    # Write the config file, with options added to or overriding eds_options.
+    def write_config(self, options={}):
+        eds = {'debug_flag': '0',
+               'log_messages': '1',
+               'log_file': 'Logs/eds.log',
+               'register_port': str(self.register_port),
+               'metrics_port': '0'}
+        if (self.unix == 1):
+            eds['unix_socket_dir'] = os.path.join(self.dir, 'sock')
+        eds.update(self.eds_options)
+        eds.update(options)
+        lines = ['[module_reg]']
+        for module in self.modules:
+            lines.append(module + ' = ' + str(self.ports[module]))
+        lines.append('')
+        lines.append('[eds]')
+        for option in eds.keys():
+            lines.append(option + ' = ' + eds[option])
+        for section in self.sections.keys():
+            lines.append('')
+            lines.append('[' + section + ']')
+            for option in self.sections[section].keys():
+                lines.append(option + ' = ' + self.sections[section][option])
+        config = open(os.path.join(self.dir, 'Config', 'alice.config'), 'w')
+        config.write(string.join(lines, '\n') + '\n')
+        config.close()
+
+    # Start the EDS, and wait until it's listening.
+    def start_eds(self, options={}):
+        self.write_config(options)
+        if (self.unix == 1 and os.path.isdir(os.path.join(self.dir, 'sock')) == 0):
+            os.mkdir(os.path.join(self.dir, 'sock'), 0700)
+        env = dict(os.environ)
+        env['PYTHONPATH'] = modules_dir
+        out = open(os.path.join(self.dir, 'Logs', 'eds.out'), 'a')
+        self.eds = subprocess.Popen([sys.executable, os.path.join(top_dir, 'select_ports.py')],
+                                    cwd=self.dir, env=env, stdout=out, stderr=subprocess.STDOUT)
+        out.close()
+        port = self.ports[self.modules[0]]
+        for i in range(200):
+            s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            try:
+                s.connect(('127.0.0.1', port))
+                s.close()
+                # Let the EDS see that connection close before the test starts.
+                time.sleep(0.1)
+                return
+            except socket.error:
+                s.close()
+            if (self.eds.poll() != None):
+                break
+            time.sleep(0.05)
+        self.fail('EDS did not start:\n' + self.eds_output())
+
+    # Stop the EDS: cleanly, with SIGTERM, unless kill is set, when it's killed
+    # outright, as if it had crashed.
+    def stop_eds(self, kill=0):
+        if (self.eds == None):
+            return
+        if (self.eds.poll() == None):
+            if (kill == 1):
+                os.kill(self.eds.pid, signal.SIGKILL)
+            else:
+                os.kill(self.eds.pid, signal.SIGTERM)
+            for i in range(100):
+                if (self.eds.poll() != None):
+                    break
+                time.sleep(0.05)
+            else:
+                os.kill(self.eds.pid, signal.SIGKILL)
+                self.eds.wait()
+        self.eds = None
+
+    # The EDS's console output and log file, for failure messages.
+    def eds_output(self):
+        text = ''
+        for name in ('eds.out', 'eds.log'):
+            try:
+                text = text + open(os.path.join(self.dir, 'Logs', name)).read()
+            except IOError:
+                pass
+        return text
+
+    # Connect to a module's port, or to the registration port if service is None.
+    # rcvbuf, if set, is the size of the socket's receive buffer, which a test
+    # keeps small to fill the EDS's queue for it quickly.
+    # Output: the connected socket, which is closed after the test.
+    def connect(self, service, rcvbuf=0):
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        if (rcvbuf > 0):
+            s.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, rcvbuf)
+        if (service == None):
+            s.connect(('127.0.0.1', self.register_port))
+        else:
+            s.connect(('127.0.0.1', self.ports[service]))
+        self.socks.append(s)
+        return s
+
+    # Connect to a module's Unix domain socket.
+    def connect_unix(self, service):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        s.connect(os.path.join(self.dir, 'sock', service + '.sock'))
+        self.socks.append(s)
+        return s
+
+    # Connect to the registration port, and register as service.
+    def register_as(self, service, rcvbuf=0):
+        s = self.connect(None, rcvbuf)
+        s.sendall('eds: register ' + service + '\n')
+        return s
+
+    # Read lines from a socket until count have arrived, or nothing has for
+    # timeout seconds.
+    # Output: the lines, without their newlines.
+    def read_lines(self, s, count, timeout=2.0):
+        data = ''
+        s.settimeout(timeout)
+        try:
+            while (string.count(data, '\n') < count):
+                more = s.recv(65536)
+                if (more == ''):
+                    break
+                data = data + more
+        except socket.timeout:
+            pass
+        s.settimeout(None)
+        return string.split(data, '\n')[:-1]
+
+    # Read whatever arrives on a socket until it's quiet for timeout seconds.
+    # Output: the data.
+    def read_all(self, s, timeout=0.5):
+        data = ''
+        s.settimeout(timeout)
+        try:
+            while 1:
+                more = s.recv(65536)
+                if (more == ''):
+                    break
+                data = data + more
+        except socket.timeout:
+            pass
+        s.settimeout(None)
+        return data
+
+    # Ask the EDS for a service's traffic statistics.
+    # Output: the service's totals, as a hash table of integers.
+    def service_stats(self, service):
+        s = self.connect('diagnostic_port')
+        s.sendall('eds: stats ' + service + '\n')
+        lines = self.read_lines(s, 1)
+        self.assertTrue(len(lines) > 0, 'no stats for ' + service)
+        words = string.split(lines[0])
+        stats = {}
+        for i in range(3, len(words) - 1, 2):
+            try:
+                stats[words[i]] = int(words[i + 1])
+            except ValueError:
+                pass
+        return stats
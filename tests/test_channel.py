@@ -0,0 +1,117 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: EDS regression tests: direct channels
+# Description:
+# Two modules connected through Unix domain sockets can open a direct channel,
+# and stop sending each other's messages through the EDS.  The channel's open,
+# mark and close notices keep everything in the order it was sent: messages
+# sent through the EDS before the switch arrive ahead of those on the channel,
+# and when the channel closes, the sender goes back to the EDS without losing
+# or reordering anything.  Requests the EDS can't grant are refused.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+import socket, threading, time, unittest
+import edstest
+import eds_channel
+
+count = 5000
+
+# Reads everything that arrives on an EdsChannels, in a thread of its own, as a
+# module would.
+class Reader:
+    def __init__(self, channels):
+        self.channels = channels
+        self.lines = []
+        thread = threading.Thread(target=self.run)
+        thread.setDaemon(1)
+        thread.start()
+
+    def run(self):
+        while 1:
+            try:
+                data = self.channels.recv()
+            except socket.error:
+                return
+            if (data == ''):
+                return
+            self.lines.extend(data.splitlines())
+
+    # Wait until count lines have arrived, or nothing has for timeout seconds.
+    def wait(self, count, timeout=2.0):
+        seen = -1
+        while (len(self.lines) < count and len(self.lines) != seen):
+            seen = len(self.lines)
+            time.sleep(timeout)
+        return self.lines
+
+class ChannelTest(edstest.EdsTestCase):
+    unix = 1
+
+    def module(self, service):
+        sock = self.connect_unix(service)
+        channels = eds_channel.EdsChannels(sock)
+        return sock, channels, Reader(channels)
+
+    def test_switch_over_keeps_order(self):
+        lcd, lcd_channels, lcd_reader = self.module('lcd_module')
+        mp3, mp3_channels, mp3_reader = self.module('mp3_module')
+        lcd_channels.accept()
+        time.sleep(0.2)
+        direct = 0
+        for i in range(count):
+            if (mp3_channels.channels.has_key('lcd_module')):
+                direct = direct + 1
+            mp3_channels.send('lcd_module', str(i) + '\n')
+            if (i == 100):
+                mp3_channels.request('lcd_module')
+        self.assertEqual(lcd_reader.wait(count, 0.5), map(str, range(count)))
+        self.assertTrue(direct > 0)
+
+    def test_fall_back_when_closed(self):
+        lcd, lcd_channels, lcd_reader = self.module('lcd_module')
+        mp3, mp3_channels, mp3_reader = self.module('mp3_module')
+        lcd_channels.accept()
+        time.sleep(0.2)
+        mp3_channels.request('lcd_module')
+        time.sleep(0.3)
+        self.assertTrue(mp3_channels.channels.has_key('lcd_module'))
+        for i in range(10):
+            mp3_channels.send('lcd_module', 'before ' + str(i) + '\n')
+        self.assertEqual(lcd_reader.wait(10, 0.3), map(lambda i: 'before ' + str(i), range(10)))
+
+        # The LCD module reconnects.  The MP3 side is told its channel closed,
+        # and sends through the EDS until it has a new one.
+        lcd.close()
+        lcd_channels.close()
+        time.sleep(0.3)
+        lcd, lcd_channels, lcd_reader = self.module('lcd_module')
+        lcd_channels.accept()
+        time.sleep(0.2)
+        for i in range(5):
+            mp3_channels.send('lcd_module', 'after ' + str(i) + '\n')
+        mp3_channels.request('lcd_module')
+        time.sleep(0.3)
+        for i in range(5, 10):
+            mp3_channels.send('lcd_module', 'after ' + str(i) + '\n')
+        self.assertEqual(lcd_reader.wait(10, 0.3), map(lambda i: 'after ' + str(i), range(10)))
+        self.assertTrue(mp3_channels.channels.has_key('lcd_module'))
+
+    def test_refused(self):
+        mp3 = self.connect_unix('mp3_module')
+        mp3.sendall('eds: channel lcd_module\n')
+        self.assertEqual(self.read_lines(mp3, 1), ['channel refused lcd_module not_connected'])
+        lcd = self.connect_unix('lcd_module')
+        time.sleep(0.2)
+        mp3.sendall('eds: channel lcd_module\n')
+        self.assertEqual(self.read_lines(mp3, 1), ['channel refused lcd_module not_accepting'])
+        lcd.sendall('eds: channel_accept\n')
+        tcp = self.connect('diagnostic_port')
+        time.sleep(0.2)
+        tcp.sendall('eds: channel lcd_module\n')
+        self.assertEqual(self.read_lines(tcp, 1), ['channel refused lcd_module not_unix'])
+
+if (__name__ == '__main__'):
+    unittest.main()
@@ -0,0 +1,82 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: EDS regression tests: modules that hang up straight after sending
+# Description:
+# A module that sends a burst of messages and closes its connection straight away
+# still gets every one of them delivered, whether they're in the EDS's backlog for
+# it, or still unread in the socket, when the EDS sees the hangup.  That goes for
+# TCP and Unix domain connections, for both server modes, and for a sender that
+# was paused because its destination's queue was full.  A connection that's
+# closed by the EDS (one replaced by a new connection of the same instance)
+# still has its own backlog routed first.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+import time, unittest
+import edstest
+
+count = 2000
+padding = 'c' * 60
+
+def message(i):
+    return 'lcd_module: ' + str(i) + ' ' + padding + '\n'
+
+def numbered(lines):
+    numbers = []
+    for line in lines:
+        number, data = line.split(' ', 1)
+        if (data != padding):
+            raise ValueError('damaged message: ' + repr(line))
+        numbers.append(int(number))
+    return numbers
+
+class CloseTest(edstest.EdsTestCase):
+    unix = 1
+    eds_options = {'server_mode': 'poll'}
+
+    def send_and_close(self, sender):
+        sender.sendall(''.join(map(message, range(count))))
+        sender.close()
+
+    def test_tcp(self):
+        lcd = self.connect('lcd_module')
+        self.send_and_close(self.connect('mp3_module'))
+        self.assertEqual(numbered(self.read_lines(lcd, count)), range(count))
+
+    def test_unix(self):
+        lcd = self.connect('lcd_module')
+        self.send_and_close(self.connect_unix('mp3_module'))
+        self.assertEqual(numbered(self.read_lines(lcd, count)), range(count))
+
+    def test_paused(self):
+        # The LCD side's queue fills, so the EDS stops reading from the sender
+        # before it closes.
+        self.stop_eds()
+        self.start_eds({'max_queue_bytes': '8192', 'send_buffer_size': '4096'})
+        lcd = self.connect('lcd_module', rcvbuf=4096)
+        self.send_and_close(self.connect_unix('mp3_module'))
+        self.assertEqual(numbered(self.read_lines(lcd, count)), range(count))
+
+class AsyncoreCloseTest(CloseTest):
+    eds_options = {'server_mode': 'asyncore'}
+
+class ReplacedBacklogTest(edstest.EdsTestCase):
+    register = 1
+    # Only one message a second gets out of the old connection's backlog.
+    sections = {'rate_limit': {'x': '1 1'}}
+
+    def test_replaced_with_backlog(self):
+        lcd = self.connect('lcd_module')
+        old = self.connect(None)
+        old.sendall('eds: register x one\n')
+        time.sleep(0.2)
+        old.sendall(''.join(map(message, range(50))))
+        time.sleep(0.3)
+        new = self.connect(None)
+        new.sendall('eds: register x one\n')
+        self.assertEqual(numbered(self.read_lines(lcd, 50, 1.0)), range(50))
+
+if (__name__ == '__main__'):
+    unittest.main()
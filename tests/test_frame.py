@@ -0,0 +1,90 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: EDS regression tests: framed wire protocol
+# Description:
+# A connection that has sent 'eds: framing' talks in frames (see
+# Modules/eds_frame.py).  Frames go through the EDS unchanged between framed
+# modules, and are translated to and from lines for text modules, correlation
+# IDs included.  Frames split across reads are put back together, and a frame
+# that's too big is skipped without losing the ones after it.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+import select, time, unittest
+import edstest
+import eds_frame
+
+class FrameTest(edstest.EdsTestCase):
+    eds_options = {'max_message_size': '4096'}
+
+    def framed(self, service):
+        s = self.connect(service)
+        reader, lines = eds_frame.negotiate(s)
+        self.assertEqual(lines, [])
+        return s, reader
+
+    # Read frames until count have arrived, or nothing has for timeout seconds.
+    # Output: the frames, as (name, payload, flags, corr_id, priority) tuples.
+    def read_frames(self, s, reader, count, timeout=2.0):
+        frames = reader.feed('')
+        while (len(frames) < count):
+            r, w, x = select.select([s], [], [], timeout)
+            if (len(r) == 0):
+                break
+            data = s.recv(65536)
+            if (data == ''):
+                break
+            frames.extend(reader.feed(data))
+        return frames
+
+    def test_frames_between_framed_modules(self):
+        diag, diag_reader = self.framed('diagnostic_port')
+        mp3, mp3_reader = self.framed('mp3_module')
+        payload = 'line one\nline two\n\x00\xff binary'
+        diag.sendall(eds_frame.pack_frame('mp3_module', payload))
+        self.assertEqual(self.read_frames(mp3, mp3_reader, 1), [('diagnostic_port', payload, 0, '', 0)])
+
+    def test_frames_to_and_from_lines(self):
+        diag, reader = self.framed('diagnostic_port')
+        lcd = self.connect('lcd_module')
+        diag.sendall(eds_frame.pack_frame('lcd_module', 'para one\npara two'))
+        self.assertEqual(self.read_lines(lcd, 2), ['para one', 'para two'])
+        lcd.sendall('diagnostic_port: hello there\n')
+        self.assertEqual(self.read_frames(diag, reader, 1), [('lcd_module', 'hello there', 0, '', 0)])
+
+    def test_request_reply_and_nack(self):
+        diag, reader = self.framed('diagnostic_port')
+        mp3 = self.connect('mp3_module')
+        diag.sendall(eds_frame.pack_frame('mp3_module', 'get x', eds_frame.REQUEST, '5'))
+        self.assertEqual(self.read_lines(mp3, 1), ['?5 diagnostic_port get x'])
+        mp3.sendall('diagnostic_port: =5 result one\n')
+        self.assertEqual(self.read_frames(diag, reader, 1), [('mp3_module', 'result one', eds_frame.REPLY, '5', 0)])
+        diag.sendall(eds_frame.pack_frame('nobody/x', 'x', eds_frame.REQUEST, '6'))
+        frames = self.read_frames(diag, reader, 1)
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(frames[0][2], eds_frame.NACK)
+        self.assertEqual(frames[0][3], '6')
+
+    def test_split_and_oversized_frames(self):
+        diag, reader = self.framed('diagnostic_port')
+        lcd = self.connect('lcd_module')
+        data = eds_frame.pack_frame('lcd_module', 'z' * 9000) + eds_frame.pack_frame('lcd_module', 'after')
+        for i in range(0, len(data), 700):
+            diag.sendall(data[i:i + 700])
+            time.sleep(0.001)
+        for c in eds_frame.pack_frame('lcd_module', 'tiny'):
+            diag.sendall(c)
+            time.sleep(0.001)
+        self.assertEqual(self.read_lines(lcd, 3, 1.0), ['after', 'tiny'])
+
+    def test_frame_behind_command(self):
+        # A frame sent in the same packet as the switch to frames.
+        diag = self.connect('diagnostic_port')
+        lcd = self.connect('lcd_module')
+        diag.sendall(eds_frame.FRAMING_COMMAND + eds_frame.pack_frame('lcd_module', 'same packet'))
+        self.assertEqual(self.read_lines(lcd, 1), ['same packet'])
+
+if (__name__ == '__main__'):
+    unittest.main()
@@ -0,0 +1,55 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: EDS regression tests: message journal
+# Description:
+# Durable messages (those listed in [durable]) are written to the journal before
+# they're routed.  If the EDS crashes before one has been sent, the next EDS
+# reads it back from the journal, and delivers it when its module connects.
+# Messages that aren't durable, and durable ones that have already gone out,
+# aren't sent again.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+import time, unittest
+import edstest
+
+class JournalTest(edstest.EdsTestCase):
+    register = 1
+    eds_options = {'journal_file': 'journal'}
+    sections = {'durable': {'later': '*', 'b': 'important'}}
+
+    def crash_and_restart(self):
+        # Give the journal time to reach the disk, as a real crash would.
+        time.sleep(0.2)
+        self.stop_eds(kill=1)
+        self.start_eds()
+
+    def test_held_messages_replayed(self):
+        a = self.register_as('a')
+        a.sendall('later: keep me\nlater: and me\n')
+        self.crash_and_restart()
+        later = self.register_as('later')
+        self.assertEqual(self.read_lines(later, 3, 1.0), ['keep me', 'and me'])
+
+    def test_replayed_until_delivered(self):
+        a = self.register_as('a')
+        a.sendall('later: keep me\n')
+        self.crash_and_restart()
+        self.crash_and_restart()
+        later = self.register_as('later')
+        self.assertEqual(self.read_lines(later, 2, 1.0), ['keep me'])
+        self.crash_and_restart()
+        later = self.register_as('later')
+        self.assertEqual(self.read_lines(later, 1, 1.0), [])
+
+    def test_only_durable_commands_replayed(self):
+        a = self.register_as('a')
+        a.sendall('b: plain one\nb: important two\nb: plain three\n')
+        self.crash_and_restart()
+        b = self.register_as('b')
+        self.assertEqual(self.read_lines(b, 2, 1.0), ['important two'])
+
+if (__name__ == '__main__'):
+    unittest.main()
@@ -0,0 +1,54 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: EDS regression tests: priority lane
+# Description:
+# Priority messages (the commands listed for a module in [priority], and messages
+# sent with a '^' in front of the module name) go out ahead of whatever else is
+# queued for the module, in the order they were sent.  Everything else keeps its
+# order, and nothing is lost.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+import time, unittest
+import edstest
+
+count = 1000
+padding = 'f' * 100
+
+def filler(i):
+    return str(i) + ' ' + padding
+
+class PriorityTest(edstest.EdsTestCase):
+    eds_options = {'max_queue_bytes': '1048576', 'send_buffer_size': '4096'}
+    sections = {'priority': {'lcd_module': 'quit clear'}}
+
+    # Queue count filler messages for a module that isn't reading, then send
+    # lines after them, and read everything.
+    def send_behind(self, lines):
+        lcd = self.connect('lcd_module', rcvbuf=4096)
+        mp3 = self.connect('mp3_module')
+        for i in range(count):
+            mp3.sendall('lcd_module: ' + filler(i) + '\n')
+        time.sleep(0.3)
+        for line in lines:
+            mp3.sendall(line + '\n')
+        time.sleep(0.3)
+        return self.read_lines(lcd, count + len(lines))
+
+    def test_priority_overtakes(self):
+        received = self.send_behind(['lcd_module: quit now', '^lcd_module: urgent', 'lcd_module: clear'])
+        fillers = filter(lambda line: line[-len(padding):] == padding, received)
+        others = filter(lambda line: line[-len(padding):] != padding, received)
+        self.assertEqual(fillers, map(filler, range(count)))
+        self.assertEqual(others, ['quit now', 'urgent', 'clear'])
+        # Some of the filler was already on its way, but not most of it.
+        self.assertTrue(received.index('quit now') < count / 2)
+
+    def test_ordinary_messages_keep_order(self):
+        received = self.send_behind(['lcd_module: redraw'])
+        self.assertEqual(received, map(filler, range(count)) + ['redraw'])
+
+if (__name__ == '__main__'):
+    unittest.main()
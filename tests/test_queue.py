@@ -0,0 +1,76 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: EDS regression tests: outbound queue policies
+# Description:
+# A module that stops reading fills its queue in the EDS.  What happens next is
+# up to its queue policy: drop_newest keeps the oldest messages, drop_oldest the
+# newest, and block keeps everything by pausing the sender.  Whatever is kept
+# arrives whole and in order.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+import threading, unittest
+import edstest
+
+count = 2000
+padding = 'x' * 80
+
+def message(i):
+    return 'lcd_module: ' + str(i) + ' ' + padding + '\n'
+
+def received(lines):
+    numbers = []
+    for line in lines:
+        number, data = line.split(' ', 1)
+        if (data != padding):
+            raise ValueError('damaged message: ' + repr(line))
+        numbers.append(int(number))
+    return numbers
+
+class QueuePolicyTest(edstest.EdsTestCase):
+    eds_options = {'max_queue_bytes': '8192', 'send_buffer_size': '4096'}
+
+    def fill(self, policy):
+        self.stop_eds()
+        self.sections = {'queue_policy': {'lcd_module': policy}}
+        self.start_eds()
+        lcd = self.connect('lcd_module', rcvbuf=4096)
+        mp3 = self.connect('mp3_module')
+        return lcd, mp3
+
+    def test_drop_newest(self):
+        lcd, mp3 = self.fill('drop_newest')
+        for i in range(count):
+            mp3.sendall(message(i))
+        numbers = received(self.read_lines(lcd, count, 1.0))
+        # The first messages are never dropped.  Later ones only get in when
+        # there's room.
+        self.assertEqual(numbers, sorted(set(numbers)))
+        self.assertEqual(numbers[:10], range(10))
+        self.assertTrue(len(numbers) < count)
+        self.assertTrue(self.service_stats('lcd_module')['drops'] > 0)
+
+    def test_drop_oldest(self):
+        lcd, mp3 = self.fill('drop_oldest')
+        for i in range(count):
+            mp3.sendall(message(i))
+        numbers = received(self.read_lines(lcd, count, 1.0))
+        self.assertEqual(numbers, sorted(set(numbers)))
+        self.assertTrue(len(numbers) < count)
+        # The last message always gets in.
+        self.assertEqual(numbers[-1], count - 1)
+
+    def test_block(self):
+        lcd, mp3 = self.fill('block')
+        # The EDS stops reading from the sender, so it blocks in sendall() until
+        # the LCD side reads.
+        sender = threading.Thread(target=mp3.sendall, args=(''.join(map(message, range(count))),))
+        sender.start()
+        numbers = received(self.read_lines(lcd, count))
+        sender.join()
+        self.assertEqual(numbers, range(count))
+
+if (__name__ == '__main__'):
+    unittest.main()
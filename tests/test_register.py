@@ -0,0 +1,84 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: EDS regression tests: registration and takeover
+# Description:
+# Modules can register a service through the registration port.  A new
+# connection for a single instance service takes over the older one, and the
+# messages still queued for the old one move across to it, in order and
+# unchanged, even when some of them are still views into a receive buffer.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+import string, time, unittest
+import edstest
+
+padding = 'p' * 100
+
+def numbered(lines):
+    numbers = []
+    for line in lines:
+        number, data = string.split(line, ' ', 1)
+        if (data != padding):
+            raise ValueError('damaged message: ' + repr(line))
+        numbers.append(int(number))
+    return numbers
+
+class RegisterTest(edstest.EdsTestCase):
+    register = 1
+    eds_options = {'max_queue_bytes': '1048576', 'send_buffer_size': '4096'}
+
+    def test_register_and_route(self):
+        alpha = self.register_as('alpha')
+        time.sleep(0.2)
+        mp3 = self.connect('mp3_module')
+        mp3.sendall('alpha: hello there\n')
+        self.assertEqual(self.read_lines(alpha, 1), ['hello there'])
+
+    def test_takeover_keeps_order(self):
+        old = self.register_as('x', rcvbuf=4096)
+        time.sleep(0.2)
+        mp3 = self.connect('mp3_module')
+        for i in range(500):
+            mp3.sendall('x: ' + str(i) + ' ' + padding + '\n')
+        time.sleep(0.3)
+        new = self.register_as('x')
+        time.sleep(0.2)
+        for i in range(500, 1000):
+            mp3.sendall('x: ' + str(i) + ' ' + padding + '\n')
+        # The old connection only has what had already reached its socket.
+        old_numbers = numbered(string.split(self.read_all(old), '\n')[:-1])
+        new_numbers = numbered(self.read_lines(new, 1000 - len(old_numbers)))
+        self.assertTrue(len(old_numbers) < 500)
+        self.assertEqual(old_numbers + new_numbers, range(1000))
+
+class TakeoverViewTest(edstest.EdsTestCase):
+    register = 1
+    eds_options = {'max_queue_bytes': '1048576', 'send_buffer_size': '4096'}
+    # Without debug messages, check_views() doesn't run, and can't copy a view
+    # that was missed.
+    sections = {'logging': {'log_level': 'info'}}
+
+    def test_takeover_while_views_queued(self):
+        # The new connection sends a message for the service, then registers it,
+        # in one read, so the message is still a view into its receive buffer
+        # when it moves across.  The next read reuses that buffer.
+        old = self.register_as('x', rcvbuf=4096)
+        time.sleep(0.2)
+        mp3 = self.connect('mp3_module')
+        for i in range(1000):
+            mp3.sendall('x: ' + str(i) + ' ' + padding + '\n')
+        time.sleep(0.3)
+        new = self.connect(None, rcvbuf=4096)
+        new.sendall('x: MARKER ' + 'M' * 200 + '\neds: register x\n')
+        time.sleep(0.3)
+        new.sendall('nobody: ' + 'Z' * 200 + '\n')
+        time.sleep(0.3)
+        self.read_all(old)
+        lines = string.split(self.read_all(new), '\n')[:-1]
+        self.assertEqual(lines[-1], 'MARKER ' + 'M' * 200)
+        numbered(lines[:-1])
+
+if (__name__ == '__main__'):
+    unittest.main()
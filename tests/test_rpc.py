@@ -0,0 +1,85 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: EDS regression tests: correlated requests
+# Description:
+# A message whose data starts with ?ID is a request.  The EDS puts the sender's
+# service name after the ID, so the receiver knows where to send its =ID reply,
+# and answers the sender with a !ID NACK itself if the request can't be
+# delivered.  The replies and NACKs are matched up by eds_rpc.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+import threading, time, unittest
+import edstest
+import eds_rpc
+
+class RpcTest(edstest.EdsTestCase):
+    register = 1
+    eds_options = {'max_queue_bytes': '8192', 'send_buffer_size': '4096'}
+    # Under the default block policy the sender would just be paused.
+    sections = {'queue_policy': {'lcd_module': 'drop_newest'}}
+
+    def nack(self, rpc, service, data='hello'):
+        try:
+            rpc.call(service, data, 2.0)
+        except eds_rpc.RpcNack, exc:
+            self.assertEqual(exc.service, service)
+            return exc.reason
+        self.fail('no NACK for a request to ' + service)
+
+    def test_request_and_reply(self):
+        lcd = self.connect('lcd_module')
+        mp3 = self.connect('mp3_module')
+        rpc = eds_rpc.EdsRpc(mp3)
+        requests = []
+        def responder():
+            line = self.read_lines(lcd, 1)[0]
+            requests.append(line)
+            corr_id, reply_to, data = eds_rpc.parse_request(line)
+            lcd.sendall(eds_rpc.make_reply(reply_to, corr_id, 'pong ' + data))
+        thread = threading.Thread(target=responder)
+        thread.start()
+        self.assertEqual(rpc.call('lcd_module', 'ping', 2.0), 'pong ping')
+        thread.join()
+        self.assertEqual(requests, ['?1 mp3_module ping'])
+
+    def test_reply_keeps_other_messages(self):
+        lcd = self.connect('lcd_module')
+        mp3 = self.connect('mp3_module')
+        rpc = eds_rpc.EdsRpc(mp3)
+        lcd.sendall('mp3_module: plain message\n')
+        time.sleep(0.2)
+        self.assertEqual(self.nack(rpc, 'nosuch/x'), 'unknown_service')
+        self.assertEqual(rpc.next_line(1.0), 'plain message')
+
+    def test_unknown_service(self):
+        rpc = eds_rpc.EdsRpc(self.connect('mp3_module'))
+        # Without an ID, a message for a name nobody has registered yet would be
+        # held, but a request is answered straight away.
+        self.assertEqual(self.nack(rpc, 'nosuch/x'), 'unknown_service')
+        self.assertEqual(self.nack(rpc, 'nosuch'), 'unknown_service')
+
+    def test_not_connected(self):
+        rpc = eds_rpc.EdsRpc(self.connect('mp3_module'))
+        self.assertEqual(self.nack(rpc, 'lcd_module'), 'not_connected')
+
+    def test_queue_full(self):
+        self.connect('lcd_module', rcvbuf=4096)
+        mp3 = self.connect('mp3_module')
+        rpc = eds_rpc.EdsRpc(mp3)
+        mp3.sendall(('lcd_module: ' + 'x' * 80 + '\n') * 2000)
+        time.sleep(0.5)
+        self.assertEqual(self.nack(rpc, 'lcd_module'), 'queue_full')
+
+    def test_not_registered(self):
+        self.connect('lcd_module')
+        time.sleep(0.2)
+        # A connection on the registration port has no service name to reply to
+        # until it registers one.
+        rpc = eds_rpc.EdsRpc(self.connect(None))
+        self.assertEqual(self.nack(rpc, 'lcd_module'), 'not_registered')
+
+if (__name__ == '__main__'):
+    unittest.main()
@@ -0,0 +1,62 @@
+#!/usr/bin/python
+# Project: Turbolift: An application server for voice powered computing
+# Component: EDS regression tests: zero-copy receive buffers
+# Description:
+# Messages are queued as views into the sender's receive buffer, and have to be
+# copied out before the buffer is read into again.  These tests keep messages
+# queued for a module that isn't reading while the sender's buffer is reused
+# over and over, and check that every message arrives with its own bytes, and
+# that the EDS's own check (see check_views() in select_ports.py) never found a
+# view it had lost track of.
+#
+# Author: (C) Copyright 2026 the Turbolift contributors
+# Date: 2026-10-18
+# License: GNU General Public License
+
+import string, time, unittest
+import edstest
+
+count = 300
+
+# Messages differ in length and content, so one overwritten by another shows.
+def data(i):
+    return str(i) + ' ' + chr(ord('a') + i % 26) * (20 + i % 200)
+
+class ViewTest(edstest.EdsTestCase):
+    eds_options = {'max_queue_bytes': '1048576', 'send_buffer_size': '4096'}
+
+    def check_log(self):
+        self.assertEqual(string.find(self.eds_output(), 'check_views'), -1)
+
+    def test_reuse_while_queued(self):
+        lcd = self.connect('lcd_module', rcvbuf=4096)
+        mp3 = self.connect('mp3_module')
+        # One message per read, so each one lands in the same part of the buffer.
+        for i in range(count):
+            mp3.sendall('lcd_module: ' + data(i) + '\n')
+            time.sleep(0.002)
+        lines = self.read_lines(lcd, count)
+        self.assertEqual(lines, map(data, range(count)))
+        self.check_log()
+
+    def test_fan_out_while_queued(self):
+        # The same view is queued for every subscriber of a topic.  One of them
+        # reads as it goes, the other doesn't.
+        lcd = self.connect('lcd_module', rcvbuf=4096)
+        diag = self.connect('diagnostic_port')
+        mp3 = self.connect('mp3_module')
+        lcd.sendall('eds: subscribe display/text\n')
+        diag.sendall('eds: subscribe display/text\n')
+        time.sleep(0.2)
+        got = ''
+        for i in range(count):
+            mp3.sendall('display/text: ' + data(i) + '\n')
+            time.sleep(0.002)
+            got = got + self.read_all(diag, 0.001)
+        got = got + self.read_all(diag)
+        self.assertEqual(string.split(got, '\n')[:-1], map(data, range(count)))
+        self.assertEqual(self.read_lines(lcd, count), map(data, range(count)))
+        self.check_log()
+
+if (__name__ == '__main__'):
+    unittest.main()